@@ -1,12 +1,21 @@
-#!/usr/local/bin/python3 
-from iPortfolio_client import *
-import iPortfolio_client as ip_client
-from iPortfolio_util import Util
-import inspect
+#!/usr/local/bin/python3
 import sys
+import inspect
+import argparse
+from iPortfolio_logger import Logger
+
+# The modules of the stages (pandas, matplotlib, yfinance...) are imported by the subcommands that run them,
+# parsing the arguments, `delete` and `misses` start without them (benchmark/bench_import.py)
+
+# The flags of the previous command line, still accepted in place of the subcommands
+LEGACY_COMMANDS = {"-d": "daily", "--ytd": "ytd", "--delete": "delete", "--del": "delete", "--misses": "misses"}
 
-def daily_dashboard_and_line():
-    Util.log_to_file(__file__, inspect.currentframe().f_lineno, "INFO", "Executing daily_dashboard_and_line")
+def log(category, message):
+    Logger.get_instance().log(category, message, file=__file__, line=inspect.currentframe().f_back.f_lineno)
+
+def daily_dashboard_and_line(args):
+    import iPortfolio_client as ip_client
+    log("INFO", "Executing daily_dashboard_and_line")
     print("Welcome to Portfolio Manager")
     print("Start processing daily dashboard and line chart")
     '''Load Transactions from CSV'''
@@ -18,8 +27,9 @@ def daily_dashboard_and_line():
     '''Plot line Chart'''
     ip_client.plot_line_chart()
 
-def historical_ytd():
-    Util.log_to_file(__file__, inspect.currentframe().f_lineno, "INFO", "Executing historical_ytd")
+def historical_ytd(args):
+    import iPortfolio_client as ip_client
+    log("INFO", "Executing historical_ytd")
     print("Welcome to Portfolio Manager")
     print("Start processing historical YTD")
     '''Load Transactions from CSV'''
@@ -28,37 +38,82 @@ def historical_ytd():
     ip_client.view_database()
     ip_client.plot_historical_line_chart()
 
-def delete_record(date):
-    Util.log_to_file(__file__, inspect.currentframe().f_lineno, "INFO", "Executing clear_record")
+def delete_record(args):
+    import iPortfolio_client as ip_client
+    log("INFO", f"Executing clear_record, deleting record for date: {args.date}")
     print("Welcome to Portfolio Manager")
     print("Start processing clear record")
-    ip_client.delete_daily_prices(date)
+    ip_client.delete_daily_prices(args.date)
     ip_client.view_database()
 
-def main():
-    if len(sys.argv) > 1:
-        arg = sys.argv[1]
-        if arg == "-d":
-            Util.log_to_file(__file__, inspect.currentframe().f_lineno, "INFO", "Argument '-d' received")
-            daily_dashboard_and_line()
-        elif arg == "--ytd":
-            Util.log_to_file(__file__, inspect.currentframe().f_lineno, "INFO", "Argument '--ytd' received")
-            historical_ytd()
-        elif arg == "--delete" or arg == "--del":
-            Util.log_to_file(__file__, inspect.currentframe().f_lineno, "INFO", "Argument '--delete' received")
-            date = sys.argv[2] if len(sys.argv) > 2 else None
-            if date:
-                Util.log_to_file(__file__, inspect.currentframe().f_lineno, "INFO", f"Deleting record for date: {date}")
-                delete_record(date)
-            else:
-                Util.log_to_file(__file__, inspect.currentframe().f_lineno, "ERROR", "No date provided for deletion")
-                print("No date provided for deletion. Use '--delete <date>' or '--del <date>'.")
-        else:
-            Util.log_to_file(__file__, inspect.currentframe().f_lineno, "ERROR", f"Invalid argument: {arg}")
-            print("Invalid argument. Use '-d' or '--ytd'.")
+def price_misses(args):
+    import iPortfolio_client as ip_client
+    log("INFO", "Executing price_misses")
+    if args.action == "clear":
+        ip_client.clear_price_misses(args.ticker)
+    elif args.action == "clear-expired":
+        ip_client.clear_price_misses(expired_only=True)
     else:
-        Util.log_to_file(__file__, inspect.currentframe().f_lineno, "ERROR", "No argument provided")
-        print("No argument provided. Use '-d' or '--ytd'.")
+        ip_client.list_price_misses()
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="app.py", description="Portfolio Manager",
+                                     epilog="The previous flags still work: -d, --ytd, --delete/--del <date>, --misses ...")
+    # Stripped from anywhere in the arguments by main(), declared here for the help
+    parser.add_argument("--perf", action="store_true",
+                        help="time the stages, count SQL statements and downloads, save a report under results/perf/")
+    commands = parser.add_subparsers(dest="command", metavar="command")
+
+    daily = commands.add_parser("daily", help="load the transactions, export the database, dashboard and line charts (-d)")
+    daily.set_defaults(func=daily_dashboard_and_line)
+
+    ytd = commands.add_parser("ytd", help="load the transactions, export the database, historical YTD charts (--ytd)")
+    ytd.set_defaults(func=historical_ytd)
+
+    delete = commands.add_parser("delete", aliases=["del"], help="delete the daily prices of a date (--delete)")
+    delete.add_argument("date", help="YYYY-MM-DD")
+    delete.set_defaults(func=delete_record)
+
+    misses = commands.add_parser("misses", help="list or clear the recorded price misses (--misses)")
+    misses.add_argument("action", nargs="?", default="list", choices=["list", "clear", "clear-expired"])
+    misses.add_argument("ticker", nargs="?", help="with clear: only the misses of this ticker")
+    misses.set_defaults(func=price_misses)
+    return parser
+
+def main(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    perf = "--perf" in argv
+    if perf:
+        log("INFO", "Argument '--perf' received")
+        argv = [arg for arg in argv if arg != "--perf"]
+    if argv and argv[0] in LEGACY_COMMANDS:
+        argv[0] = LEGACY_COMMANDS[argv[0]]
+
+    parser = build_parser()
+    try:
+        args = parser.parse_args(argv)
+    except SystemExit as e:
+        if e.code:
+            log("ERROR", f"Invalid arguments: {argv}")
+        raise
+    if args.command is None:
+        log("ERROR", "No argument provided")
+        parser.print_help()
+        return
+    log("INFO", f"Command '{args.command}' received")
+
+    if perf:
+        from iPortfolio_perf import Perf
+        Perf.enable()
+    try:
+        args.func(args)
+    finally:
+        if perf:
+            Perf.report()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    try:
+        main()
+    finally:
+        from iPortfolio_dbConnection import DbConnection
+        DbConnection.close_all()
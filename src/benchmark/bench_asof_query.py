@@ -0,0 +1,84 @@
+"""
+As-of query benchmark for the schema migrations.
+
+Builds a synthetic database with the version 1 schema ((date, ticker) primary keys), times the
+`WHERE ticker = ? AND date <= ? ORDER BY date DESC LIMIT 1` lookups used by DbAccessor, then upgrades
+it in place to the ticker-first covering indexes and to WITHOUT ROWID tables and times them again.
+
+Usage: python benchmark/bench_asof_query.py [--tickers 200] [--days 1500] [--queries 20000] [--density 0.02]
+"""
+import os
+import sys
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from iPortfolio_dbMigration import DbMigrator, MIGRATIONS
+
+QUERIES = {
+    "stock_data": "SELECT cost_basis, total_quantity FROM stock_data WHERE ticker = ? AND date <= ? ORDER BY date DESC LIMIT 1",
+    "realized_gains": "SELECT gain FROM realized_gains WHERE ticker = ? AND date <= ? ORDER BY date DESC LIMIT 1",
+    "daily_prices": "SELECT price FROM daily_prices WHERE ticker = ? AND date <= ? ORDER BY date DESC LIMIT 1",
+}
+
+def build_database(path, tickers, days, density):
+    conn = sqlite3.connect(path)
+    with conn:
+        MIGRATIONS[0][2](conn)  # version 1 schema only
+    start = date(2020, 1, 1)
+    dates = [(start + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(days)]
+    names = [f"T{i:04d}" for i in range(tickers)]
+    with conn:
+        for day in dates:
+            # positions only change on the days a ticker is traded, prices exist every day
+            traded = [t for t in names if random.random() < density]
+            conn.executemany("INSERT INTO stock_data VALUES (?, ?, ?, ?)", [(day, t, random.random() * 100, random.random() * 10) for t in traded])
+            conn.executemany("INSERT INTO realized_gains VALUES (?, ?, ?)", [(day, t, random.random()) for t in traded])
+            conn.executemany("INSERT INTO daily_prices VALUES (?, ?, ?)", [(day, t, random.random() * 100) for t in names])
+    return conn, names, dates
+
+def time_queries(conn, lookups):
+    result = {}
+    for table, query in QUERIES.items():
+        start = time.perf_counter()
+        for ticker, day in lookups:
+            conn.execute(query, (ticker, day)).fetchone()
+        result[table] = time.perf_counter() - start
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="As-of query benchmark")
+    parser.add_argument("--tickers", type=int, default=200)
+    parser.add_argument("--days", type=int, default=1500)
+    parser.add_argument("--queries", type=int, default=20000)
+    parser.add_argument("--density", type=float, default=0.02, help="share of days a ticker is traded")
+    args = parser.parse_args()
+
+    random.seed(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"Building {args.tickers} tickers x {args.days} days...")
+        conn, names, dates = build_database(os.path.join(tmp, "bench.db"), args.tickers, args.days, args.density)
+        lookups = [(random.choice(names), random.choice(dates)) for _ in range(args.queries)]
+
+        stages = [("version 1 (date, ticker)", None),
+                  ("covering (ticker, date) indexes", lambda: DbMigrator(conn).upgrade()),
+                  ("WITHOUT ROWID (ticker, date)", lambda: DbMigrator(conn).upgrade(without_rowid=True))]
+        baseline = None
+        for name, upgrade in stages:
+            if upgrade:
+                start = time.perf_counter()
+                upgrade()
+                print(f"  upgrade took {time.perf_counter() - start:.2f}s")
+            timings = time_queries(conn, lookups)
+            total = sum(timings.values())
+            baseline = baseline or total
+            detail = ", ".join(f"{table} {seconds * 1e6 / args.queries:.1f}us" for table, seconds in timings.items())
+            print(f"{name:<34} {total:7.3f}s  x{baseline / total:6.1f}  ({detail} per query)")
+        conn.close()
+
+if __name__ == "__main__":
+    main()
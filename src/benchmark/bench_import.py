@@ -0,0 +1,140 @@
+"""
+Cold start of every app.py subcommand.
+
+Generates a small synthetic portfolio (benchmark/synthetic.py), then runs each subcommand in a fresh interpreter
+with `python -X importtime`, the prices served by LocalPriceProvider (no network). Reports, per subcommand:
+- imports_ms: time spent importing modules once the command line starts (median of --repeat runs)
+- seconds: wall time of the process
+- heavy: which of pandas, matplotlib, yfinance, pandas_market_calendars got imported
+
+Guard: the light subcommands (help, argument errors, delete, misses) must not import any heavy module and their
+imports must stay under --max-share of the imports of `daily`. The exit code is 1 when the guard fails.
+
+Usage: python benchmark/bench_import.py [--repeat 3] [--max-share 0.5] [--output bench_import.json]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import statistics
+import tempfile
+import subprocess
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.abspath(os.path.join(BENCHMARK_DIR, ".."))
+sys.path.insert(0, BENCHMARK_DIR)
+from synthetic import generate
+
+HEAVY = ("pandas", "matplotlib", "yfinance", "pandas_market_calendars")
+
+# name: (arguments, light)
+CASES = {
+    "help": (["--help"], True),
+    "invalid": (["--bogus"], True),
+    "misses": (["misses"], True),
+    "delete": (["delete", "1999-01-01"], True),
+    "ytd": (["ytd"], False),
+    "daily": (["daily"], False),
+}
+
+MARKER = "-- app.py --"
+
+# Runs app.py as its __main__ block does, the prices from the synthetic fixtures; the marker separates the
+# interpreter start-up from the imports of the command line
+RUNNER = f"""
+import sys
+sys.stderr.write("{MARKER}\\n")
+sys.stderr.flush()
+import iPortfolio_priceProvider as provider
+provider.set_price_provider(provider.LocalPriceProvider("input_prices/"))
+import app
+try:
+    app.main(sys.argv[1:])
+finally:
+    from iPortfolio_dbConnection import DbConnection
+    DbConnection.close_all()
+"""
+
+def parse_importtime(stderr):
+    """
+    Sum the top-level imports after the marker of one `-X importtime` run.
+
+    Returns:
+    - (float, set): milliseconds, names of every module imported
+    """
+    lines = stderr.splitlines()
+    if MARKER in lines:
+        lines = lines[lines.index(MARKER) + 1:]
+    micros, modules = 0, set()
+    for line in lines:
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        modules.add(name.strip())
+        if not name[1:].startswith(" "):
+            micros += int(cumulative)
+    return micros / 1000, modules
+
+def run_case(root, arguments):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([root, SRC_DIR, os.environ.get("PYTHONPATH", "")]),
+               MPLBACKEND="Agg")
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", RUNNER] + arguments,
+                            cwd=root, env=env, capture_output=True, text=True)
+    seconds = time.perf_counter() - start
+    milliseconds, modules = parse_importtime(result.stderr)
+    return result.returncode, seconds, milliseconds, modules
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold start of every app.py subcommand")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max-share", type=float, default=0.5,
+                        help="imports of a light subcommand / imports of daily, at most")
+    parser.add_argument("--output", default="bench_import.json")
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="iportfolio_import_")
+    try:
+        generate(root, tickers=5, years=1, trades_per_day=0.5, splits=1)
+        for path in ("results/dashboard/", "results/dbviewer/"):
+            os.makedirs(os.path.join(root, path), exist_ok=True)
+
+        report = {}
+        for name, (arguments, light) in CASES.items():
+            runs = [run_case(root, arguments) for _ in range(args.repeat)]
+            report[name] = {"arguments": arguments,
+                            "light": light,
+                            "returncode": runs[-1][0],
+                            "imports_ms": round(statistics.median(run[2] for run in runs), 1),
+                            "seconds": round(statistics.median(run[1] for run in runs), 3),
+                            "heavy": sorted(module for module in HEAVY if module in runs[-1][3])}
+            entry = report[name]
+            print(f"{name:<8} {' '.join(arguments):<22} imports {entry['imports_ms']:>8.1f} ms  "
+                  f"wall {entry['seconds']:>6.3f}s  exit {entry['returncode']}  heavy: {', '.join(entry['heavy']) or '-'}")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results saved to {args.output}")
+
+    failures = []
+    budget = report["daily"]["imports_ms"] * args.max_share
+    for name, entry in report.items():
+        if not entry["light"]:
+            continue
+        if entry["heavy"]:
+            failures.append(f"{name} imports {', '.join(entry['heavy'])}")
+        if entry["imports_ms"] > budget:
+            failures.append(f"{name} imports take {entry['imports_ms']} ms, over {budget:.1f} ms "
+                            f"({args.max_share:.0%} of daily)")
+    for failure in failures:
+        print(f"FAILED: {failure}")
+    if failures:
+        sys.exit(1)
+    print("Cold start guard passed")
+
+if __name__ == "__main__":
+    main()
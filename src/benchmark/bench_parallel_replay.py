@@ -0,0 +1,76 @@
+"""
+Serial vs parallel replay of a full transaction reload.
+
+Generates a synthetic portfolio (benchmark/synthetic.py), stages its transactions once per run, then times
+DbPopulator.populate_transaction_db (transactions insert, replay into stock_data / realized_gains, commit)
+with each number of workers, on a fresh database every time. Every parallel run is checked against the
+serial one: same transactions (in rowid order), stock_data and realized_gains.
+
+Usage: python benchmark/bench_parallel_replay.py [--tickers 300] [--years 10] [--trades-per-day 60] [--workers 1,2,4]
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARK_DIR, ".."))
+sys.path.insert(0, BENCHMARK_DIR)
+from synthetic import generate
+
+def run(workers, db_name, folders):
+    from iPortfolio_dbPopulator import DbPopulator
+    from iPortfolio_dbConnection import DbConnection
+    from iPortfolio_splitIndex import SplitIndex
+
+    populator = DbPopulator(db_name)
+    with populator.conn:
+        SplitIndex.store(populator.conn, SplitIndex.read_csv(populator.stock_split_path))
+        populator._reset_staging()
+        for folder in folders:
+            populator.load_transactions_from_folder(folder)
+        populator._flush_staging()
+
+    start = time.perf_counter()
+    populator.populate_transaction_db(max_workers=workers)
+    seconds = time.perf_counter() - start
+
+    conn = DbConnection.get_connection(db_name)
+    result = (conn.execute("SELECT date, ticker, source, cost, quantity, cost_basis FROM transactions ORDER BY rowid").fetchall(),
+              sorted(conn.execute("SELECT date, ticker, cost_basis, total_quantity FROM stock_data").fetchall()),
+              sorted(conn.execute("SELECT date, ticker, gain FROM realized_gains").fetchall()))
+    return seconds, result
+
+def main():
+    parser = argparse.ArgumentParser(description="Serial vs parallel replay of a full reload")
+    parser.add_argument("--tickers", type=int, default=300)
+    parser.add_argument("--years", type=int, default=10)
+    parser.add_argument("--trades-per-day", type=float, default=60)
+    parser.add_argument("--workers", default="1,2,4", help="comma separated, 0 for the number of CPUs")
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="iportfolio_replay_")
+    try:
+        generated = generate(root, tickers=args.tickers, years=args.years, trades_per_day=args.trades_per_day)
+        print(f"{generated['trades']} transactions, {generated['tickers']} tickers, {os.cpu_count()} CPUs")
+        os.chdir(root)
+        sys.path.insert(0, root)  # the synthetic const_private
+        from const import TRANSACTIONS_PATH
+        from const_private import TRANSACTIONS_CATS
+        folders = [TRANSACTIONS_PATH + cat + "/" for cat in TRANSACTIONS_CATS]
+
+        serial = None
+        for workers in [int(w) for w in args.workers.split(",")]:
+            seconds, result = run(workers or None, f"replay_{workers}.db", folders)
+            if serial is None:
+                serial = (seconds, result)
+            label = "serial" if workers == 1 else f"{workers or os.cpu_count()} workers"
+            print(f"{label:<12} {seconds:8.3f}s  {serial[0] / seconds:5.2f}x  "
+                  f"{len(result[1])} stock_data rows  identical: {result == serial[1]}")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+End-to-end pipeline benchmark on synthetic portfolios.
+
+For every size, generates a portfolio with benchmark/synthetic.py in a temporary directory, then runs the
+pipeline in a fresh process (no cache or connection left over from the previous size) with the prices
+served by LocalPriceProvider, no network. Every stage reports:
+- seconds: wall time
+- peak_mb: peak Python memory (tracemalloc) during the stage, skipped with --no-memory since tracemalloc slows
+  the stage down
+- sql: statements executed by SQLite (trace callback on every DbConnection)
+- downloads: calls to the price provider
+
+Usage: python benchmark/bench_pipeline.py [--sizes small,medium] [--output bench_pipeline.json] [--no-memory]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+import tracemalloc
+from datetime import datetime
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(BENCHMARK_DIR, "..")
+sys.path.insert(0, BENCHMARK_DIR)
+from synthetic import generate
+
+SIZES = {
+    "small": {"tickers": 10, "years": 2, "trades_per_day": 0.5, "splits": 1},
+    "medium": {"tickers": 50, "years": 5, "trades_per_day": 2, "splits": 3},
+    "large": {"tickers": 200, "years": 10, "trades_per_day": 8, "splits": 10},
+}
+
+class Counters:
+    sql = 0
+    downloads = 0
+
+def _instrument(root):
+    """
+    Serve the prices from the synthetic fixtures and count SQL statements and provider calls.
+    """
+    from iPortfolio_dbConnection import DbConnection
+    from iPortfolio_priceProvider import LocalPriceProvider, set_price_provider
+
+    open_connection = DbConnection._open
+
+    def _open(db_name):
+        conn = open_connection(db_name)
+        conn.set_trace_callback(lambda _: setattr(Counters, "sql", Counters.sql + 1))
+        return conn
+    DbConnection._open = staticmethod(_open)
+
+    provider = LocalPriceProvider(os.path.join(root, "input_prices/"))
+    download = provider.download
+
+    def _download(tickers, start_date, end_date):
+        Counters.downloads += 1
+        return download(tickers, start_date, end_date)
+    provider.download = _download
+    set_price_provider(provider)
+
+def _stages():
+    import iPortfolio_client as client
+    from iPortfolio_dashboard import AssetDashboard
+    from iPortfolio_plotter import Plotter
+    from iPortfolio_renderer import Renderer
+    from iPortfolio_util import Util
+    from iPortfolio_valuationCube import ValuationCube
+    from const import OUTPUT_DASHBOARD_PATH
+
+    today = Util.get_today_est_str()
+
+    def charts():
+        pt = Plotter()
+        end_date = datetime.strptime(today, "%Y-%m-%d")
+        Renderer.render([pt.line_chart_job(f"{OUTPUT_DASHBOARD_PATH}bench_{time_str}.png", end_date, time_period, time_str)
+                         for time_str, time_period in (("1M", 30), ("1Y", 365), ("YTD", "YTD"))], max_workers=1)
+
+    return [
+        ("load_transactions", client.load_transactions),
+        ("valuation_cube", ValuationCube.ensure_fresh),
+        ("dashboard", lambda: AssetDashboard().calculate_ror(today)),
+        ("charts", charts),
+        ("view_database", client.view_database),
+        ("load_transactions_unchanged", client.load_transactions),
+    ]
+
+def run_stages(root, memory=True) -> dict:
+    """
+    Run the pipeline on the portfolio in root, the current directory must be root.
+    """
+    _instrument(root)
+    from iPortfolio_dbConnection import DbConnection
+    from const import OUTPUT_DASHBOARD_PATH, DBVIEWER_PATH, DB_NAME
+    for path in (OUTPUT_DASHBOARD_PATH, DBVIEWER_PATH):
+        os.makedirs(path, exist_ok=True)
+
+    results = {}
+    for name, stage in _stages():
+        sql, downloads = Counters.sql, Counters.downloads
+        if memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        stage()
+        seconds = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] if memory else None
+        tracemalloc.stop()
+        results[name] = {"seconds": round(seconds, 4),
+                         "peak_mb": None if peak is None else round(peak / 2 ** 20, 2),
+                         "sql": Counters.sql - sql,
+                         "downloads": Counters.downloads - downloads}
+
+    db_conn = DbConnection.get_connection(DB_NAME)
+    tables = ["transactions", "stock_data", "realized_gains", "daily_prices"]
+    rows = {table: db_conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in tables}
+    DbConnection.close_all()
+    return {"stages": results, "rows": rows, "db_mb": round(os.path.getsize(DB_NAME) / 2 ** 20, 2)}
+
+def bench_size(name, params, memory, keep):
+    root = tempfile.mkdtemp(prefix=f"iportfolio_bench_{name}_")
+    generated = generate(root, **params)
+    print(f"[{name}] {generated['trades']} trades, {generated['tickers']} tickers in {root}")
+
+    # A fresh interpreter per size: caches, connections and the migrations start cold every time
+    command = [sys.executable, os.path.abspath(__file__), "--run", root] + ([] if memory else ["--no-memory"])
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([root, os.path.abspath(SRC_DIR), os.environ.get("PYTHONPATH", "")]),
+               MPLBACKEND="Agg")
+    result = subprocess.run(command, cwd=root, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"[{name}] pipeline failed:\n{result.stdout[-2000:]}\n{result.stderr[-4000:]}")
+    stats = json.loads(result.stdout.strip().splitlines()[-1])
+
+    if not keep:
+        import shutil
+        shutil.rmtree(root, ignore_errors=True)
+    for stage, stage_stats in stats["stages"].items():
+        print(f"[{name}] {stage:<28} {stage_stats['seconds']:>9.3f}s  peak {stage_stats['peak_mb']} MB  "
+              f"sql {stage_stats['sql']:>8}  downloads {stage_stats['downloads']}")
+    return {"params": params, "generated": generated, **stats}
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline on synthetic portfolios")
+    parser.add_argument("--sizes", default="small,medium", help=f"comma separated, from {list(SIZES)}")
+    parser.add_argument("--output", default="bench_pipeline.json")
+    parser.add_argument("--no-memory", action="store_true", help="skip tracemalloc, for cleaner timings")
+    parser.add_argument("--keep", action="store_true", help="keep the generated portfolios")
+    parser.add_argument("--run", help=argparse.SUPPRESS)  # child process: run the stages in this directory
+    args = parser.parse_args()
+
+    if args.run:
+        stats = run_stages(args.run, memory=not args.no_memory)
+        print(json.dumps(stats))
+        return
+
+    report = {"created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+              "python": platform.python_version(),
+              "platform": platform.platform(),
+              "memory_traced": not args.no_memory,
+              "sizes": {}}
+    for name in args.sizes.split(","):
+        report["sizes"][name] = bench_size(name, SIZES[name], not args.no_memory, args.keep)
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Deterministic synthetic portfolio for the benchmarks.
+
+Writes, under root:
+    input_transactions/
+      - exchange1/STK001.csv ...   (date,ticker,cost,quantity)
+      - crypto/CRX001-USD.csv ...
+      - cash/cash.csv
+      - stock_split.csv
+    input_prices/STK001.csv ...    (Date,Close, served by LocalPriceProvider, no network)
+    const_private.py               (TRANSACTIONS_CATS, STOCK_TICKERS, CRYPTO_TICKERS, CATEGORIES of the synthetic tickers)
+
+Usage: python benchmark/synthetic.py <root> [--tickers 20] [--years 3] [--trades-per-day 1] [--splits 2] [--no-dividends]
+"""
+import os
+import random
+import argparse
+from datetime import date, timedelta
+
+def _price_history(rng, start, end, crypto):
+    """
+    Geometric random walk of daily closes, business days only for stocks.
+    """
+    prices = {}
+    price = rng.uniform(20, 400)
+    day = start
+    while day <= end:
+        if crypto or day.weekday() < 5:
+            price *= 1 + rng.gauss(0.0003, 0.02)
+            prices[day] = round(max(price, 0.5), 4)
+        day += timedelta(days=1)
+    return prices
+
+def _price_on(prices, day):
+    while day not in prices:
+        day -= timedelta(days=1)
+    return prices[day]
+
+def generate(root, tickers=20, years=3, trades_per_day=1.0, splits=2, dividends=True, exchanges=2,
+             crypto_share=0.25, end_date=None, seed=0):
+    """
+    Generate a synthetic portfolio, the same arguments always give the same files.
+
+    Parameters:
+    - tickers (int): number of tickers, crypto_share of them are crypto
+    - years (int): years of history ending at end_date (default today)
+    - trades_per_day (float): expected number of trades per calendar day over the whole portfolio
+    - splits (int): number of stock splits
+    - dividends (bool): pay dividends on stocks
+    - exchanges (int): stock exchange folders, a ticker may trade on several of them
+
+    Returns:
+    - dict: counts of the generated data
+    """
+    rng = random.Random(seed)
+    end = end_date or date.today()
+    start = end - timedelta(days=365 * years)
+
+    crypto_count = int(tickers * crypto_share)
+    stock_tickers = [f"STK{i:03d}" for i in range(1, tickers - crypto_count + 1)]
+    crypto_tickers = [f"CRX{i:03d}-USD" for i in range(1, crypto_count + 1)]
+    exchange_names = [f"exchange{i}" for i in range(1, exchanges + 1)]
+
+    prices = {ticker: _price_history(rng, start - timedelta(days=30), end, ticker in crypto_tickers)
+              for ticker in stock_tickers + crypto_tickers}
+    os.makedirs(os.path.join(root, "input_prices"), exist_ok=True)
+    for ticker, history in prices.items():
+        with open(os.path.join(root, "input_prices", f"{ticker}.csv"), "w") as f:
+            f.write("Date,Close\n")
+            f.writelines(f"{day},{price}\n" for day, price in history.items())
+
+    # One row per (date, ticker) at most: the files of a ticker in several folders are merged into one source,
+    # so merged rows are always valid transactions
+    rows = {}  # (folder, ticker): [(date, ticker, cost, quantity)]
+    holdings = {ticker: 0.0 for ticker in prices}
+    trade_count = 0
+    day = start
+    while day < end:
+        traded = set()
+        for _ in range(int(trades_per_day) + (rng.random() < trades_per_day % 1)):
+            ticker = rng.choice(stock_tickers + crypto_tickers)
+            crypto = ticker in crypto_tickers
+            folder = "crypto" if crypto else rng.choice(exchange_names)
+            if ticker in traded:
+                continue
+            traded.add(ticker)
+            price = _price_on(prices[ticker], day)
+            held = holdings[ticker]
+            kind = rng.random()
+            if held <= 0.2 or kind < 0.55:
+                quantity = round(rng.uniform(0.5, 20), 4)
+                row = (day, ticker, round(quantity * price, 2), quantity)
+            elif kind < 0.8:
+                quantity = round(rng.uniform(0.1, held), 4)
+                row = (day, ticker, -round(quantity * price, 2), -quantity)
+            elif kind < 0.9 and dividends and not crypto:
+                row = (day, ticker, -round(rng.uniform(1, 50), 2), 0)
+            elif kind < 0.95 or not crypto:
+                row = (day, ticker, round(rng.uniform(1, 5), 2), 0)
+            else:
+                row = (day, ticker, 0, -0.01)
+            holdings[ticker] += row[3]
+            rows.setdefault((folder, ticker), []).append(row)
+            trade_count += 1
+        day += timedelta(days=1)
+
+    for folder in exchange_names + ["crypto", "cash"]:
+        os.makedirs(os.path.join(root, "input_transactions", folder), exist_ok=True)
+    for (folder, ticker), ticker_rows in rows.items():
+        with open(os.path.join(root, "input_transactions", folder, f"{ticker}.csv"), "w") as f:
+            f.writelines(f"{d},{t},{cost},{quantity}\n" for d, t, cost, quantity in ticker_rows)
+
+    with open(os.path.join(root, "input_transactions", "stock_split.csv"), "w") as f:
+        for ticker in rng.sample(stock_tickers, min(splits, len(stock_tickers))):
+            split_date = start + timedelta(days=rng.randint(30, 365 * years - 30))
+            f.write(f"{split_date},{ticker},1,{rng.choice([2, 3, 4])}\n")
+
+    with open(os.path.join(root, "input_transactions", "cash", "cash.csv"), "w") as f:
+        day = start
+        while day <= end:
+            f.write(f"{day},cash,{round(rng.uniform(1000, 50000), 2)},1\n")
+            day += timedelta(days=30)
+
+    with open(os.path.join(root, "const_private.py"), "w") as f:
+        f.write("# Synthetic portfolio generated by benchmark/synthetic.py\n")
+        f.write(f"TRANSACTIONS_CATS = {exchange_names + ['crypto']!r}\n")
+        f.write(f"STOCK_TICKERS = {stock_tickers!r}\n")
+        f.write(f"CRYPTO_TICKERS = {crypto_tickers!r}\n")
+        f.write("CATEGORIES = {\"Cash\": [\"Cash\"], \"Other\": [\"Other\"], "
+                f"\"Stock\": STOCK_TICKERS, \"Crypto\": CRYPTO_TICKERS}}\n")
+
+    return {"tickers": len(prices), "transaction_files": len(rows), "trades": trade_count,
+            "price_rows": sum(len(history) for history in prices.values())}
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic portfolio")
+    parser.add_argument("root")
+    parser.add_argument("--tickers", type=int, default=20)
+    parser.add_argument("--years", type=int, default=3)
+    parser.add_argument("--trades-per-day", type=float, default=1.0)
+    parser.add_argument("--splits", type=int, default=2)
+    parser.add_argument("--no-dividends", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    print(generate(args.root, tickers=args.tickers, years=args.years, trades_per_day=args.trades_per_day,
+                   splits=args.splits, dividends=not args.no_dividends, seed=args.seed))
+
+if __name__ == "__main__":
+    main()
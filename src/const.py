@@ -2,6 +2,57 @@
 TRANSACTIONS_PATH = "input_transactions/"
 CASH_PATH = f"{TRANSACTIONS_PATH}cash/cash.csv"
 
+# database
+DB_NAME = "portfolio.db"
+DB_CACHED_STATEMENTS = 256
+DB_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": 268435456,  # 256MB
+    "temp_store": "MEMORY",
+}
+# rebuild stock_data, realized_gains and daily_prices as WITHOUT ROWID tables keyed by (ticker, date)
+DB_WITHOUT_ROWID = False
+
+# transaction CSV rows merged in memory before spilling them to the staging table, and per replay batch
+TRANSACTION_CHUNK_ROWS = 10000
+# processes replaying the tickers of a full reload, 1 to replay in this process, None for the number of CPUs
+# each worker adds about 0.2s of start-up and result copying, so parallel replay pays off only with several CPUs and a reload of hundreds of thousands of transactions (see bench_parallel_replay.py)
+REPLAY_WORKERS = 1
+
+# price provider: "yahoo" or "local" (read fixtures from PRICE_FIXTURE_PATH, no network)
+PRICE_PROVIDER = "yahoo"
+PRICE_FIXTURE_PATH = "input_prices/"
+
+# async fetch pipeline: concurrent downloads, timeout per download (seconds), retries with exponential backoff
+FETCH_MAX_CONCURRENCY = 4
+FETCH_TIMEOUT = 30
+FETCH_RETRIES = 3
+FETCH_BACKOFF_BASE = 1.0
+FETCH_BACKOFF_MAX = 16.0
+
+# negative price cache: how long a missing price is remembered before asking the provider again, in hours
+PRICE_MISS_TTL_HOURS = {
+    "no_data": 24 * 30,   # nothing in a range that ended more than 7 days ago (delisted, before listing)
+    "no_recent_data": 1,  # nothing within the last 7 days, the price may still show up
+    "fetch_error": 1,     # the download failed after all the retries
+}
+
+# in-process price cache: live prices (today) expire after the TTL, in seconds
+PRICE_CACHE_MAX_ENTRIES = 100000
+PRICE_CACHE_LIVE_TTL = 300
+
+# trading calendar
+TRADING_CALENDAR_PATH = "cache/trading_calendar/"
+# memory-mapped dates × tickers arrays of prices and positions, one directory per database
+VALUATION_CUBE_PATH = "cache/valuation_cube/"
+# rows allocated past the last day of the cube, filled one day at a time before a rebuild is needed
+VALUATION_CUBE_SPARE_DAYS = 366
+# closures missing from pandas_market_calendars
+MARKET_CLOSED_DATES = {
+    "NYSE": ["2025-01-09"],
+}
+
 # output data
 OUTPUT_PATH = "results/"
 OUTPUT_DASHBOARD_PATH = f"{OUTPUT_PATH}dashboard/"
@@ -11,9 +62,20 @@ ROR_SUMMARY_TABLE_PATH = f"{ROR_TABLE_PATH}ror_summary_table/"
 CHART_PATH = f"{OUTPUT_PATH}plot_line_chart/"
 DBVIEWER_PATH = f"{OUTPUT_PATH}dbviewer/"
 TICKER_CHART_PATH = f"{OUTPUT_PATH}plot_ticker_line_chart/"
+# performance reports of the runs with --perf
+PERF_PATH = f"{OUTPUT_PATH}perf/"
+
+# logging: JSON lines written by a background thread, rotated by size
+LOG_FILE = "logs/application.log"
+LOG_LEVEL = "INFO"           # DEBUG, INFO, WARNING or ERROR
+LOG_MAX_BYTES = 10 * 2 ** 20
+LOG_BACKUP_COUNT = 5
+LOG_QUEUE_SIZE = 10000       # records waiting for the writer, below ERROR the extra ones are dropped
 
 # plotter
 NUM_OF_PLOT = 22
+# processes rendering PNGs, None for the number of CPUs
+RENDER_WORKERS = None
 
 # date match
 DATES = {
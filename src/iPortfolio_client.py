@@ -1,25 +1,19 @@
-from iPortfolio_dbPopulator import DbPopulator
-from iPortfolio_dbViewer import DatabaseViewer
-from iPortfolio_plotter import Plotter
-from iPortfolio_dashboard import AssetDashboard
-from iPortfolio_util import PortfolioDisplayerUtil, Util
-from iPortfolio_dbAccessor import DbAccessor
+# Every stage imports what it needs: pandas, matplotlib, yfinance and the market calendars load only with the
+# stages that use them, so `app.py delete` or `app.py misses` start without them
 from const import *
 from const_private import *
 from datetime import datetime
 
-def load_transactions():
-    clear_table()
+def load_transactions(full=False):
+    from iPortfolio_dbPopulator import DbPopulator
     print(f"{title_line} Loading transactions... {title_line}")
     db_loader = DbPopulator()
-    for cat in TRANSACTIONS_CATS:
-        db_loader.load_transactions_from_folder(TRANSACTIONS_PATH + cat + "/")
-    db_loader.load_daily_cash_from_csv(CASH_PATH)
-    db_loader.populate_transaction_db()
+    db_loader.sync_transactions([TRANSACTIONS_PATH + cat + "/" for cat in TRANSACTIONS_CATS], CASH_PATH, full=full)
     db_loader.verify_table_size()
     db_loader.close()
 
 def view_database():
+    from iPortfolio_dbViewer import DatabaseViewer
     print(f"{title_line} Saving database to CSV... {title_line}")
     viewer = DatabaseViewer()
     viewer.save_transactions_to_csv(f"{DBVIEWER_PATH}transactions.csv")
@@ -30,6 +24,7 @@ def view_database():
     viewer.close()
 
 def clear_table():
+    from iPortfolio_dbPopulator import DbPopulator
     print(f"{title_line} Clearing tables... {title_line}")
     db_loader = DbPopulator()
     db_loader.clear_table("transactions")
@@ -38,8 +33,11 @@ def clear_table():
     db_loader.clear_table("realized_gains")
 
 def plot_line_chart():
+    from iPortfolio_plotter import Plotter
+    from iPortfolio_renderer import Renderer
     print(f"{title_line} Plotting line chart... {title_line}")
     pt = Plotter()
+    jobs = []
     for date_str, (date_num, date_unit) in DATES.items():
         if date_str in ("1M", "3M", "YTD"):
             path = OUTPUT_DASHBOARD_PATH
@@ -48,9 +46,10 @@ def plot_line_chart():
             path = CHART_PATH
             continue
         print(f"Plotting line chart for {date_str}...")
-        pt.plot_line_chart_ends_at_today(file_name= f"{path}portfolio_line_chart_{date_unit}_{date_str}.png", 
-                                        time_period=date_num, 
-                                        time_str=date_str)
+        jobs.append(pt.line_chart_ends_at_today_job(file_name= f"{path}portfolio_line_chart_{date_unit}_{date_str}.png", 
+                                                    time_period=date_num, 
+                                                    time_str=date_str))
+    Renderer.render(jobs)
 
 def display_historical_portfolio_ror():
     print(f"{title_line} Displaying historical portfolio ror... {title_line}")
@@ -58,37 +57,62 @@ def display_historical_portfolio_ror():
     display_portfolio_ror(dates)
 
 def plot_historical_line_chart():
+    from iPortfolio_plotter import Plotter
+    from iPortfolio_renderer import Renderer
     print(f"{title_line} Plotting historical line chart... {title_line}")
     pt = Plotter()
     dates = ["2023-12-31", "2022-12-31", "2021-12-31", "2024-12-31"]
+    jobs = []
     for date in dates:
         date_dt = datetime.strptime(date, "%Y-%m-%d")
         date_num, date_str = "YTD", "YTD"
-        pt.plot_line_chart(file_name=f"{OUTPUT_DASHBOARD_PATH}portfolio_line_chart_{date}_{date_str}.png",
-                                        end_date=date_dt,
-                                        time_period=date_num,
-                                        time_str=date_str)  
+        jobs.append(pt.line_chart_job(file_name=f"{OUTPUT_DASHBOARD_PATH}portfolio_line_chart_{date}_{date_str}.png",
+                                      end_date=date_dt,
+                                      time_period=date_num,
+                                      time_str=date_str))
+    Renderer.render(jobs)
     
 def plot_ticker_line_chart():
+    from iPortfolio_plotter import Plotter
+    from iPortfolio_renderer import Renderer
     print(f"{title_line} Plotting ticker line chart... {title_line}")
     pt = Plotter()
     ticker = [STOCK_TICKERS[0], CRYPTO_TICKERS[0], CRYPTO_TICKERS[1], CRYPTO_TICKERS[2]]
     dates = ["1M", "3M", "6M"]
+    jobs = []
     for ticker in ticker:
         for date_str in dates:
             if DIYSWITCH == True and ticker == CRYPTO_TICKERS[2] and date_str != "1M":
                 continue
             print(f"Plotting line chart for {ticker} {date_str}")
             date_num, date_unit = DATES[date_str]
-            pt.plot_ticker_line_chart(file_name=f"{TICKER_CHART_PATH}{ticker}_{date_unit}_{date_str}.png",
-                                    ticker=ticker,
-                                    time_period=date_num,
-                                    time_str=date_str)
+            jobs.append(pt.ticker_line_chart_job(file_name=f"{TICKER_CHART_PATH}{ticker}_{date_unit}_{date_str}.png",
+                                                 ticker=ticker,
+                                                 time_period=date_num,
+                                                 time_str=date_str))
+    Renderer.render(jobs)
 
 def delete_daily_prices(date):
+    from iPortfolio_dbAccessor import DbAccessor
     print(f"{title_line} Clearing daily prices... {title_line}")
     DbAccessor.delete_daily_price(date)
 
+def list_price_misses(include_expired=True):
+    from iPortfolio_negativeCache import NegativeCache
+    from tabulate import tabulate
+    print(f"{title_line} Listing price misses... {title_line}")
+    rows = NegativeCache.list_entries(include_expired=include_expired)
+    if not rows:
+        print("No price misses recorded.")
+        return
+    print(tabulate(rows, headers=["Ticker", "Start Date", "End Date", "Reason", "Expires At"], tablefmt='pretty'))
+
+def clear_price_misses(ticker=None, expired_only=False):
+    from iPortfolio_negativeCache import NegativeCache
+    print(f"{title_line} Clearing price misses... {title_line}")
+    count = NegativeCache.clear(ticker=ticker, expired_only=expired_only)
+    print(f"Deleted {count} price misses{f' for {ticker}' if ticker else ''}.")
+
 # def display_portfolio_ror_util(yyyy_mm_dd):
 #     if not yyyy_mm_dd:
 #         print(f"Invalid date: {yyyy_mm_dd}")
@@ -114,6 +138,9 @@ def delete_daily_prices(date):
 #     pd.close()
 
 def display_portfolio_ror_latest():
+    from iPortfolio_dashboard import AssetDashboard
+    from iPortfolio_util import Util
+    from iPortfolio_renderer import Renderer, RenderJob, TABLE_JOB
     print(f"{title_line} Displaying today's portfolio ror... {title_line}")
     asset_dashboard = AssetDashboard()
     path = OUTPUT_DASHBOARD_PATH
@@ -123,24 +150,17 @@ def display_portfolio_ror_latest():
     ror_df, summary_df, cat_df, compare_df = asset_dashboard.calculate_ror(today)
 
     hour, minute, second = time.split(":")
-    print(f"Generating rate of return chart for {yyyy}-{mm}-{dd}...")
-    asset_dashboard.save_df_as_png(ori_df = ror_df, 
-                      filename=path + "9999-99-99_Total.png",
-                      title=f"Portfolio Rate of Return {yyyy}-{mm}-{dd} {hour}:{minute}:{second}")
-    print(f"Generating portfolio summary for {yyyy}-{mm}-{dd}...")
-    asset_dashboard.save_df_as_png(ori_df = summary_df, 
-                        filename=path + f"9999-99-99_Summary.png",
-                        title=f"Portfolio Summary {yyyy}-{mm}-{dd} {hour}:{minute}:{second}")
-
-    print(f"Generating category summary for {yyyy}-{mm}-{dd}...")
-    asset_dashboard.save_df_as_png(ori_df = cat_df, 
-                        filename=path + f"9999-99-99_Category.png",
-                        title=f"Portfolio Category {yyyy}-{mm}-{dd} {hour}:{minute}:{second}")
-    
-    print(f"Generating compare summary for {yyyy}-{mm}-{dd}...")
-    asset_dashboard.save_df_as_png(ori_df = compare_df, 
-                        filename=path + f"9999-99-99_Compare.png",
-                        title=f"Portfolio Compare {yyyy}-{mm}-{dd} {hour}:{minute}:{second}")
+    print(f"Generating rate of return, summary, category and compare charts for {yyyy}-{mm}-{dd}...")
+    Renderer.render([
+        RenderJob(TABLE_JOB, ror_df, path + "9999-99-99_Total.png",
+                  f"Portfolio Rate of Return {yyyy}-{mm}-{dd} {hour}:{minute}:{second}"),
+        RenderJob(TABLE_JOB, summary_df, path + f"9999-99-99_Summary.png",
+                  f"Portfolio Summary {yyyy}-{mm}-{dd} {hour}:{minute}:{second}"),
+        RenderJob(TABLE_JOB, cat_df, path + f"9999-99-99_Category.png",
+                  f"Portfolio Category {yyyy}-{mm}-{dd} {hour}:{minute}:{second}"),
+        RenderJob(TABLE_JOB, compare_df, path + f"9999-99-99_Compare.png",
+                  f"Portfolio Compare {yyyy}-{mm}-{dd} {hour}:{minute}:{second}"),
+    ])
 
 # def display_ticker_ror():
 #     print("{title_line} Displaying ticker ror... {title_line}")
@@ -148,6 +168,8 @@ def display_portfolio_ror_latest():
 #     ror_plotter.plot_all_tickers()
 
 def test():
+    from iPortfolio_dbViewer import DatabaseViewer
+    from iPortfolio_util import PortfolioDisplayerUtil
     dbv = DatabaseViewer()
     pdu = PortfolioDisplayerUtil()
     pdu.clear_daily_prices(date="2024-12-16", before=False)
@@ -1,6 +1,9 @@
 from iPortfolio_dbAccessor import DbAccessor
+from iPortfolio_valuationCube import ValuationCube
+from iPortfolio_returns import ReturnsEngine
 from datetime import datetime
 from iPortfolio_util import Util
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import inspect
@@ -9,8 +12,22 @@ FILE_NAME = __file__
 
 class AssetDashboard:
     
-    def _calc_annualized_return(self, ticker, start_date, end_date):
-        pass
+    def _calc_annualized_return(self, data: list, date: str) -> list:
+        """
+        XIRR (money-weighted, annualized) and TWR (time-weighted, since the first transaction) of every ticker
+        and of the total row, solved together by ReturnsEngine from the transactions up to date and the
+        cube values on their days. The values on date are the ones of the rows, the cash is left out.
+        """
+        ValuationCube.ensure_fresh()
+        ticker_rows = [row for row in data if row["Ticker"] not in ("Cash", "Total (w/o Cash)")]
+        total_rows = [row for row in data if row["Ticker"] == "Total (w/o Cash)"]
+        final_values = [row["Total Value"] or 0 for row in ticker_rows]
+        xirr, twr = ReturnsEngine.money_and_time_weighted([row["Ticker"] for row in ticker_rows], final_values,
+                                                          sum(final_values), date)
+        for row, row_xirr, row_twr in zip(ticker_rows + total_rows, xirr, twr):
+            row["XIRR (%)"] = round(float(row_xirr), 2) if np.isfinite(row_xirr) else None
+            row["TWR (%)"] = round(float(row_twr), 2) if np.isfinite(row_twr) else None
+        return data
 
     def _default_row_schema(self):
         return {
@@ -37,14 +54,17 @@ class AssetDashboard:
             "Portfolio (%)": None,
             "First Date": None,
             "Last Date": None,
-            "Annualized RoR (%)": None
+            "Annualized RoR (%)": None,
+            "XIRR (%)": None,
+            "TWR (%)": None
         }
 
     def _date_stockprice_and_profit(self, ticker: str, date: str):
+        positions = ValuationCube.get_instance()
         stock_price = DbAccessor.fetch_and_store_price(ticker, date)
-        quantity = DbAccessor.get_stock_quantity(ticker, date)
-        realized_gain = DbAccessor.get_realized_gain(ticker, date)
-        cost_basis = DbAccessor.get_cost_basis(ticker, date)
+        quantity = positions.get_stock_quantity(ticker, date)
+        realized_gain = positions.get_realized_gain(ticker, date)
+        cost_basis = positions.get_cost_basis(ticker, date)
         cost = quantity * cost_basis
         holding_value = quantity * stock_price if stock_price else 0
         unrealized_gain = holding_value - cost
@@ -61,9 +81,10 @@ class AssetDashboard:
         return stock_price, profit
 
     def _calc_ror_helper(self, ticker: str, date: str) -> dict:
-        quantity = DbAccessor.get_stock_quantity(ticker, date)
-        cost_basis = DbAccessor.get_cost_basis(ticker, date)
-        realized_gain = DbAccessor.get_realized_gain(ticker, date)
+        positions = ValuationCube.get_instance()
+        quantity = positions.get_stock_quantity(ticker, date)
+        cost_basis = positions.get_cost_basis(ticker, date)
+        realized_gain = positions.get_realized_gain(ticker, date)
 
         if quantity == 0:
             '''
@@ -99,10 +120,7 @@ class AssetDashboard:
         profit = unrealized_gain + realized_gain
         ror = (profit / cost) * 100 if cost > 0 else None
 
-        first_date, last_date = DbAccessor.get_start_end_date(ticker)
-        duration_years = max((datetime.strptime(last_date, "%Y-%m-%d") \
-                                      - datetime.strptime(first_date, "%Y-%m-%d")).days / 365.25, 1)
-        annualized_return = ((holding_value / cost) ** (1 / duration_years) - 1) * 100
+        first_date, last_date = positions.get_start_end_date(ticker)
 
         # get row
         row = self._default_row_schema()
@@ -129,10 +147,26 @@ class AssetDashboard:
         row["Portfolio (%)"] = None
         row["First Date"] = first_date
         row["Last Date"] = last_date
-        row["Annualized RoR (%)"] = round(annualized_return, 2) if annualized_return else None
+        # Annualized RoR (%) is filled for every ticker at once by _populate_annualized_return
 
         return row
 
+    def _populate_annualized_return(self, data: list, date: str) -> list:
+        """
+        Annualized RoR of every held ticker in one pass, over the days it was actually held up to date
+        (the held days of the valuation cube), floored at one year.
+        """
+        held = [row for row in data if row["Total Holding"] is not None]
+        if not held:
+            return data
+        held_days = ValuationCube.get_instance().get_held_days([row["Ticker"] for row in held], date)
+        annualized_returns = ReturnsEngine.annualized_returns([row["Total Value"] for row in held],
+                                                              [row["Total Cost"] for row in held],
+                                                              held_days)
+        for row, annualized_return in zip(held, annualized_returns):
+            row["Annualized RoR (%)"] = round(float(annualized_return), 2) if annualized_return and not np.isnan(annualized_return) else None
+        return data
+
     def _calc_cash_helper(self, date: str) -> dict:
         cash = DbAccessor.get_cash_balance_on_date(date)
         row = self._default_row_schema()
@@ -209,7 +243,9 @@ class AssetDashboard:
                         "Portfolio (%)",
                         "First Date",
                         "Last Date",
-                        "Annualized RoR (%)"]]      
+                        "Annualized RoR (%)",
+                        "XIRR (%)",
+                        "TWR (%)"]]      
         return total_df     
 
     def _populate_summary_df(self, df: pd.DataFrame) -> pd.DataFrame:
@@ -220,7 +256,9 @@ class AssetDashboard:
                         "Total Cost",
                         "Total Profit",
                         "Rate of Return (%)",
-                        "Annualized RoR (%)"]]           
+                        "Annualized RoR (%)",
+                        "XIRR (%)",
+                        "TWR (%)"]]           
         other_df = summary_df[(summary_df["Total Cost"] == 0) & (summary_df["Total Value"] == 0)]
         if not other_df.empty:
             other_row = other_df.sum(numeric_only=True).round(2)
@@ -228,6 +266,8 @@ class AssetDashboard:
             other_row["Rate of Return (%)"] = None
             other_row["Portfolio (%)"] = None
             other_row["Annualized RoR (%)"] = None
+            other_row["XIRR (%)"] = None
+            other_row["TWR (%)"] = None
             summary_df = summary_df[(summary_df["Total Cost"] != 0) | (summary_df["Total Value"] != 0)]
             other_row_df = pd.DataFrame([other_row]).dropna(axis=1, how='all')  # 排除所有空或全为 NA 的列
             summary_df = pd.concat([summary_df, other_row_df], ignore_index=True)
@@ -325,13 +365,31 @@ class AssetDashboard:
         return compare_df
 
 
+    def _lookback_dates(self, date: str) -> list:
+        year = int(date.split("-")[0])
+        return [date] + [Util.get_date_before(date, days) for days in (1, 2, 7, 30)] + [f'{year}-01-01']
+
+    def _prefetch_prices(self, tickers: list, date: str):
+        """
+        Fetch every price _calc_ror_helper needs (today and the 1d/2d/7d/30d/YTD lookbacks of each held ticker)
+        up front with one batched lookup, so the rows are computed from a warm cache.
+        """
+        positions = ValuationCube.get_instance()
+        lookback_dates = self._lookback_dates(date)
+        ticker_dates = {ticker: lookback_dates for ticker in tickers
+                        if positions.get_stock_quantity(ticker, date) != 0}
+        DbAccessor.bulk_fetch_and_store_prices(ticker_dates)
+
     def calculate_ror(self, date):
         tickers = DbAccessor.get_all_tickers()
         data = []
 
+        self._prefetch_prices(tickers, date)
+
         # Iterate through each ticker and calculate the rate of return
         for ticker in tickers:
             data.append(self._calc_ror_helper(ticker, date))
+        data = self._populate_annualized_return(data, date)
         
         # add cash 
         data.append(self._calc_cash_helper(date))
@@ -342,6 +400,9 @@ class AssetDashboard:
         # Populate portfolio percentage
         data = self._populate_portfolio_percentage(data)
 
+        # Money-weighted and time-weighted returns, every ticker and the total at once
+        data = self._calc_annualized_return(data, date)
+
         #========== Convert into dataframe
         # Populate total dataframe
         df = self._convert_data_to_df(data)
@@ -1,38 +1,40 @@
-import sqlite3
+from iPortfolio_dbConnection import DbConnection
 from const import *
 from iPortfolio_util import Util
 from const_private import *
 from datetime import datetime, timedelta
-import yfinance as yf
+from iPortfolio_fetchPipeline import FetchPipeline, FetchError
+from iPortfolio_negativeCache import NegativeCache, FETCH_ERROR
+from iPortfolio_priceCache import PriceCache
+from iPortfolio_valuationCube import ValuationCube
 import inspect
-
-TEMP_PRICE_MAP = {}
+import bisect
 
 class DbAccessor:
     @staticmethod
     def get_all_tickers():
-        with sqlite3.connect("portfolio.db") as db_conn:
+        with DbConnection.get_connection() as db_conn:
             query = "SELECT DISTINCT ticker FROM stock_data"
             result = db_conn.execute(query).fetchall()
             return [row[0] for row in result]
     
     @staticmethod
     def get_stock_quantity(ticker, date):
-        with sqlite3.connect("portfolio.db") as db_conn:
+        with DbConnection.get_connection() as db_conn:
             query = "SELECT total_quantity FROM stock_data WHERE ticker = ? AND date <= ? ORDER BY date DESC LIMIT 1"
             result = db_conn.execute(query, (ticker, date)).fetchone()
             return result[0] if result else 0
         
     @staticmethod
     def get_cost_basis(ticker, date):
-        with sqlite3.connect("portfolio.db") as db_conn:
+        with DbConnection.get_connection() as db_conn:
             query = "SELECT cost_basis FROM stock_data WHERE ticker = ? AND date <= ? ORDER BY date DESC LIMIT 1"
             result = db_conn.execute(query, (ticker, date)).fetchone()
             return result[0] if result else 0
     
     @staticmethod
     def get_start_end_date(ticker):
-        with sqlite3.connect("portfolio.db") as db_conn:
+        with DbConnection.get_connection() as db_conn:
             date_range = db_conn.execute("""
                 SELECT MIN(date), MAX(date) FROM stock_data WHERE ticker = ?
             """, (ticker,)).fetchone()
@@ -45,128 +47,208 @@ class DbAccessor:
             return first_date, last_date
     
     @staticmethod
-    def _save_price_to_db(db_conn, date, ticker, last_valid_price, last_valid_date):
+    def _download_price_history(tickers, start_date, end_date):
         """
-        If it's crypto, only save price if today > date, otherwise price will fetch on the fly 
-        If it's not crypto, check if it's market open.
-            if market is close, means this date will NOT have price data, 
-                then just save the last open date, price to db
-            if market is open, means this date will HAVE price data. So the data must be saved after close.
-                The price data on last 7 days will be fetched,
-                and the lastest price will be today's price if today is already closed, 
-                otherwise the last open date price will be saved.
+        Download the daily close prices of all tickers between start_date and end_date with one request.
+        [start_date, end_date), start_date is included, end_date is excluded
+
+        Returns:
+        - dict: {ticker: [(date, price), ...]} sorted by date, an empty list if there is no data for the ticker
         """
-        if ticker in CRYPTO_TICKERS:
-            # if it's crypto, only save price if today > date, otherwise price will fetch on the fly
-            today = Util.get_today_est_str()
-            if today > date:
-                db_conn.execute("INSERT OR REPLACE INTO daily_prices (date, ticker, price) VALUES (?, ?, ?)",
-                                (date, ticker, last_valid_price))
-            else:
-                # update the TEMP_PRICE_MAP
-                if date not in TEMP_PRICE_MAP:
-                    TEMP_PRICE_MAP[date] = {}
-                TEMP_PRICE_MAP[date][ticker] = last_valid_price
-        else:
-            is_market_open = Util.is_market_open(date)
-            if is_market_open == False:
-                # if market is close and ticker is not crypto, this date will NOT have price data,
-                # We will use the last_valid_price
-                db_conn.execute("INSERT OR REPLACE INTO daily_prices (date, ticker, price) VALUES (?, ?, ?)",
-                                (date, ticker, last_valid_price))
+        tickers = sorted(set(tickers))
+        history_map = {ticker: [] for ticker in tickers}
+
+        close = FetchPipeline.get_instance().download(tickers, start_date, end_date)
+        for ticker in tickers:
+            if ticker not in close.columns:
+                continue
+            price_series = close[ticker].dropna()
+            history_map[ticker] = [(index.strftime("%Y-%m-%d"), round(float(price), 8))
+                                   for index, price in price_series.items()]
+        return history_map
+
+    @staticmethod
+    def _store_price_history(db_conn, history_map):
+        """
+        Save every trading day of the downloaded history into daily_prices with a single executemany.
+        The price of today is never saved, because the market (or the crypto day) is not closed yet,
+        it will be fetched on the fly and kept in PriceCache (with a TTL) instead.
+        Only new or changed prices are written, and they are copied into the valuation cube.
+        """
+        today = Util.get_today_est_str()
+        rows = []
+        for ticker, history in history_map.items():
+            history = [(date, price) for date, price in history if date < today]
+            if not history:
+                continue
+            stored = dict(db_conn.execute("SELECT date, price FROM daily_prices WHERE ticker = ? AND date BETWEEN ? AND ?",
+                                          (ticker, history[0][0], history[-1][0])).fetchall())
+            changed = [(date, ticker, price) for date, price in history if stored.get(date) != price]
+            rows += changed
+        if not rows:
+            return 0
+
+        with db_conn:
+            db_conn.executemany("INSERT OR REPLACE INTO daily_prices (date, ticker, price) VALUES (?, ?, ?)", rows)
+        stored = {}
+        for date, ticker, price in rows:
+            stored.setdefault(ticker, {})[date] = price
+        ValuationCube.update_prices(stored)
+        return len(rows)
+
+    @staticmethod
+    def _resolve_price(history, history_dates, date):
+        """
+        Get the last valid price on or before date, the same as the last row of a 7-day download window.
+        Return None if there is no price within the 7 days before date.
+        """
+        earliest_date = Util.get_date_before(date, 7)
+        index = bisect.bisect_right(history_dates, date) - 1
+        if index < 0 or history_dates[index] < earliest_date:
+            return None
+        return history[index][1]
+
+    @staticmethod
+    def _fetch_and_store_prices_helper(db_conn, ticker_dates: dict) -> dict:
+        """
+        Get the prices of multiple (ticker, date) pairs.
+        Prices are looked up in PriceCache and daily_prices first, dates known to have no price (NegativeCache)
+        are skipped, all the other misses are downloaded with one request covering
+        [earliest missing date - 7 days, latest missing date]. The dates still without a price are recorded
+        in NegativeCache. A closed day before today (weekend, holiday) gets the last price before it stored
+        under its own date, as a trading day does, so the next run finds it in daily_prices.
+
+        Parameters:
+        - ticker_dates (dict): {ticker: [date, ...]}
+
+        Returns:
+        - dict: {ticker: {date: price}}, price is None if it can't be found
+        """
+        cache = PriceCache.get_instance()
+        prices = {ticker: {} for ticker in ticker_dates}
+        missing = {}
+        for ticker, dates in ticker_dates.items():
+            if not dates:
+                continue
+            # Load the stored prices of the whole span at once
+            stored = dict(db_conn.execute("SELECT date, price FROM daily_prices WHERE ticker = ? AND date BETWEEN ? AND ?",
+                                          (ticker, min(dates), max(dates))).fetchall())
+            for date in dates:
+                # To avoid get on-the-fly price multiple times
+                cached_price = cache.get(ticker, date)
+                if cached_price is not None:
+                    prices[ticker][date] = cached_price
+                elif date in stored:
+                    prices[ticker][date] = stored[date]
+                else:
+                    missing.setdefault(ticker, set()).add(date)
+
+        # Skip the dates the provider is known to have no price for
+        for ticker, known_misses in NegativeCache.lookup(db_conn, missing).items():
+            for date in known_misses:
+                prices[ticker][date] = None
+            missing[ticker] -= known_misses.keys()
+        missing = {ticker: dates for ticker, dates in missing.items() if dates}
+        if not missing:
+            ValuationCube.update_prices(prices)
+            return prices
+
+        missing_dates = set().union(*missing.values())
+        start_date = Util.get_date_before(min(missing_dates), 7)
+        end_date = Util.get_date_before(max(missing_dates), -1)
+        try:
+            print(f"Fetching price for {', '.join(sorted(missing))} from {start_date} to {max(missing_dates)}...")
+            history_map = DbAccessor._download_price_history(missing.keys(), start_date, end_date)
+            DbAccessor._store_price_history(db_conn, history_map)
+        except Exception as e:
+            Util.log(f"Error fetching price for {sorted(missing)} from {start_date} to {end_date}: {e}")
+            history_map = {}
+            # Only a download that failed after the retries is remembered, not an unexpected error
+            if isinstance(e, FetchError):
+                NegativeCache.record(db_conn, [(ticker, min(dates), max(dates), FETCH_ERROR) for ticker, dates in missing.items()])
+
+        today = Util.get_today_est_str()
+        new_misses, closed_day_rows = [], []
+        for ticker, dates in missing.items():
+            history = history_map.get(ticker, [])
+            history_dates = [row_date for row_date, _ in history]
+            stored_dates = set(history_dates)
+            no_price_dates = []
+            for date in dates:
+                price = DbAccessor._resolve_price(history, history_dates, date)
+                prices[ticker][date] = price
+                if price is None:
+                    Util.log(f"No price data found for {ticker} on {date}")
+                    no_price_dates.append(date)
+                    continue
+                cache.put(ticker, date, price)
+                # A trading day missing from the history isn't stored, its price may still come
+                if date < today and date not in stored_dates and (ticker in CRYPTO_TICKERS or not Util.is_market_open(date)):
+                    closed_day_rows.append((date, ticker, price))
+
+            # ticker not in history_map: the download failed, handled above
+            if ticker not in history_map or not no_price_dates:
+                continue
+            if not history:
+                # Nothing at all in the window, e.g. a delisted ticker: one range for all the dates
+                new_misses.append((ticker, min(no_price_dates), max(no_price_dates), NegativeCache.reason_for(max(no_price_dates))))
             else:
-                # if market is open, save the last valid price to last valid date
-                if date not in TEMP_PRICE_MAP:
-                    TEMP_PRICE_MAP[date] = {}
-                TEMP_PRICE_MAP[date][ticker] = last_valid_price
-                db_conn.execute("INSERT OR REPLACE INTO daily_prices (date, ticker, price) VALUES (?, ?, ?)",
-                                (last_valid_date, ticker, last_valid_price))
+                new_misses.extend((ticker, date, date, NegativeCache.reason_for(date)) for date in no_price_dates)
+        NegativeCache.record(db_conn, new_misses)
+        db_conn.executemany("INSERT OR REPLACE INTO daily_prices (date, ticker, price) VALUES (?, ?, ?)", closed_day_rows)
+        # The resolved prices of non-trading days and today are kept by the cube too
+        ValuationCube.update_prices(prices)
+
+        return prices
 
     @staticmethod
     def _fetch_and_store_price_helper(db_conn, ticker, date):
-        # if  date is in TEMP_PRICE_MAP, return the price
-        # To avoid get on-the-fly price multiple times
-        if date in TEMP_PRICE_MAP:
-            if ticker in TEMP_PRICE_MAP[date]:
-                return TEMP_PRICE_MAP[date][ticker]
-        
-        query = "SELECT price FROM daily_prices WHERE ticker = ? AND date = ?"
-        result = db_conn.execute(query, (ticker, date)).fetchone()
-        if result:
-            return result[0]
-        
-        try:
-            print(f"Fetching price for {ticker} on {date}...")
-            date_obj = datetime.strptime(date, "%Y-%m-%d")
-            start_date = (date_obj - timedelta(days=7)).strftime("%Y-%m-%d")
-            end_date = (date_obj + timedelta(days=1)).strftime("%Y-%m-%d")
-
-            # yf.download [start_date, end_date), start_date is included, end_date is excluded
-            # https://ranaroussi.github.io/yfinance/reference/api/yfinance.download.html#yfinance.download
-            history = yf.download(ticker, start=start_date, end=end_date)
-
-            # TODO: 对于crypto来说，如果是latest price, 需要不同的workflow
-            #  比如现在是5/08，得到
-            # Price              Close          High           Low          Open       Volume
-            # Ticker           BTC-USD       BTC-USD       BTC-USD       BTC-USD      BTC-USD
-            # Date                                                                           
-            # 2025-05-01  96492.335938  97437.960938  94153.632812  94212.859375  32875889623
-            # 2025-05-02  96910.070312  97905.898438  96375.945312  96494.968750  26421924677
-            # 2025-05-03  95891.796875  96943.882812  95821.289062  96904.632812  15775154889
-            # 2025-05-04  94315.976562  96318.921875  94173.429688  95877.187500  18198688416
-            # 2025-05-05  94748.054688  95193.187500  93566.265625  94319.562500  25816260327
-            # 2025-05-06  96802.476562  96889.179688  93399.859375  94748.382812  26551275827
-            # 2025-05-08  99306.484375  99386.750000  96940.203125  97037.687500  47684251648
-            # 这里应该用05/08的close price
-
-            # Util.log_to_file(__file__, inspect.currentframe().f_lineno, "INFO", f"Price data fetched for {ticker} on {date}: \n{history}")
-            # exit(0)
-            if history.empty:
-                raise ValueError(f"No price data found for {ticker} on {date}")
-
-            # Get the last valid price and date
-            price_series = history['Close']
-            last_valid_price = list(round(price_series.iloc[-1], 8))[0]
-            last_valid_date = price_series.index[-1].strftime("%Y-%m-%d")
-
-            is_market_open = Util.is_market_open(date)
-            today = Util.get_today_est_str()
-            if ticker in CRYPTO_TICKERS or (ticker not in CRYPTO_TICKERS and is_market_open == True):
-                # if it's crypto, only save price if today > date, otherwise price will fetch on the fly
-                # if market is close, means this date will NOT have price data, 
-                # then just save the last open date, price to db
-                if today > date:
-                    DbAccessor._save_price_to_db(db_conn, date, ticker, last_valid_price, last_valid_date)
-
-
-            TEMP_PRICE_MAP[date] = TEMP_PRICE_MAP.get(date, {})
-            TEMP_PRICE_MAP[date][ticker] = last_valid_price
-            
-            return last_valid_price
+        prices = DbAccessor._fetch_and_store_prices_helper(db_conn, {ticker: [date]})
+        return prices[ticker][date]
 
-        except Exception as e:
-            Util.log(f"Error fetching price for {ticker} on {date}: {e}")
-            return None
+    @staticmethod
+    def fetch_and_store_price_range(tickers, start_date: str, end_date: str) -> dict:
+        """
+        Download the full history of all tickers between start_date and end_date (both included) with one request,
+        and save every trading day into daily_prices.
 
+        Returns:
+        - dict: {ticker: [(date, price), ...]}
+        """
+        with DbConnection.get_connection() as db_conn:
+            history_map = DbAccessor._download_price_history(tickers, start_date, Util.get_date_before(end_date, -1))
+            DbAccessor._store_price_history(db_conn, history_map)
+            return history_map
+
+    @staticmethod
+    def bulk_fetch_and_store_prices(ticker_dates: dict) -> dict:
+        """
+        Get the prices of many tickers and dates, all the misses are downloaded with one request.
+
+        Parameters:
+        - ticker_dates (dict): {ticker: [date, ...]}
+
+        Returns:
+        - dict: {ticker: {date: price}}, price is None if it can't be found
+        """
+        with DbConnection.get_connection() as db_conn:
+            return DbAccessor._fetch_and_store_prices_helper(db_conn, {ticker: list(dates) for ticker, dates in ticker_dates.items()})
 
     @staticmethod
     def bulk_fetch_and_store_price(ticker, dates: list):
-        with sqlite3.connect("portfolio.db") as db_conn:
-            prices = []
-            for date in dates:
-                price = DbAccessor._fetch_and_store_price_helper(db_conn, ticker, date)
-                prices.append(price)
-            return prices
+        with DbConnection.get_connection() as db_conn:
+            prices = DbAccessor._fetch_and_store_prices_helper(db_conn, {ticker: list(dates)})
+            return [prices[ticker][date] for date in dates]
         
     @staticmethod
     def fetch_and_store_price(ticker, date: str):
-        with sqlite3.connect("portfolio.db") as db_conn:
+        with DbConnection.get_connection() as db_conn:
             price = DbAccessor._fetch_and_store_price_helper(db_conn, ticker, date)
             return price
         
     @staticmethod
     def get_cash_balance():
-        with sqlite3.connect("portfolio.db") as db_conn:
+        with DbConnection.get_connection() as db_conn:
             cash_balance = db_conn.execute("""
                 SELECT ROUND(cash_balance, 2) 
                 FROM daily_cash 
@@ -176,7 +258,7 @@ class DbAccessor:
     
     @staticmethod
     def get_cash_balance_on_date(date):
-        with sqlite3.connect("portfolio.db") as db_conn:
+        with DbConnection.get_connection() as db_conn:
             cash_balance = db_conn.execute("""
                 SELECT cash_balance
                 FROM daily_cash 
@@ -187,7 +269,7 @@ class DbAccessor:
 
     @staticmethod
     def get_realized_gain(ticker, date):
-        with sqlite3.connect("portfolio.db") as db_conn:
+        with DbConnection.get_connection() as db_conn:
             # Get the realized gain for the ticker on or before the date
             query = """
                 SELECT gain FROM realized_gains 
@@ -201,8 +283,10 @@ class DbAccessor:
 
     @staticmethod
     def delete_daily_price(date):
-        with sqlite3.connect("portfolio.db") as db_conn:
+        with DbConnection.get_connection() as db_conn:
             x = db_conn.execute("DELETE FROM daily_prices WHERE date = ?", (date,))
+            PriceCache.get_instance().invalidate(date=date)
+            ValuationCube.clear_prices(date)
             if x.rowcount == 0:
                 print(f"No daily prices found for date: {date}")
             else:
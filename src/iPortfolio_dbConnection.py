@@ -0,0 +1,62 @@
+import sqlite3
+import threading
+import atexit
+from const import DB_NAME, DB_PRAGMAS, DB_CACHED_STATEMENTS
+from iPortfolio_dbMigration import DbMigrator
+
+class DbConnection:
+    """
+    Long-lived SQLite connections shared by DbAccessor, DbPopulator and DatabaseViewer.
+
+    Each thread gets one connection per database, opened on first use and kept until close_all(),
+    so the statement cache of the connection (cached_statements) is reused across calls
+    instead of re-preparing every query on a fresh connection.
+    """
+    _lock = threading.Lock()
+    _connections = {}  # (thread id, db_name): connection
+    _migrated = set()  # db_name upgraded to the latest schema in this process
+
+    @staticmethod
+    def _open(db_name):
+        # check_same_thread=False only allows close_all() to close the connections of other threads,
+        # every connection is still used by the thread that opened it.
+        conn = sqlite3.connect(db_name, cached_statements=DB_CACHED_STATEMENTS, check_same_thread=False)
+        for pragma, value in DB_PRAGMAS.items():
+            conn.execute(f"PRAGMA {pragma} = {value}")
+        return conn
+
+    @staticmethod
+    def get_connection(db_name=DB_NAME) -> sqlite3.Connection:
+        """
+        Get the connection of the current thread, open it if needed.
+        Use `with conn:` around writes to commit them, the connection itself must not be closed by the caller.
+        """
+        key = (threading.get_ident(), db_name)
+        conn = DbConnection._connections.get(key)
+        if conn is None:
+            conn = DbConnection._open(db_name)
+            with DbConnection._lock:
+                DbConnection._connections[key] = conn
+                # Every caller sees the latest schema, readers included
+                if db_name not in DbConnection._migrated:
+                    DbMigrator(conn).upgrade()
+                    DbConnection._migrated.add(db_name)
+        return conn
+
+    @staticmethod
+    def close_all():
+        """
+        Commit and close every connection. Called at the end of a run, and at exit as a fallback.
+        """
+        with DbConnection._lock:
+            connections = list(DbConnection._connections.values())
+            DbConnection._connections.clear()
+
+        for conn in connections:
+            try:
+                conn.commit()
+                conn.close()
+            except sqlite3.Error as e:
+                print(f"Error closing database connection: {e}")
+
+atexit.register(DbConnection.close_all)
@@ -0,0 +1,264 @@
+import time
+import sqlite3
+from const import DB_WITHOUT_ROWID
+
+def _create_base_tables(conn):
+    # Create transactions table
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS transactions (
+            date TEXT,
+            ticker TEXT,
+            source TEXT,
+            cost REAL,
+            quantity REAL,
+            cost_basis REAL,
+            PRIMARY KEY (date, ticker, source)
+        )
+    """)
+
+    # Create daily_cash table
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS daily_cash (
+            date TEXT PRIMARY KEY,
+            cash_balance REAL
+        )
+    """)
+
+    # Create daily_prices table
+    '''
+    Fetch data: read from Yahoo Finance.
+    1. daily_prices: date, ticker, price
+    '''
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS daily_prices (
+            date TEXT,
+            ticker TEXT,
+            price REAL,
+            PRIMARY KEY (date, ticker)
+        )
+    """)
+
+    # Create stock_data table
+    '''
+    Output data: calculate cost_basis, total_quantity and store them.
+    1. stock_data: date, ticker, cost_basis, total_quantity
+    2. gains: date, realized_gain, unrealized_gain
+    '''
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS stock_data (
+            date TEXT,
+            ticker TEXT,
+            cost_basis REAL,
+            total_quantity REAL,
+            PRIMARY KEY (date, ticker)
+        )
+    """)
+
+    # Create realized_gains table
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS realized_gains (
+            date TEXT,
+            ticker TEXT,
+            gain REAL,
+            PRIMARY KEY (date, ticker)
+        )
+    """)
+
+    # Create transaction_files table
+    '''
+    Manifest of the loaded source CSV files, used to re-parse only the changed files.
+    '''
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS transaction_files (
+            path TEXT PRIMARY KEY,
+            content_hash TEXT,
+            mtime REAL
+        )
+    """)
+
+def _add_ticker_date_indexes(conn):
+    '''
+    The hot queries are `WHERE ticker = ? AND date <= ? ORDER BY date DESC LIMIT 1`,
+    the (date, ticker) primary keys can't serve them. These indexes lead with ticker and
+    include the selected columns, so the lookup never touches the table itself.
+    '''
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_stock_data_ticker_date ON stock_data (ticker, date, cost_basis, total_quantity)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_realized_gains_ticker_date ON realized_gains (ticker, date, gain)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_daily_prices_ticker_date ON daily_prices (ticker, date, price)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_transactions_ticker_date ON transactions (ticker, date)")
+
+def _add_price_misses(conn):
+    '''
+    Negative price cache: ranges the provider had no price for, checked before any network fetch.
+    '''
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS price_misses (
+            ticker TEXT,
+            start_date TEXT,
+            end_date TEXT,
+            reason TEXT,
+            expires_at TEXT,
+            PRIMARY KEY (ticker, start_date, end_date)
+        )
+    """)
+
+def _add_transactions_staging(conn):
+    '''
+    Scratch table of DbPopulator: transactions merged by (date, ticker, source) while the CSV files are streamed,
+    seq is the order of the first row of each key. Empty outside of a load.
+    '''
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS transactions_staging (
+            ticker TEXT,
+            date TEXT,
+            source TEXT,
+            cost REAL,
+            quantity REAL,
+            seq INTEGER,
+            PRIMARY KEY (ticker, date, source)
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_transactions_staging_date_seq ON transactions_staging (date, seq)")
+
+def _add_stock_splits(conn):
+    '''
+    Splits of stock_split.csv, read by SplitIndex. Forget the manifest entry of stock_split.csv so that
+    the next load is a full reload, which fills the table.
+    '''
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS stock_splits (
+            ticker TEXT,
+            date TEXT,
+            before_split REAL,
+            after_split REAL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_stock_splits_ticker_date ON stock_splits (ticker, date)")
+    conn.execute("DELETE FROM transaction_files WHERE path LIKE '%stock_split.csv'")
+
+def _add_transactions_seq(conn):
+    '''
+    Merge order of the transactions within a day (DbPopulator.SOURCE_SEQ_SPAN), read by the full and the
+    incremental replays alike. Forget the transaction_files manifest so that the next load is a full reload,
+    which fills it.
+    '''
+    conn.execute("ALTER TABLE transactions ADD COLUMN seq INTEGER")
+    conn.execute("DELETE FROM transaction_files")
+
+# Ordered migration steps: (version, name, function). Append new steps, never edit or reorder applied ones.
+# Version 4 (a materialized portfolio snapshot, withdrawn) is left unused.
+MIGRATIONS = [
+    (1, "base_tables", _create_base_tables),
+    (2, "ticker_date_covering_indexes", _add_ticker_date_indexes),
+    (3, "price_misses", _add_price_misses),
+    (5, "transactions_staging", _add_transactions_staging),
+    (6, "stock_splits", _add_stock_splits),
+    (7, "transactions_seq", _add_transactions_seq),
+]
+
+# Tables that can be rebuilt as WITHOUT ROWID with a (ticker, date) primary key: (table, columns, covering index).
+# The column order is kept, only the order of the primary key changes.
+WITHOUT_ROWID_TABLES = [
+    ("stock_data", "date TEXT, ticker TEXT, cost_basis REAL, total_quantity REAL", "idx_stock_data_ticker_date"),
+    ("realized_gains", "date TEXT, ticker TEXT, gain REAL", "idx_realized_gains_ticker_date"),
+    ("daily_prices", "date TEXT, ticker TEXT, price REAL", "idx_daily_prices_ticker_date"),
+]
+
+class DbMigrator:
+    """
+    Versioned schema upgrades.
+
+    schema_version records every applied step of MIGRATIONS. upgrade() applies the missing steps in order,
+    each one in its own transaction, so an existing portfolio.db is upgraded in place and a new one
+    is created from scratch by the same steps.
+    """
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def _ensure_version_table(self):
+        with self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INTEGER PRIMARY KEY,
+                    name TEXT,
+                    applied_at TEXT
+                )
+            """)
+
+    def current_version(self):
+        self._ensure_version_table()
+        row = self.conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+        return row[0] or 0
+
+    def _run_in_transaction(self, step):
+        # DDL doesn't open a transaction implicitly, begin it explicitly so a failed step leaves nothing behind.
+        # IMMEDIATE takes the write lock first, so two connections can't apply the same step at once.
+        if self.conn.in_transaction:
+            self.conn.commit()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            applied = step()
+            self.conn.commit()
+            return applied
+        except Exception:
+            self.conn.rollback()
+            raise
+
+    def upgrade(self, without_rowid=DB_WITHOUT_ROWID):
+        """
+        Apply the pending migrations, then rebuild the tables as WITHOUT ROWID if requested.
+
+        Returns:
+        - int: the schema version after the upgrade
+        """
+        version = self.current_version()
+        is_new = version == 0 and not self.conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'transactions'").fetchone()
+        for step_version, name, migrate in MIGRATIONS:
+            if step_version <= version:
+                continue
+
+            def step():
+                # another connection may have applied it since current_version()
+                if self.conn.execute("SELECT 1 FROM schema_version WHERE version = ?", (step_version,)).fetchone():
+                    return False
+                migrate(self.conn)
+                self.conn.execute("INSERT INTO schema_version (version, name, applied_at) VALUES (?, ?, ?)",
+                                  (step_version, name, time.strftime("%Y-%m-%d %H:%M:%S")))
+                return True
+
+            if self._run_in_transaction(step) and not is_new:
+                print(f"Upgraded database schema to version {step_version}: {name}")
+            version = step_version
+
+        if without_rowid:
+            self.convert_to_without_rowid()
+        return version
+
+    def _is_without_rowid(self, table):
+        row = self.conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+        return row is not None and "WITHOUT ROWID" in row[0].upper()
+
+    def convert_to_without_rowid(self):
+        """
+        Rebuild stock_data, realized_gains and daily_prices as WITHOUT ROWID tables keyed by (ticker, date).
+        The rows are then stored in ticker-first order and the covering index is no longer needed.
+        Tables that are already converted are skipped.
+        """
+        for table, columns, index in WITHOUT_ROWID_TABLES:
+            if self._is_without_rowid(table):
+                continue
+
+            def step():
+                if self._is_without_rowid(table):
+                    return False
+                column_names = ", ".join(column.split()[0] for column in columns.split(", "))
+                self.conn.execute(f"CREATE TABLE {table}_new ({columns}, PRIMARY KEY (ticker, date)) WITHOUT ROWID")
+                self.conn.execute(f"INSERT INTO {table}_new ({column_names}) SELECT {column_names} FROM {table}")
+                self.conn.execute(f"DROP TABLE {table}")
+                self.conn.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+                self.conn.execute(f"DROP INDEX IF EXISTS {index}")
+                return True
+
+            if self._run_in_transaction(step):
+                print(f"Rebuilt {table} as a WITHOUT ROWID table")
@@ -1,241 +1,122 @@
 import sqlite3
-from const import TRANSACTIONS_PATH
+from const import TRANSACTIONS_PATH, DB_NAME, TRANSACTION_CHUNK_ROWS, REPLAY_WORKERS
+from iPortfolio_dbConnection import DbConnection
+from iPortfolio_positionIndex import PositionIndex
 import csv
 import os
-from enum import Enum
+import hashlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from iPortfolio_replayEngine import ReplayEngine, TRANSACTIONS, replay_partition
+from iPortfolio_splitIndex import SplitIndex
+from iPortfolio_valuationCube import ValuationCube
 
-class TRANSACTIONS(Enum):
-    BUY = "buy"
-    SELL = "sell"
-    DIVIDEND = "dividend"
-    TRANSACTION_FEE = "transaction_fee"
-    CRYPTO_FEE = "crypto_fee"
-    INVALID = "invalid"
+# seq of a merged transaction: rank of its source * SOURCE_SEQ_SPAN + order of its first row within the source
+SOURCE_SEQ_SPAN = 1 << 32
 
 class DbPopulator:
-    def __init__(self, db_name="portfolio.db"):
-        self.conn = sqlite3.connect(db_name)
-        self._create_tables()
-        self.stock_splits = self._load_stock_splits(f'{TRANSACTIONS_PATH}stock_split.csv')
-        self.transactions = {}
-
-    def _create_tables(self):
-        with self.conn:
-
-            # Create transactions table
-            self.conn.execute("""
-                CREATE TABLE IF NOT EXISTS transactions (
-                    date TEXT,
-                    ticker TEXT,
-                    source TEXT,
-                    cost REAL,
-                    quantity REAL,
-                    cost_basis REAL,
-                    PRIMARY KEY (date, ticker, source)
-                )
-            """)
-            
-            # Create daily_cash table
-            self.conn.execute("""
-                CREATE TABLE IF NOT EXISTS daily_cash (
-                    date TEXT PRIMARY KEY,
-                    cash_balance REAL
-                )
-            """)
-
-            # Create daily_prices table
-            '''
-            Fetch data: read from Yahoo Finance.
-            1. daily_prices: date, ticker, price
-            '''
-            self.conn.execute("""
-                CREATE TABLE IF NOT EXISTS daily_prices (
-                    date TEXT,
-                    ticker TEXT,
-                    price REAL,
-                    PRIMARY KEY (date, ticker)
-                )
-            """)
-
-            # Create stock_data table
-            '''
-            Output data: calculate cost_basis, total_quantity and store them.
-            1. stock_data: date, ticker, cost_basis, total_quantity
-            2. gains: date, realized_gain, unrealized_gain
-            '''
-            self.conn.execute("""
-                CREATE TABLE IF NOT EXISTS stock_data (
-                    date TEXT,
-                    ticker TEXT,
-                    cost_basis REAL,
-                    total_quantity REAL,
-                    PRIMARY KEY (date, ticker)
-                )
-            """)
-
-            # Create realized_gains table
-            self.conn.execute("""
-            CREATE TABLE IF NOT EXISTS realized_gains (
-                date TEXT,
-                ticker TEXT,
-                gain REAL,
-                PRIMARY KEY (date, ticker)
-                )
-            """)
+    def __init__(self, db_name=DB_NAME):
+        # DbConnection creates the tables, or upgrades the database to the latest schema, on first use
+        self.conn = DbConnection.get_connection(db_name)
+        self.db_name = db_name
+        # stock_split.csv is read on a full reload only, the splits are served by SplitIndex from the database
+        self.stock_split_path = f'{TRANSACTIONS_PATH}stock_split.csv'
+        self._reset_buffers()
     
-    def _load_stock_splits(self, file_path):
-        stock_splits = {}
-        with open(file_path, newline='') as csvfile:
-            reader = csv.reader(csvfile)
-            for row in reader:
-                date, ticker, before_split, after_split = row
-                if ticker not in stock_splits:
-                    stock_splits[ticker] = []
-                stock_splits[ticker].append((date, float(before_split), float(after_split)))
-        #Util.log(f"Loaded stock splits: {stock_splits}")
-        return stock_splits
-    
-    def _adjust_quantity_for_splits(self, ticker, old_date, new_date, old_quantity, old_cost_basis):
-        if ticker in self.stock_splits:
-            for split_date, before_split, after_split in sorted(self.stock_splits[ticker]):
-                if (old_date == 0 or old_date < split_date) and new_date >= split_date:
-                    #Util.log(f"Adjusting quantity for split: {ticker}, {split_date}, {before_split}, {after_split}")
-                    #Util.log(f"Old quantity: {old_quantity}, old cost basis: {old_cost_basis}, old date: {old_date}, new date: {new_date}")
-                    old_quantity *= (after_split / before_split)
-                    old_cost_basis /= (after_split / before_split)
-
-        return old_quantity, old_cost_basis
-
-    def _validate_transaction(self, cost, quantity):
-        '''
-            Update realized gains if the transaction has a negative value
-            cost > 0, quantity > 0: buy, update cost, quantity, cost_basis
-            cost < 0, quantity < 0: sell, update cost, quantity
-            cost < 0, quantity = 0: dividend, update releaized gain
-            cost > 0, quantity = 0: transaction fee, update cost, cost_basis
-            cost == 0, quantity < 0: crypto fee, update quantity, cost_basis
-
-            ------------------------------------------------------------------------------------------
-                            |  cost > 0                 |  cost < 0    |   cost = 0
-            ------------------------------------------------------------------------------------------
-            quantity > 0     |    buy                   |     X        |    X
-            ------------------------------------------------------------------------------------------
-            quantity = 0     |    fee (paid by money)   |  dividend    |    X
-            ------------------------------------------------------------------------------------------
-            quantity < 0     |     X                    |    sell      |    crpto fee (paid by crypto)
-        '''
-        #Util.log(f"Checking transaction: {cost}, {quantity}")
-        if cost > 0 and quantity > 0: 
-            return TRANSACTIONS.BUY
-        elif cost < 0 and quantity < 0:
-            return TRANSACTIONS.SELL
-        elif cost < 0 and quantity == 0:
-            return TRANSACTIONS.DIVIDEND
-        elif cost > 0 and quantity == 0:
-            return TRANSACTIONS.TRANSACTION_FEE
-        elif cost == 0 and quantity < 0:
-            return TRANSACTIONS.CRYPTO_FEE
-        else:
-            return TRANSACTIONS.INVALID
-
-    def _add_transaction(self, date, ticker, cost, quantity, source):
-        # Since the caller already merge the transactions with same date, ticker and source,
-        # we don't need to check for duplicates here.
-        cost_basis = cost / quantity if quantity != 0 else 0
-        self.conn.execute("""
-            INSERT INTO transactions (date, ticker, source, cost, quantity, cost_basis)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, (date, ticker, source, cost, quantity, cost_basis))
-
-    def _update_stock_data(self, date, ticker, source, tran_cost, tran_quantity):
-        transaction_type = self._validate_transaction(tran_cost, tran_quantity)
-
-        if transaction_type == TRANSACTIONS.INVALID:
-            raise ValueError(f"Invalid transaction: {date}, {ticker}, {source}, {tran_cost}, {tran_quantity}")
-
-        row = self.conn.execute("SELECT cost_basis, total_quantity, date FROM stock_data WHERE ticker = ? AND date <= ? ORDER BY date DESC LIMIT 1",
-                                (ticker, date)).fetchone()
-        
-        cost_basis, quantity, prev_date = 0, 0, 0 # 默认值
-        if row:
-            cost_basis, quantity, prev_date = row
-
-        # Adjust quantity for splits
-        quantity, cost_basis = self._adjust_quantity_for_splits(ticker=ticker, 
-                                                   old_date=prev_date, 
-                                                   new_date=date, 
-                                                   old_quantity=quantity,
-                                                   old_cost_basis=cost_basis)
-        
-        #Util.log(f"Adjusted quantity: {quantity}, cost basis: {cost_basis}")
-
-        if transaction_type == TRANSACTIONS.BUY:
-            # BUY, update total quantity, cost_basis 
-            total_cost = round(cost_basis * quantity + tran_cost, 8)
-            quantity += tran_quantity
-            cost_basis = round(total_cost / quantity, 8) if quantity != 0 else 0
-            #Util.log(f"Process BUY operation. Total cost: {total_cost}, quantity: {quantity}")
-        elif transaction_type == TRANSACTIONS.SELL:
-            # SELL, update quantity 
-            quantity += tran_quantity
-            #Util.log(f"Process SELL operation. Quantity: {quantity}")
-        elif transaction_type == TRANSACTIONS.DIVIDEND:
-            # DIVIDEND, update realized_gain only
-            pass
-        elif transaction_type == TRANSACTIONS.TRANSACTION_FEE:
-            # TRANSACTION FEE, update cost_basis and quantity
-            total_cost = round(cost_basis * quantity + tran_cost, 8)
-            quantity += tran_quantity
-            cost_basis = round(total_cost / quantity, 8) if quantity != 0 else 0
-            #Util.log(f"Process TRANSACTION FEE operation. Total cost: {total_cost}, cost basis: {cost_basis}")
-        elif transaction_type == TRANSACTIONS.CRYPTO_FEE:
-            # CRYPTO FEE, update quantity and cost_basis
-            total_cost = round(cost_basis * quantity + tran_cost, 8)
-            quantity += tran_quantity
-            cost_basis = round(total_cost / quantity, 8) if quantity != 0 else 0
-            #Util.log(f"Process CRYPTO FEE operation. Quantity: {quantity}")
-        else:
-            raise ValueError(f"Invalid transaction: {date}, {ticker}, {tran_cost}, {tran_quantity}")
-        
-        # Update the stock_data tables
-        if quantity < 0.00001:
-            quantity = 0
-
-        self.conn.execute("INSERT OR REPLACE INTO stock_data (date, ticker, cost_basis, total_quantity) VALUES (?, ?, ?, ?)",
-                            (date, ticker, cost_basis, quantity))
-
-    def _update_realized_gains(self, date, ticker, source, tran_cost, tran_quantity):
-        transaction_type = self._validate_transaction(tran_cost, tran_quantity)
-        if transaction_type == TRANSACTIONS.INVALID:
-            raise ValueError(f"Invalid transaction: {date}, {ticker}, {source}, {tran_cost}, {tran_quantity}")
-
-        if transaction_type not in (TRANSACTIONS.SELL, TRANSACTIONS.DIVIDEND):
-            return
-        
-        cost_basis = 0
-        if transaction_type == TRANSACTIONS.SELL:
-            # Fetch the latest cost_basis from stock_data
-            row = self.conn.execute("""
-                SELECT cost_basis FROM stock_data 
-                WHERE ticker = ? AND date <= ? 
-                ORDER BY date DESC LIMIT 1
-            """, (ticker, date)).fetchone()
-            if not row:
-                print("No cost basis found for the stock")
-                return
-            cost_basis = row[0]
-        
-        net_income = abs(tran_cost) - cost_basis * abs(tran_quantity)
-
-        existing = self.conn.execute("""
-            SELECT gain FROM realized_gains WHERE ticker = ? ORDER BY date DESC LIMIT 1
-        """, (ticker,)).fetchone()
-
-        net_income += existing[0] if existing else 0
-        self.conn.execute("""
-            INSERT OR REPLACE INTO realized_gains (date, ticker, gain)
-            VALUES (?, ?, ?)
-        """, (date, ticker, net_income))
+    def _reset_buffers(self):
+        self._buffers = {}           # {ticker: {(date, source): [seq, [cost, ...], [quantity, ...]]}}
+        self._buffered_rows = 0
+        self._staged_tickers = set()
+        self._source_seqs = {}       # {source: last seq}
+        self._source_ranks = {}      # {source: rank}, in the order of the transaction files
+
+    def _reset_staging(self):
+        self.conn.execute("DELETE FROM transactions_staging")
+        self._reset_buffers()
+
+    def _flush_staging(self):
+        """
+        Spill the buffered rows to transactions_staging.
+        A key staged by a previous chunk continues its running sum in the order the rows were read,
+        so the merged cost and quantity are the same as merging every row in memory.
+        """
+        rows = []
+        for ticker, buffer in self._buffers.items():
+            staged = {}
+            if ticker in self._staged_tickers:
+                dates = [date for date, _ in buffer]
+                staged = {(date, source): (cost, quantity) for date, source, cost, quantity in self.conn.execute("""
+                    SELECT date, source, cost, quantity FROM transactions_staging WHERE ticker = ? AND date BETWEEN ? AND ?
+                """, (ticker, min(dates), max(dates))).fetchall()}
+            for (date, source), (seq, costs, quantities) in buffer.items():
+                cost, quantity = staged.get((date, source), (costs[0], quantities[0]))
+                first = 0 if (date, source) in staged else 1
+                for i in range(first, len(costs)):
+                    cost += costs[i]
+                    quantity += quantities[i]
+                rows.append((ticker, date, source, cost, quantity, seq))
+            self._staged_tickers.add(ticker)
+
+        self.conn.executemany("""
+            INSERT INTO transactions_staging (ticker, date, source, cost, quantity, seq) VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (ticker, date, source) DO UPDATE SET cost = excluded.cost, quantity = excluded.quantity
+        """, rows)
+        self._buffers = {}
+        self._buffered_rows = 0
+
+    def _add_staged_transactions(self, source=None):
+        # The staged transactions are already merged by date, ticker and source, no duplicates to check here.
+        self.conn.execute(f"""
+            INSERT INTO transactions (date, ticker, source, cost, quantity, cost_basis, seq)
+            SELECT date, ticker, source, cost, quantity, CASE WHEN quantity != 0 THEN cost / quantity ELSE 0 END, seq
+            FROM transactions_staging {"WHERE source = ?" if source else ""}
+            ORDER BY date, seq
+        """, (source,) if source else ())
+
+    def _staged_ticker_batches(self, max_rows=TRANSACTION_CHUNK_ROWS):
+        """
+        Split the staged tickers into batches of about max_rows transactions.
+        """
+        batch, size = [], 0
+        for ticker, count in self.conn.execute("SELECT ticker, COUNT(*) FROM transactions_staging GROUP BY ticker").fetchall():
+            batch.append(ticker)
+            size += count
+            if size >= max_rows or len(batch) >= 500:
+                yield batch
+                batch, size = [], 0
+        if batch:
+            yield batch
+
+    def _staged_transactions(self, tickers):
+        return self.conn.execute(f"""
+            SELECT date, ticker, source, cost, quantity FROM transactions_staging
+            WHERE ticker IN ({", ".join("?" * len(tickers))})
+            ORDER BY date, seq
+        """, tickers).fetchall()
+
+    def _parallel_replay(self, max_workers):
+        """
+        Replay partitions of tickers in worker processes, the state of a ticker doesn't depend on the others.
+        At most two partitions per worker are in flight, and the results are written in partition order.
+        """
+        workers = max_workers or os.cpu_count()
+        total = self.conn.execute("SELECT COUNT(*) FROM transactions_staging").fetchone()[0]
+        # Several partitions per worker, so a few large tickers don't leave the other workers idle
+        partition_rows = max(1, min(TRANSACTION_CHUNK_ROWS, -(-total // (workers * 4))))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = deque()
+            for tickers in self._staged_ticker_batches(partition_rows):
+                pending.append(executor.submit(replay_partition, SplitIndex.get_instance(self.db_name), self._staged_transactions(tickers)))
+                if len(pending) >= workers * 2:
+                    self._write_replay(*pending.popleft().result())
+            while pending:
+                self._write_replay(*pending.popleft().result())
+
+    def _write_replay(self, stock_data_rows, realized_gain_rows):
+        self.conn.executemany("INSERT OR REPLACE INTO stock_data (date, ticker, cost_basis, total_quantity) VALUES (?, ?, ?, ?)",
+                              stock_data_rows)
+        self.conn.executemany("INSERT OR REPLACE INTO realized_gains (date, ticker, gain) VALUES (?, ?, ?)",
+                              realized_gain_rows)
 
     def _update_future_cost_basis_and_quantity(self, trans_date, ticker, trans_cost, trans_quantity):
         '''
@@ -271,9 +152,18 @@ class DbPopulator:
         # print(f"Cash balance for {date} set to {cash_balance}.")
         
 
+    def _next_seq(self, source):
+        # A source not ranked up front is ranked in the order it is first read
+        rank = self._source_ranks.setdefault(source, len(self._source_ranks))
+        seq = self._source_seqs.get(source, rank * SOURCE_SEQ_SPAN) + 1
+        self._source_seqs[source] = seq
+        return seq
+
     def load_transactions_from_csv(self, file_path):
         """
         从 CSV 文件加载交易记录，并将同一天的交易合并。
+        The file is streamed: rows are merged in per-ticker buffers, spilled to transactions_staging
+        every TRANSACTION_CHUNK_ROWS rows.
         """
         try:
             source = os.path.splitext(os.path.basename(file_path))[0]
@@ -284,38 +174,44 @@ class DbPopulator:
                     date, ticker, cost, quantity = row
                     cost = float(cost)
                     quantity = float(quantity)
-                    key = (date, ticker, source)  
 
                     # Merge transactions with the same date, ticker and source
-                    if key in self.transactions:
-                        self.transactions[key]['cost'] += cost
-                        self.transactions[key]['quantity'] += quantity
+                    buffer = self._buffers.setdefault(ticker, {})
+                    entry = buffer.get((date, source))
+                    if entry is None:
+                        buffer[(date, source)] = [self._next_seq(source), [cost], [quantity]]
                     else:
-                        self.transactions[key] = {'cost': cost, 'quantity': quantity}
+                        entry[1].append(cost)
+                        entry[2].append(quantity)
+
+                    self._buffered_rows += 1
+                    if self._buffered_rows >= TRANSACTION_CHUNK_ROWS:
+                        self._flush_staging()
         except Exception as e:
             exit(f"Error reading CSV file {file_path}: {e}")
 
-    def populate_transaction_db(self):
-        # Insert transactions into the database
-        transactions = self.transactions
-        for (date, ticker, source), data in sorted(transactions.items(), key=lambda x: x[0][0]):
-            #Util.log(f"Processing transaction: {date}, {ticker}, {source}, {data['cost']}, {data['quantity']}")
-            self._add_transaction(date, ticker, data['cost'], data['quantity'], source)
-            self._update_stock_data(date, ticker, source, data['cost'], data['quantity'])
-            self._update_realized_gains(date, ticker, source, data['cost'], data['quantity'])
-
-            # # For sell and dividend, update realized gains and change the quantity of stock_data only
-            # if data['cost'] < 0:
-            #     # only update realized gains and the stock data holding
-            #     self._update_realized_gains(date, ticker, source, data['cost'], data['quantity'])
-            #     self._update_stock_data(date, ticker, source, data['cost'], data['quantity'])
-            # elif cost > 0:
-            #     self._update_stock_data(date, ticker, source, data['cost'], data['quantity'])
-            #     # self._update_future_cost_basis_and_quantity(date, ticker, cost, quantity)
-            # else:
-            #     # cost == 0
-            #     raise ValueError(f"cost cannot be 0: {date}, {ticker}, {source}, {cost}, {data['quantity']}")
+    def populate_transaction_db(self, max_workers=REPLAY_WORKERS):
+        """
+        Insert the staged transactions into the database and replay them into stock_data and realized_gains,
+        a batch of tickers at a time, in one commit.
 
+        Parameters:
+        - max_workers (int): 1 to replay in this process, otherwise the size of the process pool (None for the number of CPUs)
+        """
+        self._flush_staging()
+        with self.conn:
+            self._add_staged_transactions()
+            if max_workers == 1:
+                for tickers in self._staged_ticker_batches():
+                    stock_data_rows, realized_gain_rows = ReplayEngine(SplitIndex.get_instance(self.db_name)).replay(
+                        self._staged_transactions(tickers))
+                    self._write_replay(stock_data_rows, realized_gain_rows)
+            else:
+                self._parallel_replay(max_workers)
+            self._reset_staging()
+
+        PositionIndex.invalidate()
+        ValuationCube.build(self.db_name)
         print(f"Successfully loaded transactions")
         
     def load_daily_cash_from_csv(self, file_path):
@@ -329,6 +225,12 @@ class DbPopulator:
                 self._set_daily_cash(date, float(cash_balance))
         print(f"Successfully loaded daily cash from {file_path}")
 
+    def _list_transaction_files(self, folder_path):
+        if not os.path.exists(folder_path):
+            return []
+        return [os.path.join(folder_path, file_name) for file_name in sorted(os.listdir(folder_path))
+                if file_name.endswith('.csv') and file_name != 'demo_msft.csv']
+
     def load_transactions_from_folder(self, folder_path):
         """
         加载指定文件夹下的所有交易 CSV 文件并插入到数据库中
@@ -339,11 +241,173 @@ class DbPopulator:
             return
 
         # 遍历文件夹中的所有 CSV 文件
-        for file_name in os.listdir(folder_path):
-            if file_name.endswith('.csv') and file_name != 'demo_msft.csv':
-                file_path = os.path.join(folder_path, file_name)
-                #Util.log(f"Loading transactions from file: {file_name}")
-                self.load_transactions_from_csv(file_path)
+        for file_path in self._list_transaction_files(folder_path):
+            #Util.log(f"Loading transactions from file: {file_path}")
+            self.load_transactions_from_csv(file_path)
+
+    def _get_file_changes(self, file_paths):
+        """
+        Compare the files with the transaction_files manifest.
+        A file whose mtime is unchanged is skipped without reading it, otherwise its content hash decides.
+
+        Returns:
+        - changed (list): new or modified files
+        - removed (list): files in the manifest that no longer exist
+        - signatures (dict): {path: (content_hash, mtime)} of all current files
+        """
+        manifest = {path: (content_hash, mtime) for path, content_hash, mtime
+                    in self.conn.execute("SELECT path, content_hash, mtime FROM transaction_files").fetchall()}
+        changed, signatures = [], {}
+        for file_path in file_paths:
+            mtime = os.path.getmtime(file_path)
+            if file_path in manifest and manifest[file_path][1] == mtime:
+                signatures[file_path] = manifest[file_path]
+                continue
+            with open(file_path, 'rb') as f:
+                content_hash = hashlib.sha256(f.read()).hexdigest()
+            signatures[file_path] = (content_hash, mtime)
+            if file_path not in manifest or manifest[file_path][0] != content_hash:
+                changed.append(file_path)
+
+        removed = [path for path in manifest if path not in signatures]
+        return changed, removed, signatures
+
+    def _record_file_signatures(self, signatures):
+        self.conn.execute("DELETE FROM transaction_files")
+        self.conn.executemany("INSERT INTO transaction_files (path, content_hash, mtime) VALUES (?, ?, ?)",
+                              [(path, content_hash, mtime) for path, (content_hash, mtime) in signatures.items()])
+
+    def _rank_sources(self, transaction_files):
+        """
+        Rank the sources in the order of their first file, as a full reload reads them, and move the seq of
+        the stored transactions whose source changed rank, so the merge order stays the one of a full reload.
+        """
+        for file_path in transaction_files:
+            source = os.path.splitext(os.path.basename(file_path))[0]
+            self._source_ranks.setdefault(source, len(self._source_ranks))
+        stored_ranks = self.conn.execute(f"SELECT source, MIN(seq / {SOURCE_SEQ_SPAN}) FROM transactions GROUP BY source").fetchall()
+        self.conn.executemany(f"UPDATE transactions SET seq = seq % {SOURCE_SEQ_SPAN} + ? WHERE source = ?",
+                              [(self._source_ranks[source] * SOURCE_SEQ_SPAN, source) for source, rank in stored_ranks
+                               if source in self._source_ranks and self._source_ranks[source] != rank])
+
+    def _replace_source_transactions(self, source):
+        """
+        Replace the transactions of one source with its newly merged ones in transactions_staging.
+
+        Returns:
+        - dict: {ticker: earliest date whose transactions changed}
+        """
+        # Rows only on one side, or with another cost or quantity
+        changed_dates = dict(self.conn.execute("""
+            SELECT ticker, MIN(date) FROM (
+                SELECT * FROM (SELECT date, ticker, cost, quantity FROM transactions WHERE source = :source
+                               EXCEPT SELECT date, ticker, cost, quantity FROM transactions_staging WHERE source = :source)
+                UNION ALL
+                SELECT * FROM (SELECT date, ticker, cost, quantity FROM transactions_staging WHERE source = :source
+                               EXCEPT SELECT date, ticker, cost, quantity FROM transactions WHERE source = :source)
+            ) GROUP BY ticker
+        """, {"source": source}).fetchall())
+
+        self.conn.execute("DELETE FROM transactions WHERE source = ?", (source,))
+        self._add_staged_transactions(source)
+        return changed_dates
+
+    def _replay_tickers_from_dates(self, from_dates):
+        """
+        Recompute stock_data and realized_gains of the given tickers from their from_date onward,
+        starting from the state stored before from_date.
+
+        Parameters:
+        - from_dates (dict): {ticker: from_date}
+        """
+        transactions, initial_states = [], {}
+        for ticker, from_date in sorted(from_dates.items()):
+            print(f"Replaying {ticker} from {from_date}")
+            row = self.conn.execute("SELECT cost_basis, total_quantity, date FROM stock_data WHERE ticker = ? AND date < ? ORDER BY date DESC LIMIT 1",
+                                    (ticker, from_date)).fetchone()
+            gain = self.conn.execute("SELECT gain FROM realized_gains WHERE ticker = ? AND date < ? ORDER BY date DESC LIMIT 1",
+                                     (ticker, from_date)).fetchone()
+            cost_basis, quantity, prev_date = row if row else (0, 0, 0)
+            initial_states[ticker] = (cost_basis, quantity, prev_date, gain[0] if gain else 0)
+
+            self.conn.execute("DELETE FROM stock_data WHERE ticker = ? AND date >= ?", (ticker, from_date))
+            self.conn.execute("DELETE FROM realized_gains WHERE ticker = ? AND date >= ?", (ticker, from_date))
+            transactions += self.conn.execute("""
+                SELECT date, ticker, source, cost, quantity FROM transactions
+                WHERE ticker = ? AND date >= ?
+                ORDER BY date, seq
+            """, (ticker, from_date)).fetchall()
+
+        stock_data_rows, realized_gain_rows = ReplayEngine(SplitIndex.get_instance(self.db_name)).replay(transactions, initial_states)
+        self._write_replay(stock_data_rows, realized_gain_rows)
+
+    def _full_reload(self, folder_paths, cash_path):
+        for table_name in ("transactions", "stock_data", "daily_cash", "realized_gains"):
+            self.clear_table(table_name)
+        with self.conn:
+            SplitIndex.store(self.conn, SplitIndex.read_csv(self.stock_split_path))
+        self._reset_staging()
+        for folder_path in folder_paths:
+            self.load_transactions_from_folder(folder_path)
+        self.load_daily_cash_from_csv(cash_path)
+        self.populate_transaction_db()
+
+    def sync_transactions(self, folder_paths, cash_path, full=False):
+        """
+        增量加载交易记录。
+        Only the CSV files whose content changed since the last run are re-parsed, and stock_data / realized_gains
+        are recomputed only for the affected tickers, starting from the earliest changed date.
+        Everything is reloaded on the first run, with full=True, or when stock_split.csv changed.
+
+        Parameters:
+        - folder_paths (list): transaction folders, e.g. ["input_transactions/exchange1/", ...]
+        - cash_path (str): the daily cash CSV
+        - full (bool): clear the tables and replay every file
+        """
+        transaction_files = [file_path for folder_path in folder_paths
+                             for file_path in self._list_transaction_files(folder_path)]
+        changed, removed, signatures = self._get_file_changes(transaction_files + [cash_path, self.stock_split_path])
+
+        if full or not self.conn.execute("SELECT 1 FROM transaction_files LIMIT 1").fetchone() \
+                or self.stock_split_path in changed:
+            print("Reloading all transactions...")
+            self._full_reload(folder_paths, cash_path)
+            with self.conn:
+                self._record_file_signatures(signatures)
+            return
+
+        if cash_path in changed:
+            self.clear_table("daily_cash")
+            self.load_daily_cash_from_csv(cash_path)
+
+        # Files sharing a name are merged into the same source, so a source is re-parsed as a whole
+        changed_sources = {os.path.splitext(os.path.basename(path))[0]
+                           for path in changed + removed if path not in (cash_path, self.stock_split_path)}
+        if not changed_sources:
+            with self.conn:
+                self._record_file_signatures(signatures)
+            print("No transaction changes found")
+            return
+
+        changed_dates = {}
+        with self.conn:
+            self._reset_staging()
+            self._rank_sources(transaction_files)
+            for file_path in transaction_files:
+                if os.path.splitext(os.path.basename(file_path))[0] in changed_sources:
+                    self.load_transactions_from_csv(file_path)
+            self._flush_staging()
+            for source in sorted(changed_sources):
+                for ticker, date in self._replace_source_transactions(source).items():
+                    changed_dates[ticker] = min(date, changed_dates.get(ticker, date))
+
+            self._replay_tickers_from_dates(changed_dates)
+            self._record_file_signatures(signatures)
+            self._reset_staging()
+
+        PositionIndex.invalidate()
+        ValuationCube.build(self.db_name)
+        print(f"Successfully loaded transactions from {len(changed_sources)} changed source(s)")
 
     def clear_table(self, table_name):
         """
@@ -355,12 +419,18 @@ class DbPopulator:
         try:
             with self.conn:
                 self.conn.execute(f"DELETE FROM {table_name}")
+            PositionIndex.invalidate()
+            if table_name != "daily_cash":
+                ValuationCube.invalidate(self.db_name)
             print(f"All data from table '{table_name}' has been cleared.")
         except sqlite3.Error as e:
             print(f"Error clearing table '{table_name}': {e}")
 
     def close(self):
-        self.conn.close()
+        """
+        提交未完成的写入。共享连接由 DbConnection.close_all() 在运行结束时关闭。
+        """
+        self.conn.commit()
 
     def verify_table_size(self):
         with self.conn:
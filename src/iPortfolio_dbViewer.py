@@ -1,11 +1,12 @@
 from tabulate import tabulate  # 用于表格格式化显示
 import sqlite3
-import pandas as pd
+from const import DB_NAME
+from iPortfolio_dbConnection import DbConnection
 
 class DatabaseViewer:
-    def __init__(self, db_name="portfolio.db"):
+    def __init__(self, db_name=DB_NAME):
         try:
-            self.conn = sqlite3.connect(db_name)
+            self.conn = DbConnection.get_connection(db_name)
             print(f"Connected to database: {db_name}")
         except sqlite3.Error as e:
             print(f"Error connecting to database: {e}")
@@ -29,18 +30,18 @@ class DatabaseViewer:
             print(f"Number of records in realized_gains table: {count}")
 
     def _fetch_data(self, query):
-        df = pd.read_sql_query(query, self.conn)
-        return df
+        return self.conn.execute(query).fetchall()
 
     def _save_tabulate_to_csv(self, query, keys, filename):
-        df = self._fetch_data(query)
+        rows = self._fetch_data(query)
 
-        table = tabulate(df, headers=keys, tablefmt='pretty')
+        # The row numbers as the first column, as tabulate prints the index of a DataFrame
+        table = tabulate(rows, headers=keys, tablefmt='pretty', showindex=True)
         with open(filename, 'w') as f:
             f.write(table)
 
     def save_transactions_to_csv(self, filename):
-        query = "SELECT * FROM transactions ORDER BY date DESC"
+        query = "SELECT date, ticker, source, cost, quantity, cost_basis FROM transactions ORDER BY date DESC"
         keys = ["Date", "Ticker", "Source", "Cost", "Quantity", "Cost Basis"]
         self._save_tabulate_to_csv(query, keys, filename)
 
@@ -67,7 +68,7 @@ class DatabaseViewer:
     def view_transactions(self):
         """按日期降序查看交易记录表的数据"""
         with self.conn:
-            cursor = self.conn.execute("SELECT * FROM transactions ORDER BY date DESC")
+            cursor = self.conn.execute("SELECT date, ticker, source, cost, quantity, cost_basis FROM transactions ORDER BY date DESC")
             transactions = cursor.fetchall()
             print("\nTransactions (sorted by date, descending):")
             print(tabulate(transactions, headers=["Date", "Ticker", "Source", "Cost", "Quantity"], tablefmt="pretty"))
@@ -104,5 +105,5 @@ class DatabaseViewer:
             print(tabulate(realized_gain, headers=["Date", "Ticker", "Gain"], tablefmt="pretty"))
 
     def close(self):
-        """关闭数据库连接"""
-        self.conn.close()
\ No newline at end of file
+        """提交未完成的写入。共享连接由 DbConnection.close_all() 在运行结束时关闭。"""
+        self.conn.commit()
\ No newline at end of file
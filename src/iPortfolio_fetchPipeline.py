@@ -0,0 +1,104 @@
+import asyncio
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from const import FETCH_MAX_CONCURRENCY, FETCH_TIMEOUT, FETCH_RETRIES, FETCH_BACKOFF_BASE, FETCH_BACKOFF_MAX
+from iPortfolio_priceProvider import get_price_provider
+
+class FetchError(Exception):
+    pass
+
+class FetchPipeline:
+    """
+    Asynchronous price downloads behind a synchronous API.
+
+    An event loop runs in a background thread; download() submits a request to it and waits for the result,
+    so callers (DbAccessor, Util) stay synchronous. On the loop:
+    - a semaphore bounds the concurrent downloads (FETCH_MAX_CONCURRENCY)
+    - every attempt is limited to FETCH_TIMEOUT seconds
+    - transient errors (provider.transient_errors, timeouts included) are retried FETCH_RETRIES times
+      with exponential backoff and full jitter
+    - concurrent requests for the same (tickers, start_date, end_date) share one download (single flight)
+
+    The provider call itself is blocking, it runs in a thread pool of the same size as the semaphore.
+    A timed-out call is abandoned rather than interrupted.
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, max_concurrency=FETCH_MAX_CONCURRENCY, timeout=FETCH_TIMEOUT, retries=FETCH_RETRIES,
+                 backoff_base=FETCH_BACKOFF_BASE, backoff_max=FETCH_BACKOFF_MAX):
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.stats = {"requests": 0, "downloads": 0, "shared": 0, "retries": 0, "timeouts": 0, "failures": 0}
+
+        self._inflight = {}  # (tickers, start_date, end_date): asyncio.Task, only touched on the loop thread
+        self._loop = asyncio.new_event_loop()
+        self._loop.set_default_executor(ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="price-fetch"))
+        self._semaphore = None
+        self._thread = threading.Thread(target=self._loop.run_forever, name="price-fetch-loop", daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def get_instance():
+        with FetchPipeline._instance_lock:
+            if FetchPipeline._instance is None:
+                FetchPipeline._instance = FetchPipeline()
+            return FetchPipeline._instance
+
+    def _backoff(self, attempt):
+        # full jitter: a random delay in [0, min(max, base * 2^attempt)]
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    async def _download(self, tickers, start_date, end_date):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        provider = get_price_provider()
+
+        for attempt in range(self.retries + 1):
+            async with self._semaphore:
+                try:
+                    self.stats["downloads"] += 1
+                    return await asyncio.wait_for(asyncio.to_thread(provider.download, list(tickers), start_date, end_date),
+                                                  self.timeout)
+                # asyncio.TimeoutError is neither an OSError nor the built-in TimeoutError before Python 3.11
+                except (asyncio.TimeoutError,) + tuple(provider.transient_errors) as e:
+                    if isinstance(e, asyncio.TimeoutError):
+                        self.stats["timeouts"] += 1
+                    error = e
+
+            if attempt == self.retries:
+                break
+            self.stats["retries"] += 1
+            delay = self._backoff(attempt)
+            print(f"Retrying price download for {', '.join(tickers)} in {delay:.1f}s ({type(error).__name__}: {error})")
+            await asyncio.sleep(delay)
+
+        self.stats["failures"] += 1
+        raise FetchError(f"Failed to download {', '.join(tickers)} from {start_date} to {end_date} "
+                         f"after {self.retries + 1} attempts: {error!r}") from error
+
+    async def _single_flight(self, key):
+        self.stats["requests"] += 1
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._download(*key))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.stats["shared"] += 1
+        # shield: a caller giving up must not cancel the download shared with the other callers
+        return await asyncio.shield(task)
+
+    def download(self, tickers, start_date, end_date):
+        """
+        Download the daily close prices of tickers in [start_date, end_date) through the provider,
+        blocking until the result is ready. Same return value as PriceProvider.download.
+
+        Raises FetchError once the retries are exhausted; non-transient errors are raised as is.
+        """
+        key = (tuple(sorted(set(tickers))), start_date, end_date)
+        return asyncio.run_coroutine_threadsafe(self._single_flight(key), self._loop).result()
@@ -0,0 +1,152 @@
+import os
+import json
+import time
+import queue
+import atexit
+import threading
+import multiprocessing
+from datetime import datetime
+import pytz
+from const import LOG_FILE, LOG_LEVEL, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_QUEUE_SIZE
+
+LEVELS = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "ERROR": 40}
+
+class Logger:
+    """
+    Structured log of the application, one JSON object per line:
+        {"time": "2025-01-31 16:05:12.345", "level": "INFO", "file": "app.py", "line": 12, "message": "..."}
+
+    log() filters the level with one integer comparison and only enqueues the record; a background thread
+    formats the records and writes them in batches to a file kept open, rotated once it reaches LOG_MAX_BYTES
+    (application.log.1 ... application.log.<LOG_BACKUP_COUNT>). The queue is bounded: when the writer falls behind,
+    records below ERROR are dropped and counted, errors wait for room. close() (also at exit) drains the queue.
+
+    Render workers are short-lived processes exiting without the atexit handlers, so there the records are
+    written synchronously (as after close()), and the rotation is left to the main process.
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, path=LOG_FILE, level=LOG_LEVEL, max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT,
+                 queue_size=LOG_QUEUE_SIZE):
+        self.path = path
+        self.level = LEVELS[level]
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.dropped = 0
+        self._pid = os.getpid()
+        self._subprocess = multiprocessing.parent_process() is not None
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._file = None
+        self._timezone = pytz.timezone('US/Eastern')
+        self._write_lock = threading.Lock()
+        self._thread = None
+        if not self._subprocess:
+            self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+            self._thread.start()
+
+    @staticmethod
+    def get_instance():
+        with Logger._instance_lock:
+            # A forked process inherits the instance but not its writer thread
+            if Logger._instance is None or Logger._instance._pid != os.getpid():
+                Logger._instance = Logger()
+            return Logger._instance
+
+    def is_enabled_for(self, level):
+        """
+        Check before building an expensive message.
+        """
+        return LEVELS.get(level, LEVELS["INFO"]) >= self.level
+
+    def log(self, level, message, file=None, line=None, **fields):
+        """
+        Record a message if level passes LOG_LEVEL, extra keyword fields are added to the JSON object.
+        """
+        level_no = LEVELS.get(level, LEVELS["INFO"])
+        if level_no < self.level:
+            return
+        record = (time.time(), level, file, line, message, fields)
+        if self._thread is None:
+            self._write([record])
+        elif level_no >= LEVELS["ERROR"]:
+            self._queue.put(record)
+        else:
+            try:
+                self._queue.put_nowait(record)
+            except queue.Full:
+                self.dropped += 1
+
+    def _format(self, record):
+        timestamp, level, file, line, message, fields = record
+        entry = {"time": datetime.fromtimestamp(timestamp, self._timezone).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3],
+                 "level": level}
+        if file is not None:
+            entry["file"] = os.path.basename(file)
+            entry["line"] = line
+        entry["message"] = str(message)
+        entry.update(fields)
+        return json.dumps(entry, default=str) + "\n"
+
+    def _rotate(self):
+        self._file.close()
+        self._file = None
+        for i in range(self.backup_count - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+    def _write(self, records):
+        with self._write_lock:
+            if self._file is None:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                self._file = open(self.path, "a")
+            self._file.write("".join(self._format(record) for record in records))
+            self._file.flush()
+            if not self._subprocess and self._file.tell() >= self.max_bytes:
+                self._rotate()
+
+    def _run(self):
+        while True:
+            records = [self._queue.get()]
+            # Take whatever else is waiting, one write per batch
+            while len(records) < 1000:
+                try:
+                    records.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in records
+            records = [record for record in records if record is not None]
+            if self.dropped:
+                dropped, self.dropped = self.dropped, 0
+                records.append((time.time(), "WARNING", None, None, f"Dropped {dropped} log records, the log queue was full", {}))
+            try:
+                if records:
+                    self._write(records)
+            except OSError as e:
+                print(f"Error writing to {self.path}: {e}")
+            if stop:
+                return
+
+    def close(self):
+        """
+        Write every queued record and stop the writer.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        # Records logged from now on are written synchronously
+        self._thread = None
+        with self._write_lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+def _close_logger():
+    if Logger._instance is not None and Logger._instance._pid == os.getpid():
+        Logger._instance.close()
+
+atexit.register(_close_logger)
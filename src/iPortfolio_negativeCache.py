@@ -0,0 +1,106 @@
+from datetime import datetime, timedelta
+import pytz
+from const import DB_NAME, PRICE_MISS_TTL_HOURS
+from iPortfolio_dbConnection import DbConnection
+
+NO_DATA = "no_data"                # nothing in a range that ended more than 7 days ago
+NO_RECENT_DATA = "no_recent_data"  # nothing within the last 7 days
+FETCH_ERROR = "fetch_error"        # the download failed after all the retries
+
+class NegativeCache:
+    """
+    Persisted negative price results in the price_misses table: (ticker, start_date, end_date, reason, expires_at).
+
+    A delisted ticker, or a date before the listing, has no price however often it's asked for.
+    The fetch paths check this table before going to the network and record every range the provider
+    had no price for, so the same miss costs one download per PRICE_MISS_TTL_HOURS[reason] at most.
+    """
+
+    @staticmethod
+    def _now():
+        return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    @staticmethod
+    def reason_for(end_date):
+        """
+        NO_DATA if the missing range ended more than 7 days ago (EST), NO_RECENT_DATA otherwise.
+        """
+        recent_date = (datetime.now(pytz.timezone('US/Eastern')) - timedelta(days=7)).strftime("%Y-%m-%d")
+        return NO_RECENT_DATA if end_date >= recent_date else NO_DATA
+
+    @staticmethod
+    def lookup(db_conn, ticker_dates: dict) -> dict:
+        """
+        Find the dates covered by a non-expired miss.
+
+        Parameters:
+        - ticker_dates (dict): {ticker: [date, ...]}
+
+        Returns:
+        - dict: {ticker: {date: reason}}, only the tickers with a known miss
+        """
+        now = NegativeCache._now()
+        result = {}
+        for ticker, dates in ticker_dates.items():
+            if not dates:
+                continue
+            rows = db_conn.execute("""
+                SELECT start_date, end_date, reason FROM price_misses
+                WHERE ticker = ? AND start_date <= ? AND end_date >= ? AND expires_at > ?
+            """, (ticker, max(dates), min(dates), now)).fetchall()
+            for date in dates:
+                for start_date, end_date, reason in rows:
+                    if start_date <= date <= end_date:
+                        result.setdefault(ticker, {})[date] = reason
+                        break
+        return result
+
+    @staticmethod
+    def record(db_conn, misses: list):
+        """
+        Remember the ranges without a price.
+
+        Parameters:
+        - misses (list): [(ticker, start_date, end_date, reason), ...], both dates included
+        """
+        if not misses:
+            return
+        now = datetime.now()
+        rows = [(ticker, start_date, end_date, reason,
+                 (now + timedelta(hours=PRICE_MISS_TTL_HOURS[reason])).strftime("%Y-%m-%d %H:%M:%S"))
+                for ticker, start_date, end_date, reason in misses]
+        with db_conn:
+            db_conn.executemany("""
+                INSERT OR REPLACE INTO price_misses (ticker, start_date, end_date, reason, expires_at)
+                VALUES (?, ?, ?, ?, ?)
+            """, rows)
+
+    @staticmethod
+    def list_entries(include_expired=True, db_name=DB_NAME) -> list:
+        """
+        Returns:
+        - list: [(ticker, start_date, end_date, reason, expires_at), ...] sorted by ticker and start_date
+        """
+        with DbConnection.get_connection(db_name) as db_conn:
+            query = "SELECT ticker, start_date, end_date, reason, expires_at FROM price_misses"
+            params = ()
+            if not include_expired:
+                query += " WHERE expires_at > ?"
+                params = (NegativeCache._now(),)
+            return db_conn.execute(query + " ORDER BY ticker, start_date", params).fetchall()
+
+    @staticmethod
+    def clear(ticker=None, expired_only=False, db_name=DB_NAME) -> int:
+        """
+        Delete the misses of a ticker, or of every ticker. Returns the number of deleted rows.
+        """
+        conditions, params = [], []
+        if ticker:
+            conditions.append("ticker = ?")
+            params.append(ticker)
+        if expired_only:
+            conditions.append("expires_at <= ?")
+            params.append(NegativeCache._now())
+        query = "DELETE FROM price_misses" + (" WHERE " + " AND ".join(conditions) if conditions else "")
+        with DbConnection.get_connection(db_name) as db_conn:
+            return db_conn.execute(query, params).rowcount
@@ -0,0 +1,172 @@
+import os
+import json
+import time
+import inspect
+import functools
+import threading
+from datetime import datetime
+from tabulate import tabulate
+from const import PERF_PATH
+
+class Perf:
+    """
+    Performance report of one run, switched on by `app.py --perf`.
+
+    enable() wraps the hot paths in place:
+    - every iPortfolio_client function (stage.*) and every DbAccessor method (DbAccessor.*): calls and seconds,
+      inclusive of the nested calls
+    - the SQLite connections: a trace callback counts the executed statements by kind (sql.*)
+    - the price providers: downloads and tickers asked for (provider.*)
+    - the PNG and CSV outputs: bytes written per file
+    and report() adds the PriceCache and FetchPipeline statistics.
+
+    Nothing is wrapped until enable() is called, so a run without --perf runs the original functions.
+    """
+    enabled = False
+    _lock = threading.Lock()
+    _start = None
+    timings = {}   # name: [calls, seconds]
+    counters = {}  # name: count
+    outputs = {}   # filename: bytes
+
+    @staticmethod
+    def count(name, n=1):
+        with Perf._lock:
+            Perf.counters[name] = Perf.counters.get(name, 0) + n
+
+    @staticmethod
+    def _add_timing(name, seconds):
+        with Perf._lock:
+            entry = Perf.timings.setdefault(name, [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+
+    @staticmethod
+    def record_output(filename):
+        try:
+            size = os.path.getsize(filename)
+        except OSError:
+            return
+        with Perf._lock:
+            Perf.outputs[filename] = size
+
+    @staticmethod
+    def _timed(name, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                Perf._add_timing(name, time.perf_counter() - start)
+        return wrapper
+
+    @staticmethod
+    def _trace_sql(statement):
+        Perf.count("sql.statements")
+        Perf.count(f"sql.{statement.lstrip().split(None, 1)[0].lower()}")
+
+    @staticmethod
+    def enable():
+        """
+        Wrap the hot paths, call it before the first stage runs.
+        """
+        if Perf.enabled:
+            return
+        Perf.enabled = True
+        Perf._start = time.perf_counter()
+
+        import iPortfolio_client as client
+        from iPortfolio_dbAccessor import DbAccessor
+        from iPortfolio_dbConnection import DbConnection
+        from iPortfolio_dbViewer import DatabaseViewer
+        from iPortfolio_priceProvider import PROVIDERS
+        from iPortfolio_renderer import Renderer
+
+        for name, func in list(vars(client).items()):
+            if inspect.isfunction(func) and func.__module__ == client.__name__ and not name.startswith("_"):
+                setattr(client, name, Perf._timed(f"stage.{name}", func))
+
+        for name, attr in list(vars(DbAccessor).items()):
+            if isinstance(attr, staticmethod):
+                setattr(DbAccessor, name, staticmethod(Perf._timed(f"DbAccessor.{name}", attr.__func__)))
+
+        open_connection = DbConnection._open
+
+        def _open(db_name):
+            conn = open_connection(db_name)
+            conn.set_trace_callback(Perf._trace_sql)
+            return conn
+        DbConnection._open = staticmethod(_open)
+        with DbConnection._lock:
+            for conn in DbConnection._connections.values():
+                conn.set_trace_callback(Perf._trace_sql)
+
+        for provider_class in PROVIDERS.values():
+            def download(self, tickers, start_date, end_date, _download=provider_class.download, _name=provider_class.name):
+                Perf.count(f"provider.{_name}.downloads")
+                Perf.count(f"provider.{_name}.tickers", len(tickers))
+                return _download(self, tickers, start_date, end_date)
+            provider_class.download = Perf._timed(f"provider.{provider_class.name}.download", download)
+
+        render = Renderer.render
+
+        def _render(jobs, *args, **kwargs):
+            timings = render(jobs, *args, **kwargs)
+            for filename in timings:
+                Perf.record_output(filename)
+            return timings
+        Renderer.render = staticmethod(Perf._timed("Renderer.render", _render))
+
+        save_csv = DatabaseViewer._save_tabulate_to_csv
+
+        def _save_tabulate_to_csv(self, query, keys, filename):
+            save_csv(self, query, keys, filename)
+            Perf.record_output(filename)
+        DatabaseViewer._save_tabulate_to_csv = _save_tabulate_to_csv
+
+    @staticmethod
+    def build_report() -> dict:
+        from iPortfolio_priceCache import PriceCache
+        from iPortfolio_fetchPipeline import FetchPipeline
+
+        with Perf._lock:
+            timings = {name: {"calls": calls, "seconds": round(seconds, 4)} for name, (calls, seconds) in Perf.timings.items()}
+            counters = dict(Perf.counters)
+            outputs = dict(Perf.outputs)
+        return {
+            "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "wall_seconds": round(time.perf_counter() - Perf._start, 4),
+            "timings": dict(sorted(timings.items(), key=lambda item: -item[1]["seconds"])),
+            "counters": dict(sorted(counters.items())),
+            "price_cache": PriceCache.get_instance().stats(),
+            # Only if something downloaded, don't start the fetch loop for the report
+            "fetch_pipeline": dict(FetchPipeline._instance.stats) if FetchPipeline._instance else {},
+            "outputs": {"files": len(outputs), "bytes": sum(outputs.values()), "per_file": outputs},
+        }
+
+    @staticmethod
+    def report(path=PERF_PATH) -> str:
+        """
+        Save the JSON report under path and print the summary. Returns the report file name.
+        """
+        report = Perf.build_report()
+        os.makedirs(path, exist_ok=True)
+        filename = os.path.join(path, f"perf_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+        with open(filename, "w") as f:
+            json.dump(report, f, indent=2)
+
+        print(f"Performance report ({report['wall_seconds']:.2f}s wall time)")
+        rows = [(name, entry["calls"], f"{entry['seconds']:.3f}") for name, entry in report["timings"].items()
+                if not name.startswith("DbAccessor.")]
+        rows += [(name, entry["calls"], f"{entry['seconds']:.3f}") for name, entry in report["timings"].items()
+                 if name.startswith("DbAccessor.")][:10]
+        print(tabulate(rows, headers=["Timer", "Calls", "Seconds"], tablefmt='pretty'))
+        counts = list(report["counters"].items())
+        counts += [(f"price_cache.{name}", value) for name, value in report["price_cache"].items()]
+        counts += [(f"fetch_pipeline.{name}", value) for name, value in report["fetch_pipeline"].items()]
+        counts.append(("outputs.files", report["outputs"]["files"]))
+        counts.append(("outputs.bytes", report["outputs"]["bytes"]))
+        print(tabulate(counts, headers=["Counter", "Value"], tablefmt='pretty'))
+        print(f"Performance report saved to {filename}")
+        return filename
@@ -2,9 +2,11 @@ from const import *
 from datetime import datetime, timedelta
 import matplotlib.pyplot as plt
 import inspect
+import numpy as np
 
 from iPortfolio_util import Util
-from iPortfolio_dbAccessor import DbAccessor
+from iPortfolio_valuationCube import ValuationCube
+from iPortfolio_renderer import RenderJob, render_job, LINE_CHART_JOB, LINE_CHART_WITH_ALL_DATES_JOB
 
 class Plotter:
     def __init__(self):
@@ -23,6 +25,9 @@ class Plotter:
         colors = ['blue', 'green', 'purple']
         # 在每个点上标注数值
         for i, (x, y_value) in enumerate(zip(dates, total_values)):
+            if np.isnan(y_value):
+                # a day with an unpriced holding, left as a gap
+                continue
             color = colors[i % len(colors)]
             y_format = f"{y_value / 1_000:.1f}K"
             plt.text(x, y_value, f"{y_format}", fontsize=16, ha='center', va='bottom', color=color)  # 标注总资产值
@@ -63,6 +68,9 @@ class Plotter:
         colors = ['blue']
         # 在每个点上标注数值
         for i, (x, y_value) in enumerate(zip(dates, total_values)):
+            if np.isnan(y_value):
+                # a day with an unpriced holding, left as a gap
+                continue
             if x == max_profit['date']:
                 Util.log_to_file(__file__, inspect.currentframe().f_lineno, "INFO", f"max_profit: {max_profit['profit']}, date: {max_profit['date']}")
                 color = 'green'
@@ -99,67 +107,30 @@ class Plotter:
         plt.show()
         plt.close()
 
-    def plot_line_chart(self, file_name, end_date, time_period, time_str, number_of_points=NUM_OF_PLOT):
-        total_values = []
-        total_costs = []
-        total_profits = []
-
+    def line_chart_job(self, file_name, end_date, time_period, time_str, number_of_points=NUM_OF_PLOT) -> RenderJob:
         # calculate dates from ytd
         if time_period == "YTD":
             time_period = Util.calculate_ytd_date_delta(end_date)
 
-        # 获取所有出现过的ticker列表
-        tickers = DbAccessor.get_all_tickers()
-
         # Get dates
         dates = Util.get_evenly_spaced_dates(start_date = end_date - timedelta(days=time_period),
                                                                 end_date=end_date,
                                                                 num_dates=number_of_points)
-        for i, date in enumerate(dates):
-            day_profit = 0
-            day_cost = 0
-            day_value = 0
-            for ticker in tickers:
-                # Get prices, quantity, and cost basis
-                quantity = DbAccessor.get_stock_quantity(ticker=ticker,
-                                                    date=date)
-                cost_basis = DbAccessor.get_cost_basis(ticker=ticker,
-                                                date=date)
-                
-                # skip if quantity is 0
-                if quantity == 0:
-                    continue
-
-                price = DbAccessor.fetch_and_store_price(ticker=ticker, date=date)
-                
-                value = price * quantity
-                cost = cost_basis * quantity
-                profit = value - cost
-                day_profit += profit
-                day_cost += cost
-                day_value += value
-
-            total_values.append(day_value)
-            total_costs.append(day_cost)
-            total_profits.append(day_profit)
-
-            latest_cost = total_costs[-1]
-
-        self._plot_line_chart_util(latest_cost, total_profits, dates, file_name, time_str)
-
+        valuation = ValuationCube.ensure_fresh().get_range(dates)
+        total_profits = valuation["unrealized"].tolist()
+        latest_cost = float(valuation["total_cost"][-1])
 
+        return RenderJob(LINE_CHART_JOB,
+                         {"latest_cost": latest_cost, "total_profits": total_profits, "dates": dates},
+                         file_name, time_str)
 
+    def plot_line_chart(self, file_name, end_date, time_period, time_str, number_of_points=NUM_OF_PLOT):
+        render_job(self.line_chart_job(file_name, end_date, time_period, time_str, number_of_points))
 
-    def plot_line_chart_with_all_dates(self, file_name, end_date, time_period, time_str):
-        total_values = []
-        total_costs = []
-        total_profits = []
-
+    def line_chart_with_all_dates_job(self, file_name, end_date, time_period, time_str) -> RenderJob:
         # calculate dates from ytd
         if time_period == "YTD":
             time_period = Util.calculate_ytd_date_delta(end_date)
-        # Get all tickers
-        tickers = DbAccessor.get_all_tickers()
         # Get all dates
         start_date = end_date - timedelta(days=time_period)
         dates = Util.get_all_dates(start_date = start_date,
@@ -169,67 +140,31 @@ class Plotter:
                                                                 end_date=end_date,
                                                                 num_dates=NUM_OF_PLOT)
 
-        max_profit = {'date': 0, 'profit': -float('inf')}
-        min_profit = {'date': 0, 'profit': float('inf')}
-        dates_profit_map = {}
-        for i, date in enumerate(dates):
-            day_profit = 0
-            day_cost = 0
-            day_value = 0
-            for ticker in tickers:
-                # Get prices, quantity, and cost basis
-                quantity = DbAccessor.get_stock_quantity(ticker=ticker,
-                                                    date=date)
-                cost_basis = DbAccessor.get_cost_basis(ticker=ticker,
-                                                date=date)
-                
-                # skip if quantity is 0
-                if quantity == 0:
-                    continue
-
-                price = DbAccessor.fetch_and_store_price(ticker=ticker, date=date)
-                
-                value = price * quantity
-                cost = cost_basis * quantity
-                profit = value - cost
-                day_profit += profit
-                day_cost += cost
-                day_value += value
-
-            if day_profit > max_profit['profit']:
-                max_profit['profit'] = day_profit
-                max_profit['date'] = date
-            if day_profit < min_profit['profit']:
-                min_profit['profit'] = day_profit
-                min_profit['date'] = date
-
-            if date in target_dates:
-                dates_profit_map[date] = day_profit
-
-            latest_cost = day_cost
+        valuation = ValuationCube.ensure_fresh().get_range(dates)
+        day_profit = valuation["unrealized"]
+        # the first date with the highest / lowest total profit, a day with an unpriced holding (NaN) is skipped
+        max_index, min_index = int(np.nanargmax(day_profit)), int(np.nanargmin(day_profit))
+        max_profit = {'date': dates[max_index], 'profit': float(day_profit[max_index])}
+        min_profit = {'date': dates[min_index], 'profit': float(day_profit[min_index])}
+        latest_cost = float(valuation["total_cost"][-1])
 
+        dates_profit_map = {date: profit for date, profit in zip(dates, day_profit.tolist())
+                            if date in target_dates}
         dates_profit_map[max_profit['date']] = max_profit['profit']
         dates_profit_map[min_profit['date']] = min_profit['profit']
         # Sort the dates and profits
         target_dates = sorted(dates_profit_map.keys())
         total_profits = [dates_profit_map[date] for date in target_dates]
 
-        # Util.log_to_file(__file__, inspect.currentframe().f_lineno, "INFO", f"target_dates: len: {len(target_dates)},  {target_dates}")    
-
-        # Util.log_to_file(__file__, inspect.currentframe().f_lineno, "INFO", f"start_date: {end_date - timedelta(days=time_period)}, end_date: {end_date}, time_period: {time_period}")
-        # Util.log_to_file(__file__, inspect.currentframe().f_lineno, "INFO", f"max_profit: {max_profit['profit']}, date: {max_profit['date']}")
-        # Util.log_to_file(__file__, inspect.currentframe().f_lineno, "INFO", f"min_profit: {min_profit['profit']}, date: {min_profit['date']}")
-        
-        # Util.log_to_file(__file__, inspect.currentframe().f_lineno, "INFO", f"final target dates: len: {len(target_dates)}, {target_dates}")
-
-        self._plot_line_chart_with_all_dates_util(latest_cost, total_profits, target_dates, file_name, time_str, max_profit=max_profit, min_profit=min_profit)
+        return RenderJob(LINE_CHART_WITH_ALL_DATES_JOB,
+                         {"latest_cost": latest_cost, "total_profits": total_profits, "dates": target_dates,
+                          "max_profit": max_profit, "min_profit": min_profit},
+                         file_name, time_str)
 
+    def plot_line_chart_with_all_dates(self, file_name, end_date, time_period, time_str):
+        render_job(self.line_chart_with_all_dates_job(file_name, end_date, time_period, time_str))
 
-    def plot_ticker_line_chart(self, file_name, ticker, time_period, time_str, number_of_points=NUM_OF_PLOT):
-        total_values = []
-        total_costs = []
-        total_profits = []
-
+    def ticker_line_chart_job(self, file_name, ticker, time_period, time_str, number_of_points=NUM_OF_PLOT) -> RenderJob:
         # calculate dates from ytd
         if time_period == "YTD":
             time_period = Util.calculate_ytd_date_delta_ends_today()
@@ -239,32 +174,22 @@ class Plotter:
         dates = Util.get_evenly_spaced_dates(start_date = today - timedelta(days=time_period),
                                                                 end_date=today,
                                                                 num_dates=number_of_points)
-        emtpy_dates = []
-        for i, date in enumerate(dates):
-            # Get prices, quantity, and cost basis
-            quantity = DbAccessor.get_stock_quantity(ticker=ticker, 
-                                                date=date)
-            cost_basis = DbAccessor.get_cost_basis(ticker=ticker,
-                                            date=date)
-            
-            # skip if quantity is 0
-            if quantity == 0:
-                emtpy_dates.append(date)
-                continue
+        valuation = ValuationCube.ensure_fresh().get_ticker_range(ticker, dates)
 
-            price = DbAccessor.fetch_and_store_price(ticker=ticker, date=date)
+        # skip the dates without holding
+        held = valuation["quantity"] != 0
+        total_profits = valuation["unrealized"][held].tolist()
+        latest_cost = float(valuation["cost"][held][-1])
+        dates = [date for date, is_held in zip(dates, held) if is_held]
+        return RenderJob(LINE_CHART_JOB,
+                         {"latest_cost": latest_cost, "total_profits": total_profits, "dates": dates},
+                         file_name, time_str)
 
-            value = price * quantity
-            cost = cost_basis * quantity
-            profit = value - cost
+    def plot_ticker_line_chart(self, file_name, ticker, time_period, time_str, number_of_points=NUM_OF_PLOT):
+        render_job(self.ticker_line_chart_job(file_name, ticker, time_period, time_str, number_of_points))
 
-            total_values.append(value)
-            total_costs.append(cost)
-            total_profits.append(profit)
-            latest_cost = total_costs[-1]
-        
-        dates = [date for date in dates if date not in emtpy_dates]
-        self._plot_line_chart_util(latest_cost, total_profits, dates, file_name, time_str)
+    def line_chart_ends_at_today_job(self, file_name, time_period, time_str) -> RenderJob:
+        return self.line_chart_with_all_dates_job(file_name, Util.get_today_est_dt(), time_period, time_str)
 
     def plot_line_chart_ends_at_today(self, file_name, time_period, time_str, number_of_points=NUM_OF_PLOT):
         # self.plot_line_chart(file_name, Util.get_today_est_dt(), time_period, time_str, number_of_points)
@@ -0,0 +1,130 @@
+import bisect
+import threading
+import numpy as np
+from const import DB_NAME
+from iPortfolio_dbConnection import DbConnection
+
+class PositionIndex:
+    """
+    In-memory copy of stock_data and realized_gains for as-of lookups.
+
+    Each ticker keeps its dates sorted, with parallel quantity / cost basis / gain arrays, so
+    "the latest row on or before date" is a binary search instead of
+    `... WHERE ticker = ? AND date <= ? ORDER BY date DESC LIMIT 1`.
+
+    The index is loaded once per run through get_instance(), and DbPopulator calls invalidate()
+    whenever it rewrites stock_data or realized_gains. The instance is created under a lock, so
+    threads asking for it at the same time share one load.
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, db_name=DB_NAME):
+        conn = DbConnection.get_connection(db_name)
+        self.positions = {}  # ticker: (dates, quantities, cost_bases)
+        self.gains = {}      # ticker: (dates, gains)
+
+        rows = conn.execute("SELECT ticker, date, total_quantity, cost_basis FROM stock_data ORDER BY ticker, date").fetchall()
+        for ticker, date, quantity, cost_basis in rows:
+            if ticker not in self.positions:
+                self.positions[ticker] = ([], [], [])
+            dates, quantities, cost_bases = self.positions[ticker]
+            dates.append(date)
+            quantities.append(quantity)
+            cost_bases.append(cost_basis)
+
+        rows = conn.execute("SELECT ticker, date, gain FROM realized_gains ORDER BY ticker, date").fetchall()
+        for ticker, date, gain in rows:
+            if ticker not in self.gains:
+                self.gains[ticker] = ([], [])
+            dates, gains = self.gains[ticker]
+            dates.append(date)
+            gains.append(gain)
+
+        # numpy copies for the vector lookups
+        self.position_arrays = {ticker: tuple(np.array(column) for column in columns)
+                                for ticker, columns in self.positions.items()}
+        self.gain_arrays = {ticker: tuple(np.array(column) for column in columns)
+                            for ticker, columns in self.gains.items()}
+
+    @staticmethod
+    def get_instance():
+        instance = PositionIndex._instance
+        if instance is None:
+            with PositionIndex._instance_lock:
+                if PositionIndex._instance is None:
+                    PositionIndex._instance = PositionIndex()
+                instance = PositionIndex._instance
+        return instance
+
+    @staticmethod
+    def invalidate():
+        """
+        Drop the loaded index, the next get_instance() reloads it from the database.
+        """
+        with PositionIndex._instance_lock:
+            PositionIndex._instance = None
+
+    @staticmethod
+    def _asof(dates, values, date):
+        index = bisect.bisect_right(dates, date) - 1
+        return values[index] if index >= 0 else 0
+
+    @staticmethod
+    def _asof_vector(dates, values, query_dates):
+        query_dates = np.asarray(query_dates)
+        if len(dates) == 0:
+            return np.zeros(len(query_dates))
+        indices = np.searchsorted(dates, query_dates, side="right") - 1
+        return np.where(indices >= 0, values[np.maximum(indices, 0)], 0.0)
+
+    def get_all_tickers(self):
+        return list(self.positions.keys())
+
+    def get_start_end_date(self, ticker):
+        """
+        First and last date of the ticker in stock_data, (None, None) if it has none.
+        """
+        if ticker not in self.positions:
+            return None, None
+        dates = self.positions[ticker][0]
+        return dates[0], dates[-1]
+
+    def get_stock_quantity(self, ticker, date):
+        if ticker not in self.positions:
+            return 0
+        dates, quantities, _ = self.positions[ticker]
+        return self._asof(dates, quantities, date)
+
+    def get_cost_basis(self, ticker, date):
+        if ticker not in self.positions:
+            return 0
+        dates, _, cost_bases = self.positions[ticker]
+        return self._asof(dates, cost_bases, date)
+
+    def get_realized_gain(self, ticker, date):
+        if ticker not in self.gains:
+            return 0
+        dates, gains = self.gains[ticker]
+        return self._asof(dates, gains, date)
+
+    def get_stock_quantities(self, ticker, dates):
+        """
+        Vector version of get_stock_quantity, returns a numpy array aligned with dates.
+        """
+        if ticker not in self.position_arrays:
+            return np.zeros(len(dates))
+        position_dates, quantities, _ = self.position_arrays[ticker]
+        return self._asof_vector(position_dates, quantities, dates)
+
+    def get_cost_bases(self, ticker, dates):
+        if ticker not in self.position_arrays:
+            return np.zeros(len(dates))
+        position_dates, _, cost_bases = self.position_arrays[ticker]
+        return self._asof_vector(position_dates, cost_bases, dates)
+
+    def get_realized_gains(self, ticker, dates):
+        if ticker not in self.gain_arrays:
+            return np.zeros(len(dates))
+        gain_dates, gains = self.gain_arrays[ticker]
+        return self._asof_vector(gain_dates, gains, dates)
@@ -0,0 +1,95 @@
+import time
+import threading
+from collections import OrderedDict
+from datetime import datetime
+import pytz
+from const import PRICE_CACHE_MAX_ENTRIES, PRICE_CACHE_LIVE_TTL
+
+class PriceCache:
+    """
+    In-process cache of resolved prices, shared by every fetch path (DbAccessor, Util, PortfolioDisplayerUtil).
+
+    - Historical prices (date before today, EST) never change and are kept until evicted.
+    - Live prices (today, or later) are still moving, they expire after PRICE_CACHE_LIVE_TTL seconds
+      and are fetched again on the next lookup.
+    - At most PRICE_CACHE_MAX_ENTRIES (ticker, date) pairs are kept, the least recently used is evicted first.
+
+    The cache can be shared by several threads, every access holds the lock, and so does the creation of the instance.
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, max_entries=PRICE_CACHE_MAX_ENTRIES, live_ttl=PRICE_CACHE_LIVE_TTL):
+        self.max_entries = max_entries
+        self.live_ttl = live_ttl
+        self._entries = OrderedDict()  # (ticker, date): (price, expires_at or None)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+
+    @staticmethod
+    def get_instance():
+        with PriceCache._instance_lock:
+            if PriceCache._instance is None:
+                PriceCache._instance = PriceCache()
+            return PriceCache._instance
+
+    @staticmethod
+    def _today():
+        return datetime.now(pytz.timezone('US/Eastern')).strftime("%Y-%m-%d")
+
+    def get(self, ticker, date):
+        """
+        Return the cached price of ticker on date, or None on a miss or an expired live price.
+        """
+        key = (ticker, date)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] is not None and entry[1] <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, ticker, date, price):
+        if price is None:
+            return
+        expires_at = time.monotonic() + self.live_ttl if date >= self._today() else None
+        key = (ticker, date)
+        with self._lock:
+            self._entries[key] = (price, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, ticker=None, date=None):
+        """
+        Drop the cached prices of a ticker, of a date, of both, or everything when neither is given.
+        """
+        with self._lock:
+            if ticker is None and date is None:
+                self._entries.clear()
+                return
+            for key in [key for key in self._entries
+                        if (ticker is None or key[0] == ticker) and (date is None or key[1] == date)]:
+                del self._entries[key]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "expirations": self.expirations,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,167 @@
+import os
+import ast
+import logging
+import threading
+from const import PRICE_PROVIDER, PRICE_FIXTURE_PATH
+
+class DownloadError(Exception):
+    """
+    The provider answered without the prices (an outage, a rate limit...) but didn't raise, retried as transient.
+    """
+    pass
+
+class PriceProvider:
+    """
+    Source of daily close prices. Every price fetch goes through a provider, so the source can be
+    swapped (e.g. local fixtures on an offline box) without touching the callers.
+    pandas and yfinance are imported by the providers when they are used, not with this module.
+    """
+    name = "base"
+    # Errors worth retrying (network hiccups, timeouts), anything else fails the fetch right away
+    transient_errors = (OSError,)
+
+    def download(self, tickers, start_date, end_date) -> "pd.DataFrame":
+        """
+        Get the daily close prices of tickers in [start_date, end_date), start_date is included, end_date is excluded.
+
+        Parameters:
+        - tickers (list): tickers to download
+        - start_date (str): "YYYY-MM-DD"
+        - end_date (str): "YYYY-MM-DD"
+
+        Returns:
+        - pd.DataFrame: one column per ticker, indexed by date. Tickers without data are missing or all NaN.
+        """
+        raise NotImplementedError
+
+class _YahooErrors(logging.Handler):
+    """
+    yf.download never raises for a ticker, it returns empty columns and logs the failures once it's done,
+    "['AAPL', 'MSFT']: <error>", from the calling thread. Collects them per ticker for the current thread.
+    """
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.thread = threading.get_ident()
+        self.errors = {}
+
+    def emit(self, record):
+        if record.thread != self.thread:
+            return
+        tickers, separator, error = record.getMessage().partition("]: ")
+        if not separator or not tickers.startswith("["):
+            return
+        try:
+            for ticker in ast.literal_eval(tickers + "]"):
+                self.errors[ticker] = error
+        except (ValueError, SyntaxError):
+            pass
+
+class YahooPriceProvider(PriceProvider):
+    """
+    Yahoo Finance through yfinance. A download is a DownloadError (transient) when a ticker failed for another
+    reason than missing prices (network, rate limit), or when no requested ticker got a single price: yfinance
+    reports an outage as empty results, sometimes as "possibly delisted". So a range without data is only
+    recorded as a miss when the download worked.
+    """
+    name = "yahoo"
+    # Errors of a ticker Yahoo answered for without prices (delisted, before the listing, no trading day)
+    missing_data_errors = ("no price data found", "possibly delisted")
+
+    def __init__(self):
+        import yfinance as yf
+        self.transient_errors = (OSError, yf.exceptions.YFRateLimitError, DownloadError)
+
+    def download(self, tickers, start_date, end_date) -> "pd.DataFrame":
+        import pandas as pd
+        import yfinance as yf
+        tickers = list(tickers)
+        collector = _YahooErrors()
+        logger = logging.getLogger("yfinance")
+        logger.addHandler(collector)
+        try:
+            # https://ranaroussi.github.io/yfinance/reference/api/yfinance.download.html#yfinance.download
+            history = yf.download(tickers, start=start_date, end=end_date)
+        finally:
+            logger.removeHandler(collector)
+
+        failed = {ticker: error for ticker, error in collector.errors.items()
+                  if not any(reason in error for reason in self.missing_data_errors)}
+        if failed:
+            raise DownloadError(f"Yahoo download failed for {', '.join(sorted(failed))}: {next(iter(failed.values()))}")
+        if history is None or history.empty:
+            close = pd.DataFrame()
+        else:
+            close = history['Close']
+            if not hasattr(close, "columns"):
+                # Single ticker without a ticker level in the columns
+                close = close.to_frame(tickers[0])
+        if tickers and close.dropna(how="all").empty:
+            raise DownloadError(f"Yahoo returned no price for any of {', '.join(tickers)} from {start_date} to {end_date}"
+                                + (f": {next(iter(collector.errors.values()))}" if collector.errors else ""))
+        return close
+
+class LocalPriceProvider(PriceProvider):
+    """
+    Read prices from local fixtures, one file per ticker under fixture_path:
+        fixture_path/
+          - MSFT.csv       (Date,Close)
+          - BTC-USD.parquet
+    """
+    name = "local"
+
+    def __init__(self, fixture_path=PRICE_FIXTURE_PATH):
+        self.fixture_path = fixture_path
+        self.series_map = {}
+
+    def _load_series(self, ticker):
+        import pandas as pd
+        if ticker in self.series_map:
+            return self.series_map[ticker]
+
+        series = pd.Series(dtype=float)
+        csv_path = os.path.join(self.fixture_path, f"{ticker}.csv")
+        parquet_path = os.path.join(self.fixture_path, f"{ticker}.parquet")
+        if os.path.exists(parquet_path):
+            df = pd.read_parquet(parquet_path)
+            series = df.set_index(pd.to_datetime(df["Date"]))["Close"]
+        elif os.path.exists(csv_path):
+            df = pd.read_csv(csv_path)
+            series = df.set_index(pd.to_datetime(df["Date"]))["Close"]
+
+        series = series.sort_index()
+        self.series_map[ticker] = series
+        return series
+
+    def download(self, tickers, start_date, end_date) -> "pd.DataFrame":
+        import pandas as pd
+        start, end = pd.Timestamp(start_date), pd.Timestamp(end_date)
+        close = {}
+        for ticker in tickers:
+            series = self._load_series(ticker)
+            close[ticker] = series[(series.index >= start) & (series.index < end)]
+        return pd.DataFrame(close)
+
+PROVIDERS = {
+    YahooPriceProvider.name: YahooPriceProvider,
+    LocalPriceProvider.name: LocalPriceProvider,
+}
+
+_price_provider = None
+
+def get_price_provider() -> PriceProvider:
+    """
+    Get the provider configured by PRICE_PROVIDER in const.py.
+    """
+    global _price_provider
+    if _price_provider is None:
+        if PRICE_PROVIDER not in PROVIDERS:
+            raise ValueError(f"Unknown price provider: {PRICE_PROVIDER}. Use one of {list(PROVIDERS)}.")
+        _price_provider = PROVIDERS[PRICE_PROVIDER]()
+    return _price_provider
+
+def set_price_provider(provider: PriceProvider):
+    """
+    Replace the provider for the rest of the run, e.g. LocalPriceProvider("benchmark/prices/").
+    """
+    global _price_provider
+    _price_provider = provider
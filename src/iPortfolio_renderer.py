@@ -0,0 +1,79 @@
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from const import RENDER_WORKERS
+
+TABLE_JOB = "table"                                          # data: DataFrame
+LINE_CHART_JOB = "line_chart"                                # data: kwargs of Plotter._plot_line_chart_util
+LINE_CHART_WITH_ALL_DATES_JOB = "line_chart_with_all_dates"  # data: kwargs of Plotter._plot_line_chart_with_all_dates_util
+
+# title is the table title, or the time_str of a chart
+RenderJob = namedtuple("RenderJob", ["kind", "data", "filename", "title"])
+
+class RenderError(Exception):
+    pass
+
+def _init_worker():
+    import matplotlib
+    matplotlib.use("Agg")
+
+def render_job(job: RenderJob) -> float:
+    """
+    Render one job in the current process and return the time it took in seconds.
+    """
+    # Imported here, the plotter and the dashboard import RenderJob from this module
+    from iPortfolio_dashboard import AssetDashboard
+    from iPortfolio_plotter import Plotter
+
+    start = time.perf_counter()
+    if job.kind == TABLE_JOB:
+        AssetDashboard().save_df_as_png(ori_df=job.data, filename=job.filename, title=job.title)
+    elif job.kind == LINE_CHART_JOB:
+        Plotter()._plot_line_chart_util(file_name=job.filename, time_str=job.title, **job.data)
+    elif job.kind == LINE_CHART_WITH_ALL_DATES_JOB:
+        Plotter()._plot_line_chart_with_all_dates_util(file_name=job.filename, time_str=job.title, **job.data)
+    else:
+        raise ValueError(f"Unknown render job: {job.kind}")
+    return time.perf_counter() - start
+
+class Renderer:
+    @staticmethod
+    def render(jobs: list, max_workers=RENDER_WORKERS) -> dict:
+        """
+        Render independent PNG jobs in a process pool with the Agg backend.
+        Every job runs even if another one fails; failures are raised together as a RenderError at the end.
+
+        Parameters:
+        - jobs (list): RenderJob list
+        - max_workers (int): pool size, None for the number of CPUs, 1 to render in this process
+
+        Returns:
+        - dict: {filename: seconds}
+        """
+        timings, failures = {}, {}
+        start = time.perf_counter()
+
+        if max_workers == 1 or len(jobs) <= 1:
+            for job in jobs:
+                try:
+                    timings[job.filename] = render_job(job)
+                    print(f"Rendered {job.filename} in {timings[job.filename]:.2f}s")
+                except Exception as e:
+                    failures[job.filename] = e
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker) as executor:
+                futures = {executor.submit(render_job, job): job for job in jobs}
+                for future in as_completed(futures):
+                    job = futures[future]
+                    try:
+                        timings[job.filename] = future.result()
+                        print(f"Rendered {job.filename} in {timings[job.filename]:.2f}s")
+                    except Exception as e:
+                        failures[job.filename] = e
+
+        print(f"Rendered {len(timings)}/{len(jobs)} PNG(s) in {time.perf_counter() - start:.2f}s")
+        if failures:
+            for filename, e in failures.items():
+                print(f"Error rendering {filename}: {e}")
+            raise RenderError(f"Failed to render {sorted(failures)}") from next(iter(failures.values()))
+        return timings
@@ -0,0 +1,138 @@
+import numpy as np
+import pandas as pd
+from enum import Enum
+
+class TRANSACTIONS(Enum):
+    BUY = "buy"
+    SELL = "sell"
+    DIVIDEND = "dividend"
+    TRANSACTION_FEE = "transaction_fee"
+    CRYPTO_FEE = "crypto_fee"
+    INVALID = "invalid"
+
+TRANSACTION_TYPES = [TRANSACTIONS.BUY, TRANSACTIONS.SELL, TRANSACTIONS.DIVIDEND,
+                     TRANSACTIONS.TRANSACTION_FEE, TRANSACTIONS.CRYPTO_FEE, TRANSACTIONS.INVALID]
+BUY, SELL, DIVIDEND, TRANSACTION_FEE, CRYPTO_FEE, INVALID = range(len(TRANSACTION_TYPES))
+
+class ReplayEngine:
+    """
+    Replay transactions into stock_data and realized_gains rows in memory.
+
+    Transactions are grouped by ticker. Transaction types and realized gains are computed on whole
+    arrays; the running quantity / average cost basis is a recurrence (every step is rounded to 8 digits),
+    so it is a tight loop over plain floats per ticker, with no SQL in between.
+    The result is the same as replaying the transactions one by one against the database.
+    """
+
+    def __init__(self, split_index):
+        # SplitIndex: the splits between two transactions are found with a binary search
+        self.split_index = split_index
+
+    @staticmethod
+    def classify(costs, quantities):
+        '''
+            cost > 0, quantity > 0: buy, update cost, quantity, cost_basis
+            cost < 0, quantity < 0: sell, update cost, quantity
+            cost < 0, quantity = 0: dividend, update releaized gain
+            cost > 0, quantity = 0: transaction fee, update cost, cost_basis
+            cost == 0, quantity < 0: crypto fee, update quantity, cost_basis
+
+            ------------------------------------------------------------------------------------------
+                            |  cost > 0                 |  cost < 0    |   cost = 0
+            ------------------------------------------------------------------------------------------
+            quantity > 0     |    buy                   |     X        |    X
+            ------------------------------------------------------------------------------------------
+            quantity = 0     |    fee (paid by money)   |  dividend    |    X
+            ------------------------------------------------------------------------------------------
+            quantity < 0     |     X                    |    sell      |    crpto fee (paid by crypto)
+
+            Returns an array of indices into TRANSACTION_TYPES.
+        '''
+        costs, quantities = np.asarray(costs, dtype=float), np.asarray(quantities, dtype=float)
+        return np.select([(costs > 0) & (quantities > 0),
+                          (costs < 0) & (quantities < 0),
+                          (costs < 0) & (quantities == 0),
+                          (costs > 0) & (quantities == 0),
+                          (costs == 0) & (quantities < 0)],
+                         [BUY, SELL, DIVIDEND, TRANSACTION_FEE, CRYPTO_FEE],
+                         default=INVALID)
+
+    def _replay_ticker(self, ticker, dates, costs, quantities, types, initial_state):
+        cost_basis, quantity, prev_date, _ = initial_state
+        cost_bases, totals = [], []
+
+        for date, tran_cost, tran_quantity, transaction_type in zip(dates, costs, quantities, types):
+            # Adjust quantity for splits
+            if ticker in self.split_index:
+                for ratio in self.split_index.ratios_between(ticker, prev_date, date):
+                    quantity *= ratio
+                    cost_basis /= ratio
+
+            if transaction_type == SELL:
+                quantity += tran_quantity
+            elif transaction_type in (BUY, TRANSACTION_FEE, CRYPTO_FEE):
+                total_cost = round(cost_basis * quantity + tran_cost, 8)
+                quantity += tran_quantity
+                cost_basis = round(total_cost / quantity, 8) if quantity != 0 else 0
+            # DIVIDEND only updates realized_gain
+
+            if quantity < 0.00001:
+                quantity = 0
+
+            cost_bases.append(cost_basis)
+            totals.append(quantity)
+            prev_date = date
+
+        return cost_bases, totals
+
+    def replay(self, transactions, initial_states=None):
+        """
+        Parameters:
+        - transactions (list): [(date, ticker, source, cost, quantity), ...] in processing order
+        - initial_states (dict): {ticker: (cost_basis, quantity, prev_date, realized_gain)} stored before the
+          first transaction of the ticker, for replaying a ticker from the middle of its history
+
+        Returns:
+        - stock_data_rows (list): [(date, ticker, cost_basis, total_quantity), ...]
+        - realized_gain_rows (list): [(date, ticker, gain), ...]
+        Both in processing order, to be written with INSERT OR REPLACE (the last row of a day wins).
+        """
+        initial_states = initial_states or {}
+        df = pd.DataFrame(transactions, columns=["date", "ticker", "source", "cost", "quantity"])
+        if df.empty:
+            return [], []
+
+        types = self.classify(df["cost"].to_numpy(), df["quantity"].to_numpy())
+        invalid = np.flatnonzero(types == INVALID)
+        if len(invalid):
+            date, ticker, source, tran_cost, tran_quantity = transactions[invalid[0]]
+            raise ValueError(f"Invalid transaction: {date}, {ticker}, {source}, {tran_cost}, {tran_quantity}")
+        df["type"] = types
+
+        stock_data_rows, realized_gain_rows = [], []
+        for ticker, group in df.groupby("ticker", sort=False):
+            dates = group["date"].tolist()
+            costs, quantities = group["cost"].tolist(), group["quantity"].tolist()
+            group_types = group["type"].to_numpy()
+            initial_state = initial_states.get(ticker, (0, 0, 0, 0))
+
+            cost_bases, totals = self._replay_ticker(ticker, dates, costs, quantities, group_types.tolist(), initial_state)
+            stock_data_rows.extend(zip(dates, [ticker] * len(dates), cost_bases, totals))
+
+            # Realized gain: sell proceeds over the cost basis, or the dividend itself, accumulated over time
+            is_gain = (group_types == SELL) | (group_types == DIVIDEND)
+            if not is_gain.any():
+                continue
+            gain_cost_bases = np.where(group_types == SELL, np.array(cost_bases, dtype=float), 0.0)[is_gain]
+            net_incomes = np.abs(np.array(costs)[is_gain]) - gain_cost_bases * np.abs(np.array(quantities)[is_gain])
+            gains = np.cumsum(np.concatenate(([initial_state[3]], net_incomes)))[1:]
+            gain_dates = [date for date, flag in zip(dates, is_gain) if flag]
+            realized_gain_rows.extend(zip(gain_dates, [ticker] * len(gain_dates), gains.tolist()))
+
+        return stock_data_rows, realized_gain_rows
+
+def replay_partition(split_index, transactions):
+    """
+    Replay one partition of tickers in a worker process, same result as ReplayEngine(split_index).replay(transactions).
+    """
+    return ReplayEngine(split_index).replay(transactions)
@@ -0,0 +1,218 @@
+import numpy as np
+from const import DB_NAME
+from iPortfolio_dbConnection import DbConnection
+from iPortfolio_valuationCube import ValuationCube
+
+PORTFOLIO = "@portfolio"  # owner of the whole-portfolio series (every ticker, without the cash)
+
+class ReturnsEngine:
+    """
+    Vectorized return measures, every function works on arrays with one element per ticker.
+
+    The money-weighted (XIRR) and time-weighted (TWR) returns are computed from flat cash-flow series:
+    one row per (owner, day) with an owner number, so every ticker and the portfolio are solved together,
+    grouped with np.bincount / np.multiply.reduceat instead of one loop per ticker.
+    From the investor's side a transaction of cost c is a flow of -c: buys and fees are paid out,
+    sells and dividends are received, and the value held on the as-of date is the final inflow.
+    """
+
+    @staticmethod
+    def annualized_returns(values, costs, held_days, min_years=1):
+        """
+        (value / cost) ^ (1 / years held) - 1 in %, the years held floored at min_years.
+
+        Parameters:
+        - values, costs (array): current value and cost of each position
+        - held_days (array): days each position was held (ValuationCube.get_held_days)
+
+        Returns:
+        - np.ndarray: annualized return in %, NaN where the cost isn't positive
+        """
+        values, costs = np.asarray(values, dtype=float), np.asarray(costs, dtype=float)
+        years = np.maximum(np.asarray(held_days, dtype=float) / 365.25, min_years)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            returns = ((values / costs) ** (1 / years) - 1) * 100
+        return np.where(costs > 0, returns, np.nan)
+
+    @staticmethod
+    def load_flows(date, db_name=DB_NAME) -> dict:
+        """
+        Net transaction cost of every day with transactions up to date, with the values at the end of that day and
+        of the day before, per ticker and for PORTFOLIO. One grouped scan of the transactions, the values are read
+        from the valuation cube (its prices must be complete, ValuationCube.ensure_fresh()).
+
+        Returns:
+        - dict: owner: (dates, contributions, values, values_before) numpy arrays sorted by date; a held ticker
+          without any price has a NaN value (and so has the portfolio that day), nothing held the day before is 0
+        """
+        db_conn = DbConnection.get_connection(db_name)
+        rows = db_conn.execute("""
+            SELECT ticker, date, SUM(cost) FROM transactions WHERE date <= ?
+            GROUP BY ticker, date ORDER BY ticker, date
+        """, (date,)).fetchall()
+        if not rows:
+            return {}
+
+        cube = ValuationCube.get_instance(db_name)
+        tickers = np.array([row[0] for row in rows])
+        dates = np.array([row[1] for row in rows], dtype="datetime64[D]")
+        contributions = np.array([row[2] for row in rows], dtype=float)
+        date_strings = np.datetime_as_string(dates).tolist()
+        values = cube.get_values(tickers.tolist(), date_strings)
+        values_before = cube.get_values(tickers.tolist(), np.datetime_as_string(dates - 1).tolist())
+
+        flows = {}
+        starts = np.flatnonzero(np.concatenate(([True], tickers[1:] != tickers[:-1])))
+        for start, end in zip(starts, np.append(starts[1:], len(rows))):
+            flows[str(tickers[start])] = (dates[start:end], contributions[start:end], values[start:end],
+                                          values_before[start:end])
+
+        portfolio_dates, inverse = np.unique(dates, return_inverse=True)
+        portfolio_strings = np.datetime_as_string(portfolio_dates).tolist()
+        flows[PORTFOLIO] = (portfolio_dates, np.bincount(inverse, weights=contributions),
+                            cube.get_range(portfolio_strings)["total_value"],
+                            cube.get_range(np.datetime_as_string(portfolio_dates - 1).tolist())["total_value"])
+        return flows
+
+    @staticmethod
+    def _flatten(owners, flows, date, final_values):
+        """
+        Concatenate the series of owners, each followed by its final row on date: no contribution, the final value,
+        and the last value of the series as the value before (the periods without flows chain to V(date) / V(last)).
+
+        Returns:
+        - (owner numbers, days before date, contributions, values, values_before), sorted by owner then date
+        """
+        empty = (np.array([], dtype="datetime64[D]"), np.array([]), np.array([]), np.array([]))
+        series = [flows.get(owner, empty) for owner in owners]
+        as_of = np.datetime64(date, "D")
+        numbers = np.concatenate([np.full(len(dates) + 1, i) for i, (dates, _, _, _) in enumerate(series)])
+        days = np.concatenate([np.append((as_of - dates).astype(float), 0.0) for dates, _, _, _ in series])
+        contributions = np.concatenate([np.append(contributions, 0.0) for _, contributions, _, _ in series])
+        values = np.concatenate([np.append(values, final_value)
+                                 for (_, _, values, _), final_value in zip(series, final_values)])
+        values_before = np.concatenate([np.append(values_before, values[-1] if len(values) else 0.0)
+                                        for _, _, values, values_before in series])
+        return numbers, days, contributions, values, values_before
+
+    @staticmethod
+    def xirr(owners, years, amounts, count, tolerance=1e-9, max_iterations=50):
+        """
+        Internal rate of return of many cash-flow series at once: the rate r with sum(amount * (1 + r) ^ years) = 0,
+        years counted back from the last flow. Newton on x = ln(1 + r) for all the series together, the series
+        Newton can't settle (diverging, flat, overshooting) are bisected on a sign change, also together.
+
+        Parameters:
+        - owners (array): series number of each flow, 0 .. count - 1
+        - years (array): years from each flow to the as-of date (>= 0)
+        - amounts (array): received > 0, paid < 0
+
+        Returns:
+        - np.ndarray: annual rate of each series (0.1 is 10%), NaN without both an inflow and an outflow
+        """
+        owners, years, amounts = np.asarray(owners), np.asarray(years, dtype=float), np.asarray(amounts, dtype=float)
+        inflows = np.bincount(owners, weights=np.maximum(amounts, 0), minlength=count)
+        outflows = np.bincount(owners, weights=np.maximum(-amounts, 0), minlength=count)
+        span = np.bincount(owners, weights=years * (amounts < 0) * -amounts, minlength=count)
+        scale = inflows + outflows
+        valid = (inflows > 0) & (outflows > 0) & (np.bincount(owners, weights=years, minlength=count) > 0)
+
+        def npv(x, mask=None):
+            exponent = np.minimum(x[owners] * years, 700)
+            terms = amounts * np.exp(exponent)
+            if mask is not None:
+                terms = np.where(mask[owners], terms, 0.0)
+            return (np.bincount(owners, weights=terms, minlength=count),
+                    np.bincount(owners, weights=terms * years, minlength=count))
+
+        # Start from the simple return spread over the money-weighted age of the outflows
+        with np.errstate(divide="ignore", invalid="ignore"):
+            x = np.where(valid, np.log(inflows / outflows) / np.maximum(span / outflows, 1 / 365), 0.0)
+        x = np.clip(np.nan_to_num(x), -20, 20)
+        converged = ~valid
+        for _ in range(max_iterations):
+            value, slope = npv(x, ~converged)
+            done = np.abs(value) <= tolerance * scale
+            converged |= done
+            if converged.all():
+                break
+            with np.errstate(divide="ignore", invalid="ignore"):
+                step = np.where(converged | (slope == 0), 0.0, value / slope)
+            step = np.where(np.isfinite(step), step, np.inf)
+            x = np.where(converged, x, np.clip(x - step, -20, 20))
+
+        # Bisection fallback between the bounds, where the present value changes sign
+        remaining = valid & ~converged
+        if remaining.any():
+            low, high = np.full(count, -20.0), np.full(count, 20.0)
+            low_value = npv(low, remaining)[0]
+            remaining &= np.sign(low_value) != np.sign(npv(high, remaining)[0])
+            for _ in range(100):
+                middle = (low + high) / 2
+                middle_value = npv(middle, remaining)[0]
+                same_sign = np.sign(middle_value) == np.sign(low_value)
+                low, low_value = np.where(same_sign, middle, low), np.where(same_sign, middle_value, low_value)
+                high = np.where(same_sign, high, middle)
+            x = np.where(remaining, (low + high) / 2, x)
+            converged |= remaining
+        return np.where(valid & converged, np.expm1(x), np.nan)
+
+    @staticmethod
+    def twr(owners, contributions, values, values_before, count):
+        """
+        Time-weighted return of many value series at once, as the chain of the daily returns: money put in
+        counts from the start of its day (an opening buy is measured from the price paid), money taken out
+        (sells, dividends) at the end. Without flows the daily returns telescope, so only the days with flows
+        are needed: from the previous row the period is
+            V(day before) / V(previous) * (V + taken out) / (V(day before) + put in)
+        A period starting from nothing (or from an unknown value) is skipped.
+
+        Parameters:
+        - owners (array): series number of each row, rows sorted by series then date
+        - contributions (array): money put in that day (cost of the transactions), withdrawals < 0
+        - values, values_before (array): value at the end of that day, after the flows, and of the day before
+
+        Returns:
+        - np.ndarray: total return of each series (0.1 is 10%), NaN if no period could be measured
+        """
+        owners = np.asarray(owners)
+        contributions, values = np.asarray(contributions, dtype=float), np.asarray(values, dtype=float)
+        values_before = np.asarray(values_before, dtype=float)
+        first = np.concatenate(([True], owners[1:] != owners[:-1]))
+        previous = np.where(first, 0.0, np.roll(values, 1))
+        held = (previous > 0) & np.isfinite(values_before)
+        start = values_before + np.maximum(contributions, 0)
+        traded = (start > 0) & np.isfinite(values)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            growth = (np.where(held, values_before / previous, 1.0) *
+                      np.where(traded, (values - np.minimum(contributions, 0)) / start, 1.0))
+        starts = np.flatnonzero(first)
+        totals = np.ones(count)
+        totals[owners[starts]] = np.multiply.reduceat(growth, starts)
+        periods = np.bincount(owners, weights=held | traded, minlength=count)
+        return np.where(periods > 0, totals - 1, np.nan)
+
+    @staticmethod
+    def money_and_time_weighted(tickers, final_values, portfolio_value, date, db_name=DB_NAME):
+        """
+        XIRR and TWR in % of every ticker and of the portfolio as of date, from the transactions up to date
+        and the cube values on their days.
+
+        Parameters:
+        - tickers (list): tickers to solve
+        - final_values (array): value of each ticker on date
+        - portfolio_value (float): value of the portfolio (without the cash) on date
+
+        Returns:
+        - (np.ndarray, np.ndarray): XIRR and TWR aligned with tickers, followed by the portfolio
+        """
+        owners = list(tickers) + [PORTFOLIO]
+        flows = ReturnsEngine.load_flows(date, db_name)
+        numbers, days, contributions, values, values_before = ReturnsEngine._flatten(
+            owners, flows, date, list(final_values) + [portfolio_value])
+        # The final row is the value received on date, the transaction rows are paid (buys) or received (sells)
+        final = np.append(numbers[1:] != numbers[:-1], True)
+        amounts = np.where(final, np.nan_to_num(values), -contributions)
+        xirr = ReturnsEngine.xirr(numbers, days / 365, amounts, len(owners))
+        twr = ReturnsEngine.twr(numbers, contributions, values, values_before, len(owners))
+        return xirr * 100, twr * 100
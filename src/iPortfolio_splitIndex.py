@@ -0,0 +1,99 @@
+import csv
+import threading
+from bisect import bisect_right
+import numpy as np
+from const import DB_NAME
+from iPortfolio_dbConnection import DbConnection
+
+class SplitIndex:
+    """
+    Stock splits of every ticker, loaded once per process from the stock_splits table
+    (filled from stock_split.csv by DbPopulator on a full reload).
+
+    Per ticker: the split dates (sorted), their ratios (after_split / before_split) and the cumulative factors
+    cumulative[i] = ratio[0] * ... * ratio[i - 1], cumulative[0] = 1. Between two dates:
+    - ratios_between(): the splits in (from_date, to_date], two binary searches and a slice
+    - factor(): shares held on to_date per share held on from_date, cumulative[j] / cumulative[i]
+
+    The replay applies ratios_between() one ratio at a time (a single split is the ratio itself), so the
+    rounding is the same as applying the splits in order; factor() is for expressing a quantity across splits.
+    """
+    _instances = {}  # db_name: SplitIndex
+    _lock = threading.Lock()
+
+    def __init__(self, splits: dict):
+        """
+        Parameters:
+        - splits (dict): {ticker: [(date, before_split, after_split), ...]}
+        """
+        self.dates, self.ratios, self.cumulative = {}, {}, {}
+        for ticker, rows in splits.items():
+            rows = sorted(rows)
+            self.dates[ticker] = [date for date, _, _ in rows]
+            self.ratios[ticker] = [after_split / before_split for _, before_split, after_split in rows]
+            self.cumulative[ticker] = np.concatenate(([1.0], np.cumprod(self.ratios[ticker])))
+
+    def __contains__(self, ticker):
+        return ticker in self.dates
+
+    @staticmethod
+    def get_instance(db_name=DB_NAME):
+        with SplitIndex._lock:
+            if db_name not in SplitIndex._instances:
+                splits = {}
+                for ticker, date, before_split, after_split in DbConnection.get_connection(db_name).execute(
+                        "SELECT ticker, date, before_split, after_split FROM stock_splits").fetchall():
+                    splits.setdefault(ticker, []).append((date, before_split, after_split))
+                SplitIndex._instances[db_name] = SplitIndex(splits)
+            return SplitIndex._instances[db_name]
+
+    @staticmethod
+    def invalidate():
+        with SplitIndex._lock:
+            SplitIndex._instances.clear()
+
+    @staticmethod
+    def read_csv(file_path) -> dict:
+        """
+        Read stock_split.csv: date, ticker, before_split, after_split.
+
+        Returns:
+        - dict: {ticker: [(date, before_split, after_split), ...]}
+        """
+        splits = {}
+        with open(file_path, newline='') as csvfile:
+            for date, ticker, before_split, after_split in csv.reader(csvfile):
+                splits.setdefault(ticker, []).append((date, float(before_split), float(after_split)))
+        return splits
+
+    @staticmethod
+    def store(db_conn, splits: dict):
+        """
+        Replace the stored splits, inside the caller's transaction.
+        """
+        db_conn.execute("DELETE FROM stock_splits")
+        db_conn.executemany("INSERT INTO stock_splits (ticker, date, before_split, after_split) VALUES (?, ?, ?, ?)",
+                            [(ticker, date, before_split, after_split)
+                             for ticker, rows in splits.items() for date, before_split, after_split in rows])
+        SplitIndex.invalidate()
+
+    def _position(self, ticker, date):
+        # Number of splits on or before date, 0 stands for before any date
+        return 0 if date == 0 else bisect_right(self.dates[ticker], date)
+
+    def ratios_between(self, ticker, from_date, to_date) -> list:
+        """
+        Ratios of the splits after from_date up to to_date included, in date order. from_date 0 means since the start.
+        """
+        if ticker not in self.dates:
+            return []
+        return self.ratios[ticker][self._position(ticker, from_date):self._position(ticker, to_date)]
+
+    def factor(self, ticker, from_date, to_date) -> float:
+        """
+        Shares held on to_date for one share held on from_date (below 1 when to_date is before from_date).
+        """
+        if ticker not in self.dates:
+            return 1.0
+        cumulative = self.cumulative[ticker]
+        return float(cumulative[self._position(ticker, to_date)] / cumulative[self._position(ticker, from_date)])
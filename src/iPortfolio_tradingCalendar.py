@@ -0,0 +1,142 @@
+import os
+import threading
+import numpy as np
+from importlib import metadata
+from datetime import date as date_cls, datetime
+from const import TRADING_CALENDAR_PATH, MARKET_CLOSED_DATES
+
+class TradingCalendar:
+    """
+    Precomputed trading sessions of a market.
+
+    The session set of each year is computed once with pandas_market_calendars and persisted to
+    TRADING_CALENDAR_PATH as a 366-bit bitset (one bit per day of the year), the file name carries the version
+    of pandas_market_calendars so an upgrade (new holidays) recomputes it. In memory every year keeps
+    the open flags, the sorted session ordinals and a running session count per day, so
+    is_market_open, previous/next trading day and trading-day ranges are array lookups.
+
+    Extra closures that the calendar library doesn't know (e.g. 2025-01-09) are listed in
+    MARKET_CLOSED_DATES and applied on load, so changing them doesn't need a cache rebuild.
+    A year is loaded (and its file written) under a lock, the instances can be shared by several threads.
+    """
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, market="NYSE", cache_path=TRADING_CALENDAR_PATH):
+        self.market = market
+        self.cache_path = cache_path
+        self.closed_dates = {date_cls.fromisoformat(d) for d in MARKET_CLOSED_DATES.get(market, [])}
+        self.years = {}  # year: (is_open, sessions, session_count)
+        self._lock = threading.Lock()
+        self._library_version = None
+
+    @staticmethod
+    def get_instance(market="NYSE"):
+        with TradingCalendar._instances_lock:
+            if market not in TradingCalendar._instances:
+                TradingCalendar._instances[market] = TradingCalendar(market)
+            return TradingCalendar._instances[market]
+
+    @staticmethod
+    def _to_date(date):
+        if isinstance(date, str):
+            return date_cls.fromisoformat(date[:10])
+        if isinstance(date, datetime):
+            return date.date()
+        return date
+
+    def _cache_file(self, year):
+        # Read from the package metadata, importing pandas_market_calendars would import pandas
+        if self._library_version is None:
+            self._library_version = metadata.version("pandas_market_calendars")
+        return os.path.join(self.cache_path, f"{self.market}_{year}_{self._library_version}.npy")
+
+    def _compute_year(self, year):
+        """
+        Build the open flags of a year with pandas_market_calendars, index 0 is January 1st.
+        """
+        import pandas_market_calendars as mcal
+
+        schedule = mcal.get_calendar(self.market).schedule(start_date=f"{year}-01-01", end_date=f"{year}-12-31")
+        is_open = np.zeros(366, dtype=bool)
+        start_ordinal = date_cls(year, 1, 1).toordinal()
+        for session in schedule.index:
+            is_open[session.date().toordinal() - start_ordinal] = True
+        return is_open
+
+    def _load_year(self, year):
+        if year in self.years:
+            return self.years[year]
+        with self._lock:
+            if year not in self.years:
+                self.years[year] = self._read_year(year)
+            return self.years[year]
+
+    def _read_year(self, year):
+        cache_file = self._cache_file(year)
+        if os.path.exists(cache_file):
+            is_open = np.unpackbits(np.load(cache_file))[:366].astype(bool)
+        else:
+            is_open = self._compute_year(year)
+            os.makedirs(self.cache_path, exist_ok=True)
+            # Written aside and renamed, another process never reads a partial file
+            temp_file = f"{cache_file}.{os.getpid()}.tmp"
+            with open(temp_file, "wb") as f:
+                np.save(f, np.packbits(is_open))
+            os.replace(temp_file, cache_file)
+
+        start_ordinal = date_cls(year, 1, 1).toordinal()
+        for closed_date in self.closed_dates:
+            if closed_date.year == year:
+                is_open[closed_date.toordinal() - start_ordinal] = False
+
+        sessions = np.flatnonzero(is_open) + start_ordinal
+        session_count = np.cumsum(is_open)  # number of sessions on or before each day
+        return is_open, sessions, session_count
+
+    def is_market_open(self, date):
+        date = self._to_date(date)
+        is_open, _, _ = self._load_year(date.year)
+        return bool(is_open[date.timetuple().tm_yday - 1])
+
+    def previous_trading_day(self, date):
+        """
+        The last trading day strictly before date, as a "YYYY-MM-DD" string.
+        """
+        date = self._to_date(date)
+        year = date.year
+        is_open, sessions, session_count = self._load_year(year)
+        day = date.timetuple().tm_yday - 1
+        count_before = session_count[day] - is_open[day]
+        while count_before == 0:
+            year -= 1
+            _, sessions, session_count = self._load_year(year)
+            count_before = len(sessions)
+        return date_cls.fromordinal(int(sessions[count_before - 1])).strftime("%Y-%m-%d")
+
+    def next_trading_day(self, date):
+        """
+        The first trading day strictly after date, as a "YYYY-MM-DD" string.
+        """
+        date = self._to_date(date)
+        year = date.year
+        _, sessions, session_count = self._load_year(year)
+        count = session_count[date.timetuple().tm_yday - 1]
+        while count >= len(sessions):
+            year += 1
+            _, sessions, _ = self._load_year(year)
+            count = 0
+        return date_cls.fromordinal(int(sessions[count])).strftime("%Y-%m-%d")
+
+    def trading_days(self, start_date, end_date):
+        """
+        All trading days in [start_date, end_date], both included, as "YYYY-MM-DD" strings.
+        """
+        start_date, end_date = self._to_date(start_date), self._to_date(end_date)
+        result = []
+        for year in range(start_date.year, end_date.year + 1):
+            _, sessions, _ = self._load_year(year)
+            low = np.searchsorted(sessions, start_date.toordinal(), side="left")
+            high = np.searchsorted(sessions, end_date.toordinal(), side="right")
+            result.extend(date_cls.fromordinal(int(o)).strftime("%Y-%m-%d") for o in sessions[low:high])
+        return result
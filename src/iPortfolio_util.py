@@ -1,19 +1,16 @@
-import sqlite3
-import pandas as pd
-import yfinance as yf
+from iPortfolio_logger import Logger
 from datetime import datetime, timedelta
-import pandas_market_calendars as mcal
+from iPortfolio_tradingCalendar import TradingCalendar
 from const_private import *
 from const import *
 import pytz
+from iPortfolio_dbConnection import DbConnection
 import os
 import inspect
 
-TEMP_PRICE_MAP = {} # DATE: {TICKER: PRICE}
-
 class PortfolioDisplayerUtil:
-    def __init__(self, db_name="portfolio.db", debug=False):
-        self.conn = sqlite3.connect(db_name)
+    def __init__(self, db_name=DB_NAME, debug=False):
+        self.conn = DbConnection.get_connection(db_name)
         self.debug = debug
 
     def log(self, message):
@@ -77,54 +74,12 @@ class PortfolioDisplayerUtil:
     def fetch_and_store_price(self, ticker, date):
         """
         从 Yahoo Finance 获取指定日期的股票价格，并存储到 daily_prices 表。
+        Goes through DbAccessor, so the price is also cached, remembered when missing and written into the valuation cube.
         """
-        # Check if the ticker and date already exist in the daily_prices table
-        query = "SELECT price FROM daily_prices WHERE ticker = ? AND date = ?"
-
-        # if ticker is crypto and date is in TEMP_PRICE_MAP, return the price
-        if ticker in CRYPTO_TICKERS and date in TEMP_PRICE_MAP:
-            if ticker in TEMP_PRICE_MAP[date]:
-                return TEMP_PRICE_MAP[date][ticker]
-
-        # if ticker is not crypto, check the db
-        result = self.conn.execute(query, (ticker, date)).fetchone()
-        if result:
-            return result[0]
-        
-        # fetch the price from Yahoo Finance
-        try:
-            date_obj = datetime.strptime(date, "%Y-%m-%d")
-            start_date = (date_obj - timedelta(days=7)).strftime("%Y-%m-%d")
-            end_date = (date_obj + timedelta(days=1)).strftime("%Y-%m-%d")
-
-
-            self.log(f"Fetching price for {ticker} on {date}...")
-            history = yf.download(ticker, start_date, end_date)
-            if not history.empty:
-                # Get the last valid price and date
-                price_series = history['Close']
-                last_valid_price = list(round(price_series.iloc[-1], 8))[0]
-                last_valid_date = price_series.index[-1].strftime("%Y-%m-%d")
-
-                # if market is close and ticker is not crypto, save the date, price to db
-                is_market_open = Util.is_market_open(date)
-                if is_market_open == False and ticker not in CRYPTO_TICKERS:
-                    self.log(f"Market is closed on {date}, saving the last valid price {last_valid_price} on {date}")
-                    with self.conn:
-                        self.conn.execute("INSERT OR REPLACE INTO daily_prices (date, ticker, price) VALUES (?, ?, ?)",
-                                        (date, ticker, last_valid_price))
-                else:
-                    self.log(f"Market is open on {date}, saving the last valid price {last_valid_price} on {last_valid_date}")
-                    with self.conn:
-                        self.conn.execute("INSERT OR REPLACE INTO daily_prices (date, ticker, price) VALUES (?, ?, ?)",
-                                        (last_valid_date, ticker, last_valid_price))
-                return last_valid_price
-            self.log(f"No price data found for {ticker} on {date}")
-            return None
-
-        except Exception as e:
-            self.log(f"Error fetching price for {ticker} on {date}: {e}")
-            return None
+        # Imported here, DbAccessor imports this module
+        from iPortfolio_dbAccessor import DbAccessor
+        with self.conn:
+            return DbAccessor._fetch_and_store_price_helper(self.conn, ticker, date)
 
     def fetch_and_store_prices_for_multiple_dates(self, ticker, dates):
         """
@@ -168,98 +123,36 @@ class PortfolioDisplayerUtil:
             print(f"Cleared daily_prices records {'before' if before else 'after'} {date}")
 
 class Util:
+    _unpriced = set()  # (ticker, date) already reported by warn_unpriced
+
     @staticmethod
     def log(message):
         if DBUG:
             print(message)
 
+    @staticmethod
+    def warn_unpriced(ticker, dates):
+        """
+        Report the held days of ticker that have no price, once per (ticker, date) in the process.
+        Their value is left NaN instead of 0, so a missing price doesn't show as a loss.
+        """
+        dates = sorted(date for date in set(dates) if (ticker, date) not in Util._unpriced)
+        if not dates:
+            return
+        Util._unpriced.update((ticker, date) for date in dates)
+        message = f"No price for {ticker} on {len(dates)} held day(s) from {dates[0]} to {dates[-1]}, not valued"
+        print(message)
+        Util.log_to_file(__file__, inspect.currentframe().f_lineno, "WARNING", message)
+
     @staticmethod
     def fetch_and_store_price(ticker, date):
         """
         从 Yahoo Finance 获取指定日期的股票价格，并存储到 daily_prices 表。
+        Goes through DbAccessor, so the price is also cached, remembered when missing and written into the valuation cube.
         """
-        with sqlite3.connect("portfolio.db") as db_conn:
-            # if  date is in TEMP_PRICE_MAP, return the price
-            if date in TEMP_PRICE_MAP:
-                if ticker in TEMP_PRICE_MAP[date]:
-                    return TEMP_PRICE_MAP[date][ticker]
-            
-            # Check if the ticker and date already exist in the daily_prices table
-            query = "SELECT price FROM daily_prices WHERE ticker = ? AND date = ?"
-            result = db_conn.execute(query, (ticker, date)).fetchone()
-            if result:
-                return result[0]
-        
-            # fetch the price from Yahoo Finance
-            try:
-                print(f"Fetching price for {ticker} on {date}...")
-                date_obj = datetime.strptime(date, "%Y-%m-%d")
-                start_date = (date_obj - timedelta(days=7)).strftime("%Y-%m-%d")
-                end_date = (date_obj + timedelta(days=1)).strftime("%Y-%m-%d")
-                Util.log(f"start_date: {start_date}, end_date: {end_date}")
-                # ticker = "VOO"
-                # yf.download [start_date, end_date), start_date is included, end_date is excluded
-                # https://ranaroussi.github.io/yfinance/reference/api/yfinance.download.html#yfinance.download
-                Util.log(f"Fetching price for {ticker} on {start_date} to {end_date}")
-                history = yf.download(ticker, start=start_date, end=end_date)
-                Util.log(f"history: {history}")
-                if not history.empty:
-                    # Get the last valid price and date
-                    # Util.log(f"hitory: {history}")
-                    price_series = history['Close']
-                    last_valid_price = list(round(price_series.iloc[-1], 8))[0]
-                    last_valid_date = price_series.index[-1].strftime("%Y-%m-%d")
-
-                    # if market is close and ticker is not crypto, save the date, price to db
-                    """
-                    If it's crypto, only save price if today > date, otherwise price will fetch on the fly 
-                    If it's not crypto, check if it's market open.
-                        if market is close, means this date will NOT have price data, 
-                            then just save the last open date, price to db
-                        if market is open, means this date will HAVE price data. So the data must be fetched after close.
-                            The price data on last 7 days will be fetched,
-                            and the lastest price will be today's price if today is already closed, 
-                            otherwise the last open date price will be saved.
-                    """
-                    if ticker in CRYPTO_TICKERS:
-                        # if it's crypto, only save price if today > date, otherwise price will fetch on the fly
-                        today = Util.get_today_est_str()
-                        if today > date:
-                            Util.log(f"Saving the last valid price {last_valid_price} on {date}")
-                            with db_conn:
-                                db_conn.execute("INSERT OR REPLACE INTO daily_prices (date, ticker, price) VALUES (?, ?, ?)",
-                                                (date, ticker, last_valid_price))
-                        else:
-                            Util.log(f"Today is not closed yet, will not save the price data ({last_valid_price}) for {ticker} on {date}")
-                            # update the TEMP_PRICE_MAP
-                            if date not in TEMP_PRICE_MAP:
-                                TEMP_PRICE_MAP[date] = {}
-                            TEMP_PRICE_MAP[date][ticker] = last_valid_price
-                    else:
-                        is_market_open = Util.is_market_open(date)
-                        if is_market_open == False:
-                            # if market is close and ticker is not crypto, save the date, price to db
-                            Util.log(f"Market is closed on {date}, saving the last valid price {last_valid_price} on {date}")
-                            with db_conn:
-                                db_conn.execute("INSERT OR REPLACE INTO daily_prices (date, ticker, price) VALUES (?, ?, ?)",
-                                                (date, ticker, last_valid_price))
-                        else:
-                            # if market is open, save the last valid price and date
-                            Util.log(f"Market is open on {date}, saving the last valid price {last_valid_price} on {last_valid_date}")
-                            if date not in TEMP_PRICE_MAP:
-                                TEMP_PRICE_MAP[date] = {}
-                            TEMP_PRICE_MAP[date][ticker] = last_valid_price
-                            with db_conn:
-                                db_conn.execute("INSERT OR REPLACE INTO daily_prices (date, ticker, price) VALUES (?, ?, ?)",
-                                                (last_valid_date, ticker, last_valid_price))
-
-                    return last_valid_price
-                Util.log(f"No price data found for {ticker} on {date}")
-                return None
-
-            except Exception as e:
-                Util.log(f"Error fetching price for {ticker} on {date}: {e}")
-                return None
+        # Imported here, DbAccessor imports this module
+        from iPortfolio_dbAccessor import DbAccessor
+        return DbAccessor.fetch_and_store_price(ticker, date)
 
     # @staticmethod
     # def fetch_and_store_prices_for_multiple_dates(db_conn, ticker, dates):
@@ -339,7 +232,7 @@ class Util:
     def is_market_open(date, market="NYSE"):
         """
         Check if the given date is a market open day.
-        Note: 2025-01-09 is closed.
+        Closures missing from the market calendar (e.g. 2025-01-09) are listed in MARKET_CLOSED_DATES.
 
         Parameters:
             date (str): The date in 'YYYY-MM-DD' format to check.
@@ -348,20 +241,8 @@ class Util:
         Returns:
             bool: True if the market is open on the given date, False otherwise.
         """
-        if date == "2025-01-09":
-            return False
         try:
-            # Parse the input date
-            date = pd.Timestamp(date)
-
-            # Get the market calendar
-            market_calendar = mcal.get_calendar(market)
-
-            # Get the market schedule for the year of the given date
-            schedule = market_calendar.schedule(start_date=date.strftime('%Y-01-01'), end_date=date.strftime('%Y-12-31'))
-
-            # Check if the market is open on the given date
-            return date in schedule.index
+            return TradingCalendar.get_instance(market).is_market_open(date)
         except Exception as e:
             print(f"Error: {e}")
             return False
@@ -420,23 +301,12 @@ class Util:
     def log_to_file(file, line, category, message):
         """
         Logs a message to a log file with the specified file, line, category, and message.
+        The record is queued for the background writer of Logger (JSON lines in LOG_FILE), categories below LOG_LEVEL are skipped.
 
         Parameters:
         - file (str): The file where the log is generated.
         - line (int): The line number where the log is generated.
-        - category (str): The category of the log.
+        - category (str): The category of the log: DEBUG, INFO, WARNING or ERROR.
         - message (str): The log message.
         """
-        log_dir = "logs"
-        log_file = os.path.join(log_dir, "application.log")
-
-        # Ensure the log directory exists
-        if not os.path.exists(log_dir):
-            os.makedirs(log_dir)
-
-        # Format the log entry
-        log_entry = f"[{Util.get_today_est_str()}] {file}:{line} [{category}] {message}\n"
-
-        # Write the log entry to the file
-        with open(log_file, "a") as f:
-            f.write(log_entry)
+        Logger.get_instance().log(category, message, file=file, line=line)
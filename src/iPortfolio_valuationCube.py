@@ -0,0 +1,386 @@
+import os
+import json
+import threading
+import numpy as np
+from const import DB_NAME, VALUATION_CUBE_PATH, VALUATION_CUBE_SPARE_DAYS
+from iPortfolio_positionIndex import PositionIndex
+from iPortfolio_util import Util
+
+CUBE_VERSION = 2
+ARRAYS = ("price", "quantity", "cost_basis", "realized")
+
+class ValuationCube:
+    """
+    On-disk dates × tickers arrays of the portfolio, opened memory-mapped (np.load(mmap_mode=...)), so a new
+    process reads the positions and prices of any day without loading stock_data or querying daily_prices.
+
+    VALUATION_CUBE_PATH/<db name>/ holds:
+    - meta.json: version, generation, first day, number of days (one row per calendar day, through today) and of
+      rows allocated, tickers (one column each) with their first / last stock_data dates, and the live date
+    - price_<generation>.npy: the resolved price of the cell, NaN where none was looked up yet (forward-filled on read)
+    - quantity_, cost_basis_, realized_<generation>.npy: the as-of values of stock_data / realized_gains
+
+    DbPopulator rebuilds the cube after every commit that changes the positions (build(), the known prices are
+    carried over, a cleared table only marks it stale), and DbAccessor writes every price it resolves into the
+    mapped price array (update_prices()).
+    A rebuild writes a new generation and then replaces meta.json, so a reader never sees half a cube.
+    Every generation has VALUATION_CUBE_SPARE_DAYS spare rows: a new day only fills the next rows in place with the
+    positions of the last day (extend()), the first run of the day opens the cube without reading stock_data.
+    The prices of the live date (today when they were fetched) are asked again by the next ensure_fresh().
+    """
+    _instances = {}  # db_name: ValuationCube
+    _refreshed = set()  # db_name whose prices were completed in this process
+    _lock = threading.RLock()
+
+    def __init__(self, path, meta):
+        self.path = path
+        self.meta = meta
+        self.tickers = meta["tickers"]
+        self.columns = {ticker: column for column, ticker in enumerate(self.tickers)}
+        self.start = np.datetime64(meta["start_date"], "D")
+        self.days = meta["days"]
+        # Only the prices are written in place, the positions change with a new generation (or extend()).
+        # The views stop at the last day, the spare rows after it aren't part of the cube yet
+        self.price = np.load(self._file(path, "price", meta["generation"]), mmap_mode="r+")[:self.days]
+        self.quantity, self.cost_basis, self.realized = (
+            np.load(self._file(path, name, meta["generation"]), mmap_mode="r")[:self.days] for name in ARRAYS[1:])
+        self._filled_price = None
+
+    @staticmethod
+    def _directory(db_name):
+        return os.path.join(VALUATION_CUBE_PATH, os.path.splitext(os.path.basename(db_name))[0])
+
+    @staticmethod
+    def _file(path, name, generation):
+        return os.path.join(path, f"{name}_{generation}.npy")
+
+    @staticmethod
+    def _read_meta(path):
+        try:
+            with open(os.path.join(path, "meta.json")) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return meta if meta.get("version") == CUBE_VERSION else None
+
+    @staticmethod
+    def _write_meta(path, meta):
+        temporary = os.path.join(path, "meta.json.tmp")
+        with open(temporary, "w") as f:
+            json.dump(meta, f)
+        os.replace(temporary, os.path.join(path, "meta.json"))
+
+    @staticmethod
+    def _open(db_name):
+        # The cube already on disk, or None
+        path = ValuationCube._directory(db_name)
+        meta = ValuationCube._read_meta(path)
+        if meta is None:
+            return None
+        try:
+            return ValuationCube(path, meta)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def get_instance(db_name=DB_NAME):
+        """
+        Open the cube of db_name, extended through today if it ends before, built first if there is none, if it is
+        stale or if it has no spare rows left.
+        """
+        with ValuationCube._lock:
+            cube = ValuationCube._instances.get(db_name) or ValuationCube._open(db_name)
+            today = Util.get_today_est_str()
+            if cube is not None and not cube.meta.get("stale") and cube.meta["end_date"] < today:
+                cube = ValuationCube.extend(cube, today)
+            if cube is None or cube.meta.get("stale"):
+                cube = ValuationCube.build(db_name)
+            ValuationCube._instances[db_name] = cube
+            return cube
+
+    @staticmethod
+    def build(db_name=DB_NAME):
+        """
+        Write a new generation from stock_data / realized_gains, from the first transaction through today,
+        keeping the prices of the previous generation.
+        """
+        with ValuationCube._lock:
+            positions = PositionIndex.get_instance() if db_name == DB_NAME else PositionIndex(db_name)
+            path = ValuationCube._directory(db_name)
+            old_meta = ValuationCube._read_meta(path)
+            previous = ValuationCube._instances.pop(db_name, None) or ValuationCube._open(db_name)
+
+            tickers = sorted(positions.get_all_tickers())
+            first_dates = [positions.positions[ticker][0][0] for ticker in tickers]
+            last_dates = [positions.positions[ticker][0][-1] for ticker in tickers]
+            today = Util.get_today_est_str()
+            start, end = np.datetime64(min(first_dates + [today]), "D"), np.datetime64(max(last_dates + [today]), "D")
+            dates = np.datetime_as_string(np.arange(start, end + 1))
+
+            capacity = len(dates) + VALUATION_CUBE_SPARE_DAYS
+            arrays = {name: np.zeros((capacity, len(tickers))) for name in ARRAYS}
+            arrays["price"][:] = np.nan
+            for column, ticker in enumerate(tickers):
+                arrays["quantity"][:len(dates), column] = positions.get_stock_quantities(ticker, dates)
+                arrays["cost_basis"][:len(dates), column] = positions.get_cost_bases(ticker, dates)
+                arrays["realized"][:len(dates), column] = positions.get_realized_gains(ticker, dates)
+
+            live_date = today
+            if previous is not None:
+                # Carry the prices over, on the days and tickers both generations have
+                offset = int((previous.start - start).astype(int))
+                rows = np.arange(max(0, offset), min(len(dates), offset + previous.days))
+                common = [(column, previous.columns[ticker]) for column, ticker in enumerate(tickers)
+                          if ticker in previous.columns]
+                if len(rows) and common:
+                    new_columns, old_columns = (list(columns) for columns in zip(*common))
+                    arrays["price"][np.ix_(rows, new_columns)] = previous.price[np.ix_(rows - offset, old_columns)]
+                live_date = min(previous.meta["live_date"], today)
+
+            generation = old_meta["generation"] + 1 if old_meta else 1
+            os.makedirs(path, exist_ok=True)
+            for name, array in arrays.items():
+                np.save(ValuationCube._file(path, name, generation), array)
+            meta = {"version": CUBE_VERSION, "generation": generation,
+                    "start_date": str(start), "end_date": str(end), "days": len(dates), "capacity": capacity,
+                    "tickers": tickers, "first_dates": first_dates, "last_dates": last_dates,
+                    "live_date": live_date}
+            ValuationCube._write_meta(path, meta)
+
+            # Drop the previous generation, a reader still mapping it keeps its pages until it closes them
+            previous = None
+            for file_name in os.listdir(path):
+                if file_name.endswith(".npy") and not file_name.endswith(f"_{generation}.npy"):
+                    try:
+                        os.remove(os.path.join(path, file_name))
+                    except OSError:
+                        pass
+
+            cube = ValuationCube(path, meta)
+            ValuationCube._instances[db_name] = cube
+            ValuationCube._refreshed.discard(db_name)
+            print(f"Built the valuation cube: {len(dates)} day(s) × {len(tickers)} ticker(s)")
+            return cube
+
+    @staticmethod
+    def extend(cube, end_date):
+        """
+        Add the days through end_date to the generation of cube, in its spare rows: the positions of the last day
+        carried forward (they didn't change, DbPopulator rebuilds the cube when they do), no price yet.
+        A reader of the generation still on the previous meta.json only sees its own days.
+
+        Returns:
+        - ValuationCube: the extended cube, or None if end_date is past the spare rows
+        """
+        with ValuationCube._lock:
+            days = int((np.datetime64(end_date, "D") - cube.start).astype(int)) + 1
+            if days > cube.meta.get("capacity", cube.days):
+                return None
+            for name in ARRAYS[1:]:
+                array = np.load(ValuationCube._file(cube.path, name, cube.meta["generation"]), mmap_mode="r+")
+                array[cube.days:days] = array[cube.days - 1]
+                array.flush()
+            meta = dict(cube.meta, end_date=end_date, days=days)
+            ValuationCube._write_meta(cube.path, meta)
+            return ValuationCube(cube.path, meta)
+
+    @staticmethod
+    def invalidate(db_name=DB_NAME):
+        """
+        Mark the positions of the cube out of date (a table was cleared), the next get_instance() rebuilds it.
+        """
+        with ValuationCube._lock:
+            ValuationCube._instances.pop(db_name, None)
+            path = ValuationCube._directory(db_name)
+            meta = ValuationCube._read_meta(path)
+            if meta is not None and not meta.get("stale"):
+                meta["stale"] = True
+                ValuationCube._write_meta(path, meta)
+
+    @staticmethod
+    def update_prices(prices: dict, db_name=DB_NAME):
+        """
+        Write resolved prices into the cube, if there is one; cells outside of it are skipped.
+
+        Parameters:
+        - prices (dict): {ticker: {date: price}}, None prices are skipped
+        """
+        with ValuationCube._lock:
+            cube = ValuationCube._instances.get(db_name) or ValuationCube._open(db_name)
+            if cube is None:
+                return
+            ValuationCube._instances[db_name] = cube
+            written = 0
+            for ticker, date_prices in prices.items():
+                if ticker not in cube.columns:
+                    continue
+                cells = [(date, price) for date, price in date_prices.items() if price is not None]
+                if not cells:
+                    continue
+                rows = (np.array([date for date, _ in cells], dtype="datetime64[D]") - cube.start).astype(int)
+                inside = (rows >= 0) & (rows < cube.days)
+                cube.price[rows[inside], cube.columns[ticker]] = np.array([price for _, price in cells])[inside]
+                written += int(inside.sum())
+            if written:
+                cube.price.flush()
+                cube._filled_price = None
+
+    @staticmethod
+    def clear_prices(date, db_name=DB_NAME):
+        """
+        Forget the prices of date (daily_prices deleted), they are looked up again by the next ensure_fresh().
+        """
+        with ValuationCube._lock:
+            cube = ValuationCube._instances.get(db_name) or ValuationCube._open(db_name)
+            if cube is None:
+                return
+            row = int((np.datetime64(date, "D") - cube.start).astype(int))
+            if 0 <= row < cube.days:
+                cube.price[row, :] = np.nan
+                cube.price.flush()
+                cube._filled_price = None
+            ValuationCube._refreshed.discard(db_name)
+
+    @staticmethod
+    def ensure_fresh(db_name=DB_NAME):
+        """
+        Once per run, look up the prices of the held cells without one, and again the prices of the live date
+        onwards (they were live, or are today's). The lookups go through DbAccessor, which writes them back.
+        """
+        # Imported here, DbAccessor writes its prices into the cube through this module
+        from iPortfolio_dbAccessor import DbAccessor
+
+        cube = ValuationCube.get_instance(db_name)
+        if db_name in ValuationCube._refreshed:
+            return cube
+        live_row = int((np.datetime64(cube.meta["live_date"], "D") - cube.start).astype(int))
+        missing = (np.asarray(cube.quantity) != 0) & np.isnan(cube.price)
+        missing[max(live_row, 0):] |= np.asarray(cube.quantity[max(live_row, 0):]) != 0
+        dates = np.datetime_as_string(cube.start + np.arange(cube.days))
+        ticker_dates = {ticker: dates[missing[:, column]].tolist() for column, ticker in enumerate(cube.tickers)
+                        if missing[:, column].any()}
+        if ticker_dates:
+            DbAccessor.bulk_fetch_and_store_prices(ticker_dates)
+
+        with ValuationCube._lock:
+            cube = ValuationCube.get_instance(db_name)
+            cube.meta["live_date"] = Util.get_today_est_str()
+            ValuationCube._write_meta(cube.path, cube.meta)
+            ValuationCube._refreshed.add(db_name)
+        return cube
+
+    def _rows(self, dates):
+        # Row of each date, -1 before the first day, the last row after the last day (as-of)
+        rows = (np.asarray(dates, dtype="datetime64[D]") - self.start).astype(int)
+        return np.where(rows < 0, -1, np.minimum(rows, self.days - 1))
+
+    def _row(self, date):
+        return int(self._rows([date])[0])
+
+    def filled_prices(self) -> np.ndarray:
+        """
+        The price array forward-filled down every column, kept until the next price update.
+        """
+        if self._filled_price is None:
+            price = np.asarray(self.price)
+            last_rows = np.where(np.isnan(price), 0, np.arange(self.days)[:, None])
+            np.maximum.accumulate(last_rows, axis=0, out=last_rows)
+            self._filled_price = price[last_rows, np.arange(len(self.tickers))]
+        return self._filled_price
+
+    def _valuation(self, rows, columns):
+        # Value and cost of the cells, nothing before the first day or where nothing is held;
+        # a held cell without any price is NaN, and so are the totals of its day
+        quantity = np.where(rows[:, None] >= 0, self.quantity[np.ix_(rows, columns)], 0.0)
+        held = quantity != 0
+        price = np.where(rows[:, None] >= 0, self.filled_prices()[np.ix_(rows, columns)], np.nan)
+        unpriced = held & np.isnan(price)
+        for index in np.flatnonzero(unpriced.any(axis=0)):
+            Util.warn_unpriced(self.tickers[columns[index]],
+                               np.datetime_as_string(self.start + rows[unpriced[:, index]]).tolist())
+        value = np.where(held, price * quantity, 0.0)
+        cost = np.where(held, self.cost_basis[np.ix_(rows, columns)] * quantity, 0.0)
+        realized = np.where(rows[:, None] >= 0, self.realized[np.ix_(rows, columns)], 0.0)
+        return quantity, price, value, cost, realized
+
+    def get_values(self, tickers, dates) -> np.ndarray:
+        """
+        Value of each (ticker, date) pair, the two lists side by side: 0 where the ticker isn't held (or unknown),
+        NaN where it is held without any price.
+        """
+        rows = self._rows(dates)
+        columns = np.array([self.columns.get(ticker, -1) for ticker in tickers], dtype=int)
+        valid = (rows >= 0) & (columns >= 0)
+        rows, columns = np.where(valid, rows, 0), np.where(valid, columns, 0)
+        quantity = np.where(valid, np.asarray(self.quantity)[rows, columns], 0.0)
+        price = self.filled_prices()[rows, columns]
+        unpriced = (quantity != 0) & np.isnan(price)
+        for column in np.unique(columns[unpriced]):
+            Util.warn_unpriced(self.tickers[column], np.datetime_as_string(
+                self.start + rows[unpriced & (columns == column)]).tolist())
+        return np.where(quantity != 0, price * quantity, 0.0)
+
+    def get_range(self, dates) -> dict:
+        """
+        The portfolio (without the cash) on dates.
+
+        Returns:
+        - dict: total_value, total_cost, unrealized, realized numpy arrays aligned with dates
+        """
+        rows = self._rows(dates)
+        _, _, value, cost, realized = self._valuation(rows, np.arange(len(self.tickers)))
+        total_value, total_cost = value.sum(axis=1), cost.sum(axis=1)
+        return {"total_value": total_value, "total_cost": total_cost,
+                "unrealized": total_value - total_cost, "realized": realized.sum(axis=1)}
+
+    def get_ticker_range(self, ticker, dates) -> dict:
+        """
+        One ticker on dates, zeros before the first day of the cube; the price is also known on the days it isn't held.
+
+        Returns:
+        - dict: quantity, cost_basis, price, value, cost, unrealized, realized numpy arrays aligned with dates
+        """
+        names = ["quantity", "cost_basis", "price", "value", "cost", "unrealized", "realized"]
+        if ticker not in self.columns:
+            return {name: np.zeros(len(dates)) for name in names}
+        rows = self._rows(dates)
+        quantity, price, value, cost, realized = (column[:, 0] for column in self._valuation(rows, [self.columns[ticker]]))
+        cost_basis = np.where(rows >= 0, self.cost_basis[rows, self.columns[ticker]], 0.0)
+        return dict(zip(names, [quantity, cost_basis, price, value, cost, value - cost, realized]))
+
+    # PositionIndex lookups, read from the cube
+    def get_all_tickers(self):
+        return list(self.tickers)
+
+    def _value(self, array, ticker, date):
+        if ticker not in self.columns:
+            return 0
+        row = self._row(date)
+        return float(array[row, self.columns[ticker]]) if row >= 0 else 0
+
+    def get_stock_quantity(self, ticker, date):
+        return self._value(self.quantity, ticker, date)
+
+    def get_cost_basis(self, ticker, date):
+        return self._value(self.cost_basis, ticker, date)
+
+    def get_realized_gain(self, ticker, date):
+        return self._value(self.realized, ticker, date)
+
+    def get_start_end_date(self, ticker):
+        if ticker not in self.columns:
+            return None, None
+        column = self.columns[ticker]
+        return self.meta["first_dates"][column], self.meta["last_dates"][column]
+
+    def get_held_days(self, tickers, date):
+        """
+        Days each ticker was held before date: the held rows before it, and every day past the cube
+        for the tickers still held on its last day. The quantity column is the holding timeline of stock_data
+        day by day, so this is the sum of the holding intervals (open to close) cut at date.
+        """
+        row = int((np.datetime64(date, "D") - self.start).astype(int))
+        held = np.count_nonzero(np.asarray(self.quantity[:min(max(row, 0), self.days)]), axis=0).astype(float)
+        if row > self.days:
+            held += (row - self.days) * (np.asarray(self.quantity[-1]) != 0)
+        return np.array([held[self.columns[ticker]] if ticker in self.columns else 0.0 for ticker in tickers])